@@ -16,10 +16,15 @@
 #
 """Bigquery implementation to read big data for manifest files."""
 import os
+import hashlib
 import logging
+from datetime import datetime, timedelta, timezone
 from src.config.settings import SETTINGS
-from google.cloud.bigquery.job import QueryJobConfig
+from google.cloud.bigquery.job import QueryJobConfig, LoadJobConfig
+from google.cloud.bigquery.schema import SchemaField
 from google.cloud.bigquery.client import Client
+from google.cloud.bigquery.table import TableReference
+from google.api_core.exceptions import NotFound
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +36,9 @@ class Bigquery():
         """Initialize big query object."""
         self.client = None
         self.job_query_obj = None
+        self.result_table = None
+        self.rows_returned = 0
+        self.bytes_returned = 0
 
         self._configure_gcp_client(query_job_config)
 
@@ -47,15 +55,167 @@ class Bigquery():
 
         self.client = Client(default_query_job_config=self.query_job_config)
 
-    def run(self, query):
-        """Run the bigquery synchronously."""
+    def run(self, query, destination=None, expiration_hours=None):
+        """Run the bigquery synchronously.
+
+        With destination set the result is written to that table, it expires after
+        expiration_hours and is labelled with hash of the query for read_table() to check.
+        """
         if self.client and query:
-            self.job_query_obj = self.client.query(query, job_config=self.query_job_config)
+            job_config = self.query_job_config
+            if destination:
+                job_config = QueryJobConfig(use_legacy_sql=False,
+                                            destination=self._get_table_ref(destination),
+                                            write_disposition='WRITE_TRUNCATE')
+            self.result_table = None
+            self.job_query_obj = self.client.query(query, job_config=job_config)
+            if destination:
+                self.job_query_obj.result()
+                self._set_table_expiration(destination, query, expiration_hours)
             return self.job_query_obj.job_id
         else:
             raise Exception('Client or query missing')
 
-    def get_result(self):
-        """Get the result of the job."""
+    def _get_table_ref(self, table_id):
+        """Get reference of table given as '[project.]dataset.table' string."""
+        return TableReference.from_string(table_id, default_project=self.client.project)
+
+    @staticmethod
+    def _get_query_hash(query):
+        return hashlib.sha1(query.encode('utf-8')).hexdigest()
+
+    def _set_table_expiration(self, table_id, query, expiration_hours):
+        """Set expiry and query hash label of materialized result table."""
+        table = self.client.get_table(self._get_table_ref(table_id))
+        table.expires = datetime.now(timezone.utc) + timedelta(hours=expiration_hours)
+        table.labels = {'query_hash': self._get_query_hash(query)}
+        self.client.update_table(table, ['expires', 'labels'])
+        logger.info('Materialized query result into %s until %s', table_id, table.expires)
+
+    def read_table(self, table_id, query=None):
+        """Read result materialized by an earlier run, False when table is missing or stale.
+
+        With query given the table is used only when it holds the result of that query.
+        """
+        if not self.client or not table_id:
+            raise Exception('Client or table missing')
+
+        try:
+            table = self.client.get_table(self._get_table_ref(table_id))
+        except NotFound:
+            return False
+
+        if table.expires and table.expires <= datetime.now(timezone.utc):
+            return False
+        if query and (table.labels or {}).get('query_hash') != self._get_query_hash(query):
+            logger.info('Table %s holds result of another query', table_id)
+            return False
+
+        self.job_query_obj = None
+        self.result_table = table
+        return True
+
+    def _get_destination(self):
+        """Get table holding the result, waits for the query job to finish."""
+        assert self.job_query_obj is not None or self.result_table is not None, \
+            'Job is not initialized'
+        if self.result_table is not None:
+            return self.result_table
+        self.job_query_obj.result()
+        return self.job_query_obj.destination
+
+    def resume(self, job_id):
+        """Attach to query job started earlier, its result can be read again while it lasts."""
+        if not self.client or not job_id:
+            raise Exception('Client or job id missing')
+
+        self.result_table = None
+        self.job_query_obj = self.client.get_job(job_id)
+        return self.job_query_obj.job_id
+
+    def dry_run(self, query):
+        """Validate the query without running it, get estimated bytes it would process."""
+        if not self.client or not query:
+            raise Exception('Client or query missing')
+
+        job_config = QueryJobConfig(use_legacy_sql=False, use_query_cache=False, dry_run=True)
+        dry_run_job = self.client.query(query, job_config=job_config)
+        return dry_run_job.total_bytes_processed
+
+    def get_job_stats(self):
+        """Get cost and volume statistics of the last query job."""
+        if self.job_query_obj is None and self.result_table is not None:
+            # Materialized result is read without running a query
+            return {
+                'job_id': None,
+                'total_bytes_processed': 0,
+                'total_bytes_billed': 0,
+                'slot_millis': 0,
+                'cache_hit': True,
+                'rows_returned': self.rows_returned,
+                'bytes_returned': self.bytes_returned,
+            }
+
         assert self.job_query_obj is not None, 'Job is not initialized'
-        yield from self.job_query_obj.result()
+        return {
+            'job_id': self.job_query_obj.job_id,
+            'total_bytes_processed': self.job_query_obj.total_bytes_processed,
+            'total_bytes_billed': self.job_query_obj.total_bytes_billed,
+            'slot_millis': self.job_query_obj.slot_millis,
+            'cache_hit': self.job_query_obj.cache_hit,
+            'rows_returned': self.rows_returned,
+            'bytes_returned': self.bytes_returned,
+        }
+
+    def load_ids(self, table_id, ids_file):
+        """Replace content of given table with the gzipped csv file of blob ids."""
+        if not self.client:
+            raise Exception('Client missing')
+
+        job_config = LoadJobConfig()
+        job_config.schema = [SchemaField('id', 'STRING', mode='REQUIRED')]
+        job_config.source_format = 'CSV'
+        job_config.write_disposition = 'WRITE_TRUNCATE'
+        load_job = self.client.load_table_from_file(ids_file, self._get_table_ref(table_id),
+                                                    job_config=job_config)
+        load_job.result()
+        logger.info('Loaded %s rows into %s', load_job.output_rows, table_id)
+        return load_job.job_id
+
+    def get_result(self, start_index=0, max_results=None, fields=None):
+        """Get the result of the job.
+
+        Rows are read from the destination table when only a range of rows or some of the
+        fields are asked for, row order is the same in both cases.
+        """
+        if start_index or max_results is not None or fields or self.result_table is not None:
+            table = self.client.get_table(self._get_destination())
+            selected_fields = [f for f in table.schema if f.name in fields] if fields else None
+            rows = self.client.list_rows(table, selected_fields=selected_fields,
+                                         start_index=start_index, max_results=max_results)
+        else:
+            assert self.job_query_obj is not None, 'Job is not initialized'
+            rows = self.job_query_obj.result()
+
+        for row in rows:
+            self.rows_returned += 1
+            # Length of text columns, close enough to bytes for the mostly ascii manifests
+            self.bytes_returned += sum(len(value) for value in row.values()
+                                       if isinstance(value, (str, bytes)))
+            yield row
+
+    def get_shard_range(self, shard_index, shard_count):
+        """Get first row and row count of one of shard_count equal slices of the result.
+
+        Slices are row ranges of the destination table, read with get_result(start_index,
+        max_results) by separate workers. Row order of a table is stable, so slices are
+        disjoint as long as all workers read the same materialized table.
+        """
+        if not 0 <= shard_index < shard_count:
+            raise Exception('Shard index {} out of range of {} shards'.format(
+                shard_index, shard_count))
+
+        num_rows = self.client.get_table(self._get_destination()).num_rows
+        start_index = num_rows * shard_index // shard_count
+        end_index = num_rows * (shard_index + 1) // shard_count
+        return start_index, end_index - start_index
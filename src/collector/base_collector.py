@@ -15,23 +15,244 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Base collector class to parse and extract dependencies from manifests."""
-from collections import Counter
+import json
+import heapq
+import hashlib
+import logging
+import tempfile
+from array import array
+from itertools import groupby
+from operator import itemgetter
+from collections import Counter, OrderedDict
+from src.config.settings import SETTINGS
+from src.collector.heavy_hitters import SpaceSaving
+from src.collector.snapshot import dump_snapshot, load_snapshot, PACKAGE_SEPARATOR
+
+# Package ids of a dependency set are packed into a bytes key of unsigned ints
+KEY_TYPECODE = 'I'
+# Rough size of a counts entry besides its key: dict slot, bytes and int objects
+ENTRY_OVERHEAD = 120
+# Heavy hitters counted per top entry kept, bounds count error by total / (K * factor)
+HEAVY_HITTER_CAPACITY_FACTOR = 10
+# Summary entry holding the heavy hitter count errors of a collector
+ERRORS_SUFFIX = '.errors'
+
+logger = logging.getLogger(__name__)
 
 
 class BaseCollector:
     """Base class to handle manifests and extract dependencies."""
 
+    # Bump in the ecosystem's collector whenever its parser extracts different packages,
+    # dependencies cached by older versions are not used anymore.
+    parser_version = 1
+
     def __init__(self, name):
         """Collector init."""
         self.name = name
-        self.counter = Counter()
+        # Package names are stored once, dependency sets are counted by their packed ids
+        self.package_ids = {}
+        self.package_names = []
+        self.counts = Counter()
+        # Counts spilled to disk once their estimated size is over the memory budget
+        self.memory_budget = SETTINGS.collector_memory_budget
+        self.counts_size = 0
+        self.segments = []
+        # Only approximate counts of the top K dependency sets are kept when K is set, they
+        # are keyed by text so sets that drop out leave no interned package names behind
+        self.top_k = SETTINGS.collector_top_k
+        self.heavy_hitters = None
+        if self.top_k:
+            self.heavy_hitters = SpaceSaving(self.top_k * HEAVY_HITTER_CAPACITY_FACTOR)
+        # Counts collected since the last pop_delta(), kept only once start_delta() is called
+        self.delta = None
+        self.cache = OrderedDict()
+        self.cache_size = SETTINGS.parse_cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _get_package_id(self, package):
+        """Get id of package name, names seen first get the next id."""
+        package_id = self.package_ids.get(package)
+        if package_id is None:
+            package_id = self.package_ids[package] = len(self.package_names)
+            self.package_names.append(package)
+        return package_id
+
+    def get_summary(self):
+        """Get counts of the collector keyed by its name, for merge_summary() of another one.
+
+        In top K mode these are all heavy hitter counts with their errors under the name
+        with ERRORS_SUFFIX, not just the top K, so sets ranked below K in every part of the
+        data are still counted once the parts are merged.
+        """
+        if self.heavy_hitters:
+            return {self.name: self.heavy_hitters.counts,
+                    self.name + ERRORS_SUFFIX: self.heavy_hitters.errors}
+        return {self.name: self.counter}
+
+    def merge_summary(self, summary):
+        """Add counts of this collector's ecosystem in a summary of get_summary()."""
+        counts = summary.get(self.name, {})
+        if self.heavy_hitters:
+            self.heavy_hitters.merge(counts, summary.get(self.name + ERRORS_SUFFIX, {}))
+        else:
+            self.add_counts(counts)
+
+    def snapshot(self):
+        """Get binary snapshot of the summary, see src.collector.snapshot."""
+        return dump_snapshot(self.get_summary())
+
+    def merge_snapshot(self, data):
+        """Add counts of this collector's ecosystem in a snapshot to collection."""
+        self.merge_summary(load_snapshot(data))
+
+    def _get_key(self, packages):
+        """Get compact key of dependency set, package order of the manifest is kept."""
+        return array(KEY_TYPECODE, map(self._get_package_id, packages)).tobytes()
+
+    def get_text(self, key):
+        """Get text form of dependency set key, as stored in the collated file."""
+        return PACKAGE_SEPARATOR.join(self.package_names[i]
+                                      for i in array(KEY_TYPECODE, key))
+
+    def _add_count(self, key, count):
+        """Add count of dependency set key, spill counts to disk when over memory budget."""
+        if key not in self.counts:
+            self.counts_size += ENTRY_OVERHEAD + len(key)
+        self.counts[key] += count
+        if self.memory_budget and self.counts_size > self.memory_budget:
+            self._spill()
 
     def _update_counter(self, packages):
         """Add packages to a collection."""
-        if packages:
-            pkg_string = ', '.join(packages)
-            self.counter.update([pkg_string])
+        if packages and self.delta is not None:
+            self.delta[PACKAGE_SEPARATOR.join(packages)] += 1
+        if packages and self.heavy_hitters:
+            self.heavy_hitters.add(PACKAGE_SEPARATOR.join(packages))
+        elif packages:
+            self._add_count(self._get_key(packages), 1)
+
+    def _get_entries(self):
+        """Get in memory counts as (text, count) entries sorted by text."""
+        return sorted((self.get_text(key), count) for key, count in self.counts.items())
+
+    def _spill(self):
+        """Write in memory counts to a sorted segment file and start over with empty counts."""
+        segment = tempfile.TemporaryFile('w+', encoding='utf-8',
+                                         dir=SETTINGS.collector_spill_directory or None)
+        for entry in self._get_entries():
+            segment.write(json.dumps(entry) + '\n')
+
+        logger.info('[%s] Spilled %d dependency sets to segment %d', self.name,
+                    len(self.counts), len(self.segments) + 1)
+        self.segments.append(segment)
+        self.counts = Counter()
+        self.counts_size = 0
+
+    def iter_sorted(self):
+        """Get (text, count) of every dependency set in text order.
+
+        Spilled segments and in memory counts are merged k-way, only one entry per
+        segment is held in memory at a time. In top K mode only the K highest approximate
+        counts are there.
+        """
+        if self.heavy_hitters:
+            yield from sorted(self.heavy_hitters.most_common(self.top_k))
+            return
 
-    def parse_and_collect(self, _content, _validate):
+        streams = [_read_segment(segment) for segment in self.segments]
+        merged = heapq.merge(self._get_entries(), *streams)
+        for text, entries in groupby(merged, key=itemgetter(0)):
+            yield text, sum(count for _, count in entries)
+
+    @property
+    def counter(self):
+        """Get counts keyed by text form of dependency sets.
+
+        It is a new Counter built on every access, use add_counts() to change counts. Sets
+        are in order they were first seen, or in text order once counts were spilled. In
+        top K mode it holds the K highest approximate counts, highest first.
+        """
+        counter = Counter()
+        if self.heavy_hitters:
+            counter.update(dict(self.heavy_hitters.most_common(self.top_k)))
+            return counter
+
+        if self.segments:
+            for text, count in self.iter_sorted():
+                counter[text] = count
+            return counter
+
+        for key, count in self.counts.items():
+            counter[self.get_text(key)] += count
+        return counter
+
+    def start_delta(self):
+        """Start keeping counts of collected manifests apart, for saving progress in steps."""
+        self.delta = Counter()
+
+    def pop_delta(self):
+        """Get counts collected since the previous call and start over.
+
+        Counts added with add_counts() are not part of any delta.
+        """
+        delta, self.delta = self.delta, Counter()
+        return delta
+
+    def add_counts(self, counter):
+        """Add counts keyed by text form of dependency sets, such as the counter property."""
+        for text, count in counter.items():
+            if self.heavy_hitters:
+                self.heavy_hitters.add(text, count)
+                continue
+            self._add_count(self._get_key(text.split(PACKAGE_SEPARATOR)), count)
+
+    def collect(self, packages):
+        """Add packages extracted earlier from a manifest to collection."""
+        self._update_counter(packages)
+
+    def _get_cache_key(self, content, validate):
+        """Get digest of manifest content, None when content can not be cached."""
+        if not content or self.cache_size <= 0:
+            return None
+
+        if isinstance(content, str):
+            content = content.encode('utf-8', 'surrogatepass')
+        return bool(validate), hashlib.blake2b(content, digest_size=16).digest()
+
+    def parse_and_collect(self, content, validate):
+        """Parse dependencies and add it to collection, reuse result of identical manifests."""
+        key = self._get_cache_key(content, validate)
+        packages = self.cache.get(key) if key else None
+        if packages is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+        else:
+            self.cache_misses += 1
+            packages = tuple(self.get_packages(content, validate) or ())
+            if key:
+                self.cache[key] = packages
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        self._update_counter(packages)
+        return packages
+
+    def get_cache_stats(self):
+        """Get hit and miss count of the parse cache."""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses
+        }
+
+    def get_packages(self, _content, _validate):
         """To be implemented by all its child ecosystem."""
-        raise Exception("Missing parse_and_collect() method implementation!!")
+        raise Exception("Missing get_packages() method implementation!!")
+
+
+def _read_segment(segment):
+    """Read entries of a spilled segment from its start."""
+    segment.seek(0)
+    for line in segment:
+        yield tuple(json.loads(line))
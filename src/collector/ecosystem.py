@@ -0,0 +1,39 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Ecosystems the job collects manifests of, with their manifest file names."""
+from src.collector.base_collector import BaseCollector
+from src.collector.maven_collector import MavenCollector
+from src.collector.npm_collector import NpmCollector
+from src.collector.pypi_collector import PypiCollector
+
+ECOSYSTEM_MANIFEST_MAP = {
+    'maven': 'pom.xml',
+    'npm': 'package.json',
+    'pypi': 'requirements.txt',
+}
+
+
+def get_collector(ecosystem) -> BaseCollector:
+    """Get new collector of the ecosystem."""
+    if ecosystem == 'maven':
+        return MavenCollector()
+
+    if ecosystem == 'npm':
+        return NpmCollector()
+
+    if ecosystem == 'pypi':
+        return PypiCollector()
@@ -0,0 +1,109 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Approximate counting of the most frequent dependency sets in fixed memory."""
+import heapq
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitter counts of at most capacity items.
+
+    An item not counted yet takes the place of the item with the lowest count, starting
+    from that count. With N being the total of all counts added:
+
+    * counts are never lower than the true count, and at most N / capacity higher,
+    * every item whose true count is over N / capacity is among the counted items.
+
+    get_error() tells by how much the count of an item can be over its true count.
+    """
+
+    def __init__(self, capacity):
+        """Initialize empty counts."""
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # Min-heap of (count, item), entries whose count has changed since are skipped
+        self.heap = []
+
+    def add(self, item, count=1):
+        """Add count of item."""
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            min_count, evicted = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count
+
+        heapq.heappush(self.heap, (self.counts[item], item))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_min(self):
+        """Remove and get the lowest (count, item) that is still up to date."""
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def _get_min_count(self):
+        """Get count an item not counted may have had, zero until capacity is reached."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, counts, errors):
+        """Add counts and errors of another Space-Saving summary of the same capacity.
+
+        Either summary may have dropped an item with up to its lowest count, so that count
+        is added to both count and error of the items it does not hold. The capacity highest
+        merged counts are kept, their errors are within the bound of the combined total.
+        """
+        own_min = self._get_min_count()
+        other_min = min(counts.values()) if len(counts) >= self.capacity else 0
+        merged = []
+        for item in set(self.counts) | set(counts):
+            count = self.counts.get(item, own_min)
+            error = self.errors.get(item, own_min)
+            if item in counts:
+                count += counts[item]
+                error += errors.get(item, 0)
+            else:
+                count += other_min
+                error += other_min
+            merged.append((count, item, error))
+
+        merged = heapq.nlargest(self.capacity, merged)
+        self.counts = {item: count for count, item, _ in merged}
+        self.errors = {item: error for _, item, error in merged}
+        self.total += sum(counts.values())
+        self.heap = [(count, item) for count, item, _ in merged]
+        heapq.heapify(self.heap)
+
+    def get_error(self, item):
+        """Get maximum overestimation of the count of item."""
+        return self.errors.get(item, 0)
+
+    def most_common(self, n):
+        """Get n items with the highest counts, as (item, count) pairs."""
+        return heapq.nlargest(n, self.counts.items(), key=lambda entry: entry[1])
@@ -25,12 +25,14 @@ logger = logging.getLogger(__name__)
 class MavenCollector(BaseCollector):
     """Handle maven manifests and extract dependencies."""
 
+    parser_version = 1
+
     def __init__(self):
         """Maven collectors init."""
         super().__init__('maven')
 
-    def parse_and_collect(self, content, _):
-        """Parse dependencies and add it to collection."""
+    def get_packages(self, content, _):
+        """Parse dependencies from manifest content."""
         result = list()
         allowed_scopes = ['compile', 'run', 'provided']
 
@@ -46,4 +48,4 @@ class MavenCollector(BaseCollector):
         except Exception as e:
             logger.warning('Error in content, it raises %s', e)
 
-        self._update_counter(result)
+        return result
@@ -16,6 +16,7 @@
 #
 """Handle NPM manifests and extract dependencies."""
 import re
+import json
 import demjson
 import logging
 from src.collector.base_collector import BaseCollector
@@ -26,12 +27,14 @@ logger = logging.getLogger(__name__)
 class NpmCollector(BaseCollector):
     """Handle NPM manifests and extract dependencies."""
 
+    parser_version = 1
+
     def __init__(self):
         """Npm collector init."""
         super().__init__('npm')
 
-    def parse_and_collect(self, content, _):
-        """Parse dependencies and add it to collection."""
+    def get_packages(self, content, _):
+        """Parse dependencies from manifest content."""
         content = content.decode() if not isinstance(content, str) else content
         dependencies = {}
         try:
@@ -42,7 +45,18 @@ class NpmCollector(BaseCollector):
         if decoded_json and isinstance(decoded_json, dict):
             dependencies = decoded_json.get('dependencies', {})
 
-        self._update_counter(list(dependencies.keys() if isinstance(dependencies, dict) else []))
+        return list(dependencies.keys() if isinstance(dependencies, dict) else [])
+
+    def collect_extracted(self, dependencies):
+        """Add dependencies object extracted from a valid manifest by BigQuery to collection."""
+        packages = []
+        if dependencies:
+            decoded_json = json.loads(dependencies)
+            if isinstance(decoded_json, dict):
+                packages = list(decoded_json.keys())
+
+        self._update_counter(packages)
+        return tuple(packages)
 
     def _handle_corrupt_packagejson(self, content):
         """Find dependencies from corrupted/invalid package.json."""
@@ -26,13 +26,15 @@ logger = logging.getLogger(__name__)
 class PypiCollector(BaseCollector):
     """Handle Pypi manifests and extract dependencies."""
 
+    parser_version = 1
+
     def __init__(self):
         """Initialize BG validation."""
         super().__init__('pypi')
         self.bq_validation = BQValidation()
 
-    def parse_and_collect(self, content, validate):
-        """Parse dependencies and add it to collection."""
+    def get_packages(self, content, validate):
+        """Parse dependencies from manifest content."""
         packages = None
         try:
             packages = sorted({p for p in pip_req.parse_requirements(content)})
@@ -41,4 +43,4 @@ class PypiCollector(BaseCollector):
         except Exception as e:
             logger.warning('Error in content, it raises %s', e)
 
-        self._update_counter(packages)
+        return packages
@@ -0,0 +1,108 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Compact binary snapshot of collector counts, for merging partial results."""
+import zlib
+import struct
+from collections import Counter
+
+SNAPSHOT_MAGIC = b'BQCS'
+SNAPSHOT_VERSION = 1
+PACKAGE_SEPARATOR = ', '
+
+_HEADER = struct.Struct('>4sH')
+_COUNT = struct.Struct('>I')
+_ENTRY = struct.Struct('>QI')
+
+
+def dump_snapshot(counters):
+    """Serialize counters of dependency set text, keyed by collector name, into bytes.
+
+    Package names are stored once and dependency sets as lists of their ids. Collectors and
+    their entries are written in sorted order, so equal counts give equal bytes.
+    """
+    package_ids = {}
+    entries = bytearray(_COUNT.pack(len(counters)))
+    for name in sorted(counters):
+        items = sorted((text, count) for text, count in counters[name].items() if count > 0)
+        entries += _pack_text(name) + _COUNT.pack(len(items))
+        for text, count in items:
+            packages = text.split(PACKAGE_SEPARATOR)
+            ids = [package_ids.setdefault(package, len(package_ids)) for package in packages]
+            entries += _ENTRY.pack(count, len(ids)) + struct.pack('>{}I'.format(len(ids)), *ids)
+
+    payload = bytearray(_COUNT.pack(len(package_ids)))
+    for package in package_ids:
+        payload += _pack_text(package)
+    payload += entries
+    return _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION) + zlib.compress(bytes(payload))
+
+
+def load_snapshot(data):
+    """Deserialize bytes of dump_snapshot() into counters keyed by collector name."""
+    magic, version = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise Exception('Not a collector snapshot')
+    if version != SNAPSHOT_VERSION:
+        raise Exception('Unsupported collector snapshot version {}'.format(version))
+
+    payload = zlib.decompress(data[_HEADER.size:])
+    package_count, offset = _unpack_count(payload, 0)
+    packages = []
+    for _ in range(package_count):
+        package, offset = _unpack_text(payload, offset)
+        packages.append(package)
+
+    counters = {}
+    collector_count, offset = _unpack_count(payload, offset)
+    for _ in range(collector_count):
+        name, offset = _unpack_text(payload, offset)
+        entry_count, offset = _unpack_count(payload, offset)
+        counter = counters[name] = Counter()
+        for _ in range(entry_count):
+            count, length = _ENTRY.unpack_from(payload, offset)
+            offset += _ENTRY.size
+            ids = struct.unpack_from('>{}I'.format(length), payload, offset)
+            offset += 4 * length
+            counter[PACKAGE_SEPARATOR.join(packages[i] for i in ids)] += count
+    return counters
+
+
+def merge_snapshots(*snapshots):
+    """Merge snapshots into one holding the sum of their counts.
+
+    Merging is associative and commutative, the result does not depend on order or
+    grouping of the snapshots.
+    """
+    counters = {}
+    for data in snapshots:
+        for name, counter in load_snapshot(data).items():
+            counters.setdefault(name, Counter()).update(counter)
+    return dump_snapshot(counters)
+
+
+def _pack_text(text):
+    data = text.encode('utf-8', 'surrogatepass')
+    return _COUNT.pack(len(data)) + data
+
+
+def _unpack_count(payload, offset):
+    return _COUNT.unpack_from(payload, offset)[0], offset + _COUNT.size
+
+
+def _unpack_text(payload, offset):
+    length, offset = _unpack_count(payload, offset)
+    return payload[offset:offset + length].decode('utf-8', 'surrogatepass'), offset + length
@@ -27,6 +27,29 @@ class Settings(BaseSettings):
     logging_level = Field(env="JOB_LOGGING_LEVEL", default=logging.getLevelName(logging.INFO))
     bigquery_credentials_filepath = Field(env="BIGQUERY_CREDENTIALS_FILEPATH", default="")
     local_working_directory = Field(env="LOCAL_WORKING_DIRECTORY", default="/dev/shm")
+    parse_workers = Field(env="PARSE_WORKERS", default=1)
+    parse_cache_size = Field(env="PARSE_CACHE_SIZE", default=100000)
+    blob_cache_enabled = Field(env="BLOB_CACHE_ENABLED", default=False)
+    blob_cache_max_shards = Field(env="BLOB_CACHE_MAX_SHARDS", default=16)
+    incremental_extraction = Field(env="INCREMENTAL_EXTRACTION", default=False)
+    bigquery_dataset = Field(env="BIGQUERY_DATASET", default="")
+    staging_format = Field(env="STAGING_FORMAT", default="zip")
+    staging_stream_upload = Field(env="STAGING_STREAM_UPLOAD", default=False)
+    staging_stream_read = Field(env="STAGING_STREAM_READ", default=False)
+    max_inflight_batches = Field(env="MAX_INFLIGHT_BATCHES", default=0)
+    parse_prefetch_depth = Field(env="PARSE_PREFETCH_DEPTH", default=0)
+    bigquery_concurrent_ecosystems = Field(env="BIGQUERY_CONCURRENT_ECOSYSTEMS", default=False)
+    npm_sql_extraction = Field(env="NPM_SQL_EXTRACTION", default=False)
+    checkpoint_enabled = Field(env="CHECKPOINT_ENABLED", default=False)
+    bigquery_result_table = Field(env="BIGQUERY_RESULT_TABLE", default="")
+    bigquery_result_ttl_hours = Field(env="BIGQUERY_RESULT_TTL_HOURS", default=72)
+    # Indexed Jobs set JOB_COMPLETION_INDEX of every pod, it is the shard the pod reads
+    shard_index = Field(env=["SHARD_INDEX", "JOB_COMPLETION_INDEX"], default=0)
+    shard_count = Field(env="SHARD_COUNT", default=1)
+    collector_memory_budget = Field(env="COLLECTOR_MEMORY_BUDGET", default=0)
+    collector_spill_directory = Field(env="COLLECTOR_SPILL_DIRECTORY", default="")
+    collector_top_k = Field(env="COLLECTOR_TOP_K", default=0)
+    collated_merge_buffer = Field(env="COLLATED_MERGE_BUFFER", default=1000000)
 
 
 class AWSSettings(BaseSettings):
@@ -36,7 +59,13 @@ class AWSSettings(BaseSettings):
     s3_access_key_id = Field(env="AWS_S3_ACCESS_KEY_ID", default="")
     s3_secret_access_key = Field(env="AWS_S3_SECRET_ACCESS_KEY", default="")
     s3_bucket_name = Field(env="AWS_S3_BUCKET_NAME", default="developer-analytics-audit-report")
+    # Empty for AWS S3, set to the S3 compatible service of local runs
+    s3_endpoint_url = Field(env="AWS_S3_ENDPOINT_URL", default="")
     s3_collated_filename = Field(env="AWS_S3_COLLATED_FILENAME", default="collated.json")
+    s3_multipart_part_size = Field(env="AWS_S3_MULTIPART_PART_SIZE", default=8 * 1024 * 1024)
+    s3_read_buffer_size = Field(env="AWS_S3_READ_BUFFER_SIZE", default=8 * 1024 * 1024)
+    s3_transfer_concurrency = Field(env="AWS_S3_TRANSFER_CONCURRENCY", default=10)
+    s3_max_pool_connections = Field(env="AWS_S3_MAX_POOL_CONNECTIONS", default=20)
 
 
 SETTINGS = Settings()
@@ -0,0 +1,160 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Checkpoint of a staged run, lets an interrupted job continue where it stopped."""
+import gzip
+import json
+import logging
+from threading import Lock
+from src.collector.snapshot import dump_snapshot, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+S3_CHECKPOINT_FILENAME = 'big-query-data/checkpoint/job_checkpoint.json.gz'
+S3_DELTA_FILENAME = 'big-query-data/checkpoint/deltas/{}.snapshot'
+
+
+class JobCheckpoint:
+    """Progress of the current run, stored in the persistence store.
+
+    Holds the query jobs the run reads from, per ecosystem the next batch index, the last
+    result row whose manifest is already in an uploaded batch and the content data, and
+    staged batches that are parsed and merged. Counts added by every uploaded or merged
+    batch are written as a delta snapshot of their own, the checkpoint only lists them, so
+    each step writes what it changed and not the whole counters. Once the counts are merged
+    into the collated file the run is marked collated, a restart only finishes the cleanup
+    then. Checkpoint and deltas are removed once the run is finished.
+    """
+
+    def __init__(self, data_store, filename=S3_CHECKPOINT_FILENAME):
+        """Initialize the checkpoint object."""
+        self.data_store = data_store
+        self.filename = filename
+        # Batches are uploaded from background and query worker threads
+        self.lock = Lock()
+        self.state = self._get_new_state()
+
+    @staticmethod
+    def _get_new_state():
+        return {
+            'queries': {},
+            'incremental': False,
+            'ecosystems': {},
+            'download_complete': False,
+            'parsed': [],
+            'deltas': [],
+            'collated': False,
+        }
+
+    def load(self):
+        """Load checkpoint of an interrupted run, False when there is none."""
+        data = self.data_store.read_object(self.filename)
+        if not data:
+            return False
+
+        self.state = json.loads(gzip.decompress(data).decode('utf-8'))
+        logger.info('Loaded checkpoint, queries: %s, download complete: %s, parsed batches: %d',
+                    self.state['queries'], self.state['download_complete'],
+                    len(self.state['parsed']))
+        return True
+
+    def _save(self):
+        """Write current state to the persistence store, caller holds the lock.
+
+        Writes done under the lock land in the same order as the changes they save.
+        """
+        data = gzip.compress(json.dumps(self.state).encode('utf-8'))
+        self.data_store.write_object(self.filename, data)
+
+    def _add_delta(self, ecosystem, delta):
+        """Write counts added by one step as a snapshot and list it, caller holds the lock."""
+        if not delta:
+            return
+
+        # Written before the checkpoint lists it, an unlisted one is overwritten later
+        filename = S3_DELTA_FILENAME.format(len(self.state['deltas']) + 1)
+        self.data_store.write_object(filename, dump_snapshot({ecosystem: delta}))
+        self.state['deltas'].append(filename)
+
+    def iter_deltas(self):
+        """Get counters keyed by ecosystem of every saved delta, in order they were saved."""
+        for filename in self.state['deltas']:
+            data = self.data_store.read_object(filename)
+            if not data:
+                raise Exception('Missing checkpoint delta {}'.format(filename))
+            yield load_snapshot(data)
+
+    def clear(self):
+        """Remove the checkpoint and its deltas, next run starts from scratch."""
+        with self.lock:
+            filenames = self.state['deltas']
+            self.state = self._get_new_state()
+            self.data_store.delete_object(self.filename)
+            for filename in filenames:
+                self.data_store.delete_object(filename)
+        logger.info('Removed checkpoint %s and %d deltas', self.filename, len(filenames))
+
+    def get_query(self, name):
+        """Get id of the query job started by an earlier attempt of this run."""
+        return self.state['queries'].get(name)
+
+    def set_query(self, name, job_id, incremental=False):
+        """Remember query job, its result is read again after a restart."""
+        with self.lock:
+            self.state['queries'][name] = job_id
+            self.state['incremental'] = incremental
+            self._save()
+
+    def get_ecosystem(self, ecosystem):
+        """Get saved progress of the ecosystem, None when nothing was saved for it."""
+        return self.state['ecosystems'].get(ecosystem)
+
+    def set_ecosystem(self, ecosystem, batch_index, rows_done, content_data, delta):
+        """Remember progress of the ecosystem after one of its batches got uploaded.
+
+        delta holds the counts added since the previous step of the ecosystem.
+        """
+        with self.lock:
+            self._add_delta(ecosystem, delta)
+            self.state['ecosystems'][ecosystem] = {
+                'batch_index': batch_index,
+                'rows_done': rows_done,
+                'content_data': content_data,
+            }
+            self._save()
+
+    def set_download_complete(self):
+        """Mark all query results as staged."""
+        with self.lock:
+            self.state['download_complete'] = True
+            self._save()
+
+    def is_parsed(self, object_key):
+        """Check if staged batch is merged already."""
+        return object_key in self.state['parsed']
+
+    def set_parsed(self, object_key, ecosystem, delta):
+        """Remember merged batch along with the counts it added to the ecosystem."""
+        with self.lock:
+            self._add_delta(ecosystem, delta)
+            self.state['parsed'].append(object_key)
+            self._save()
+
+    def set_collated(self):
+        """Mark counts of the run as merged into the collated file."""
+        with self.lock:
+            self.state['collated'] = True
+            self._save()
@@ -0,0 +1,189 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Streaming read, sort, merge and write of the collated dependency counts file.
+
+The file is a JSON object of ecosystems, each an object of dependency set text and count.
+Counts of an ecosystem are written sorted by text, so no step holds a whole file in memory.
+"""
+import json
+import heapq
+import codecs
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+READ_CHUNK_SIZE = 1024 * 1024
+WRITE_CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class _JsonReader:
+    """Pull reader of JSON tokens from a binary file object, read in chunks."""
+
+    def __init__(self, fp, chunk_size):
+        """Start reading at beginning of the file."""
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read next chunk into the buffer, False at end of file."""
+        if self.eof:
+            return False
+
+        chunk = self.fp.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(chunk, final=self.eof)
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Get next non whitespace character without consuming it, '' at end of file."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        """Consume next character, it has to be one of the given ones."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of {!r} at {!r}'.format(characters, character))
+        self.position += 1
+        return character
+
+    def value(self):
+        """Consume next string or number value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # A number at end of the buffer may go on in the next chunk
+            if end < len(self.buffer) or not self._fill():
+                self.position = end
+                return value
+
+
+def _iter_object(reader):
+    """Get (key, value) pairs of the object whose opening brace is consumed."""
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        yield key, reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+def iter_collated(fp, chunk_size=READ_CHUNK_SIZE):
+    """Get (ecosystem, counts) of a collated file, counts is a (text, count) iterator.
+
+    Counts of an ecosystem have to be consumed before asking for the next ecosystem, what
+    is left of them is skipped. Invalid content raises ValueError.
+    """
+    reader = _JsonReader(fp, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        ecosystem = reader.value()
+        reader.expect(':')
+        reader.expect('{')
+        counts = _iter_object(reader)
+        yield ecosystem, counts
+        for _ in counts:
+            pass
+        if reader.expect(',}') == '}':
+            return
+
+
+def sort_counts(counts, buffer_size, directory=None):
+    """Get (text, count) pairs sorted by text, at most buffer_size of them held in memory.
+
+    Pairs over the buffer size are written to sorted run files and merged k-way.
+    """
+    runs = []
+    buffer = []
+    for entry in counts:
+        buffer.append(entry)
+        if len(buffer) >= buffer_size:
+            runs.append(_write_run(sorted(buffer), directory))
+            buffer = []
+
+    buffer.sort()
+    return heapq.merge(buffer, *[_read_run(run) for run in runs])
+
+
+def _write_run(entries, directory):
+    run = tempfile.TemporaryFile('w+', encoding='utf-8', dir=directory)
+    for entry in entries:
+        run.write(json.dumps(entry) + '\n')
+    return run
+
+
+def _read_run(run):
+    run.seek(0)
+    for line in run:
+        yield tuple(json.loads(line))
+    run.close()
+
+
+def merge_counts(existing, new, additive):
+    """Merge two text sorted (text, count) iterators into one.
+
+    With additive set counts of the same text are summed, otherwise new count replaces the
+    existing one.
+    """
+    tagged = heapq.merge(((text, 0, count) for text, count in existing),
+                         ((text, 1, count) for text, count in new))
+    for text, entries in groupby(tagged, key=itemgetter(0)):
+        entries = list(entries)
+        if not additive and entries[-1][1] == 1:
+            entries = [entry for entry in entries if entry[1] == 1]
+        yield text, sum(entry[2] for entry in entries)
+
+
+def write_collated(fp, ecosystems):
+    """Write (ecosystem, counts) pairs as collated file to binary file object."""
+    chunks = ['{']
+    size = 0
+    for index, (ecosystem, counts) in enumerate(ecosystems):
+        chunks.append('{}{}: {{'.format(', ' if index else '', json.dumps(ecosystem)))
+        for count_index, (text, count) in enumerate(counts):
+            chunk = '{}{}: {}'.format(', ' if count_index else '', json.dumps(text), count)
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= WRITE_CHUNK_SIZE:
+                fp.write(''.join(chunks).encode('utf-8'))
+                chunks = []
+                size = 0
+        chunks.append('}')
+    chunks.append('}')
+    fp.write(''.join(chunks).encode('utf-8'))
@@ -0,0 +1,176 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Persistent cache of dependencies extracted from GitHub blobs."""
+import gzip
+import json
+import logging
+from collections import OrderedDict
+from src.datastore.watermark import BlobWatermark, read_ids, merge_ids
+
+logger = logging.getLogger(__name__)
+
+S3_PARSE_CACHE_FOLDER = 'big-query-data/parse-cache'
+S3_CACHED_IDS_FILENAME = 'cached_blob_ids.csv.gz'
+# New ids of cached blobs are merged into the stored list once there are this many
+CACHED_IDS_SAVE_COUNT = 100000
+
+
+class ParseCache:
+    """Cache of blob id to extracted dependency list, stored in the persistence store.
+
+    GitHub blob ids are content addressed, so a blob parsed in an earlier run never needs to
+    be parsed again by the same parser. Entries are kept per ecosystem and parser version in
+    256 shards picked by the first byte of the blob id, every shard is a gzipped json lines
+    file sorted by blob id. Shards are loaded on first use, at most max_shards of them are
+    held and the least recently used one is written back when another one is loaded.
+    flush() writes back and drops all of them.
+
+    Ids of the cached blobs of every ecosystem and parser version are also kept in a
+    watermark style file, so the query can leave out content of those blobs.
+    """
+
+    def __init__(self, data_store, versions, max_shards=16):
+        """Initialize the parse cache object, versions map ecosystems to parser versions."""
+        self.data_store = data_store
+        self.versions = versions
+        self.max_shards = max_shards
+        self.shards = OrderedDict()
+        self.dirty = set()
+        self.cached_ids = {}
+        for ecosystem in versions:
+            self.cached_ids[ecosystem] = BlobWatermark(
+                data_store, self._get_key(ecosystem, S3_CACHED_IDS_FILENAME))
+        self.packages = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_shard(blob_id):
+        return blob_id[:2].lower()
+
+    def _get_key(self, ecosystem, name):
+        return '{}/{}/v{}/{}'.format(S3_PARSE_CACHE_FOLDER, ecosystem, self.versions[ecosystem],
+                                     name)
+
+    def _get_shard_key(self, ecosystem, shard):
+        return self._get_key(ecosystem, '{}.jsonl.gz'.format(shard))
+
+    def get_version(self):
+        """Get tag of the parser versions of all ecosystems, such as maven_v1_npm_v2."""
+        return '_'.join('{}_v{}'.format(ecosystem, version)
+                        for ecosystem, version in sorted(self.versions.items()))
+
+    def _intern(self, packages):
+        """Share one tuple between all blobs with the same dependency list."""
+        packages = tuple(packages or ())
+        return self.packages.setdefault(packages, packages)
+
+    def _load_shard(self, ecosystem, shard):
+        entries = self.shards.get((ecosystem, shard))
+        if entries is not None:
+            self.shards.move_to_end((ecosystem, shard))
+            return entries
+
+        entries = {}
+        key = self._get_shard_key(ecosystem, shard)
+        data = self.data_store.read_object(key)
+        if data:
+            for line in gzip.decompress(data).splitlines():
+                blob_id, packages = json.loads(line)
+                entries[bytes.fromhex(blob_id)] = self._intern(packages)
+            logger.debug('Loaded %d entries from %s', len(entries), key)
+
+        self.shards[(ecosystem, shard)] = entries
+        if len(self.shards) > self.max_shards:
+            self._drop_shard(*next(iter(self.shards)))
+        return entries
+
+    def _drop_shard(self, ecosystem, shard):
+        """Write shard back when it was modified and free its entries."""
+        entries = self.shards.pop((ecosystem, shard))
+        if (ecosystem, shard) not in self.dirty:
+            return
+
+        lines = (json.dumps([blob_id.hex(), list(entries[blob_id])])
+                 for blob_id in sorted(entries))
+        data = gzip.compress('\n'.join(lines).encode('utf-8'))
+        self.data_store.write_object(self._get_shard_key(ecosystem, shard), data)
+        self.dirty.discard((ecosystem, shard))
+
+    def get(self, ecosystem, blob_id):
+        """Get the cached dependency list of a blob, None when blob was never parsed."""
+        if not blob_id:
+            return None
+
+        packages = self._load_shard(ecosystem, self._get_shard(blob_id)).get(
+            bytes.fromhex(blob_id))
+        if packages is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return packages
+
+    def put(self, ecosystem, blob_id, packages):
+        """Store dependency list extracted from a blob."""
+        if not blob_id:
+            return
+
+        shard = self._get_shard(blob_id)
+        self._load_shard(ecosystem, shard)[bytes.fromhex(blob_id)] = self._intern(packages)
+        self.dirty.add((ecosystem, shard))
+        self.cached_ids[ecosystem].add(blob_id)
+
+    def update(self, ecosystem, entries):
+        """Store dependency lists of the (blob id, packages) entries of freshly parsed blobs."""
+        for blob_id, packages in entries:
+            self.put(ecosystem, blob_id, packages)
+
+    def get_cached_ids(self):
+        """Get gzipped csv content of ids of all cached blobs, None when cache is empty.
+
+        Only blobs cached by the current parser versions are listed.
+        """
+        data, count = merge_ids(*(read_ids(cached_ids.get_seen_ids())
+                                  for _, cached_ids in sorted(self.cached_ids.items())))
+        return data if count else None
+
+    def flush(self):
+        """Write modified shards back and drop all loaded ones."""
+        count = len(self.dirty)
+        for ecosystem, shard in sorted(self.shards):
+            self._drop_shard(ecosystem, shard)
+        self.packages.clear()
+        logger.info('Saved %d parse cache shards', count)
+
+        # Ids are listed only after their entries are saved
+        for cached_ids in self.cached_ids.values():
+            if len(cached_ids.new_ids) >= CACHED_IDS_SAVE_COUNT:
+                cached_ids.save()
+
+    def save(self):
+        """Write all modified shards back and list ids of all blobs cached so far."""
+        self.flush()
+        for cached_ids in self.cached_ids.values():
+            if cached_ids.new_ids:
+                cached_ids.save()
+
+    def get_stats(self):
+        """Get hit and miss count of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -15,18 +15,155 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Implementation persistence store using S3."""
+import io
+import os
+import time
 import logging
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from rudra.data_store.aws import AmazonS3
 from src.config.settings import SETTINGS, AWS_SETTINGS
+from src.datastore.collated import iter_collated, sort_counts, merge_counts, write_collated
 
 logger = logging.getLogger(__name__)
 
 
+class S3ObjectReader(io.RawIOBase):
+    """Seekable read only file object on S3 object, every read is a ranged get request."""
+
+    def __init__(self, client, bucket_name, key):
+        """Get size of given object."""
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.position = 0
+        self.size = client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+
+    def readable(self):
+        """Object can be read."""
+        return True
+
+    def seekable(self):
+        """Object can be read from any position."""
+        return True
+
+    def tell(self):
+        """Get current position."""
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move current position."""
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        """Read object content from current position into buffer."""
+        if self.position >= self.size or not len(buffer):
+            return 0
+
+        end = min(self.position + len(buffer), self.size) - 1
+        data = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                      Range='bytes={}-{}'.format(self.position, end))['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class S3MultipartWriter:
+    """Write only file object that streams its content to S3 as multipart upload parts.
+
+    At most one part is held in memory, the part is uploaded as soon as it is full.
+    """
+
+    def __init__(self, client, bucket_name, key, part_size):
+        """Start multipart upload of given object."""
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.size = 0
+        self.upload_id = client.create_multipart_upload(Bucket=bucket_name,
+                                                        Key=key)['UploadId']
+
+    def _upload_part(self, data):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket_name, Key=self.key,
+                                           PartNumber=part_number, UploadId=self.upload_id,
+                                           Body=bytes(data))
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def write(self, data):
+        """Buffer data and upload every full part, the upload is aborted when a part fails."""
+        self.buffer.extend(data)
+        self.size += len(data)
+        try:
+            while len(self.buffer) >= self.part_size:
+                self._upload_part(self.buffer[:self.part_size])
+                del self.buffer[:self.part_size]
+        except Exception:
+            self.abort()
+            raise
+        return len(data)
+
+    def flush(self):
+        """Parts are uploaded only when full, nothing to flush."""
+        pass
+
+    def close(self):
+        """Upload the last part and complete the upload."""
+        if self.upload_id is None:
+            return
+
+        try:
+            if self.buffer or not self.parts:
+                self._upload_part(self.buffer)
+                self.buffer = bytearray()
+            self.client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                                  UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+            logger.debug('Uploaded %d bytes in %d parts to %s',
+                         self.size, len(self.parts), self.key)
+        except Exception:
+            self.abort()
+            raise
+        self.upload_id = None
+
+    def abort(self):
+        """Abort the upload and drop parts uploaded so far."""
+        if self.upload_id is None:
+            return
+
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                               UploadId=self.upload_id)
+        except Exception as exc:
+            logger.error('An Exception occurred while aborting upload of {}\n'
+                         '{}'.format(self.key, str(exc)))
+        self.upload_id = None
+
+
 class PersistenceStore:
     """Persistence store to save Bigquery Data, it uses AWS S3 as of now as data store."""
 
-    def __init__(self, s3_client=None):
-        """Initialize DataProcessing object."""
+    def __init__(self, s3_client=None, transfer_client=None):
+        """Initialize DataProcessing object.
+
+        Object transfers go through one pooled boto client, created on first use unless a
+        transfer_client is given.
+        """
+        self.transfer_client = transfer_client
+        self.transfer_config = TransferConfig(
+            multipart_threshold=AWS_SETTINGS.s3_multipart_part_size,
+            multipart_chunksize=AWS_SETTINGS.s3_multipart_part_size,
+            max_concurrency=AWS_SETTINGS.s3_transfer_concurrency,
+            use_threads=AWS_SETTINGS.s3_transfer_concurrency > 1)
         self.s3_client = s3_client
         if s3_client:
             self.s3_client = s3_client
@@ -45,50 +182,156 @@ class PersistenceStore:
             if not self.s3_client.is_connected():
                 raise Exception('Unable to connect to s3.')
 
-    def update(self, data, filename='collated.json'):
-        """Upload s3 bucket."""
+    def _get_client(self):
+        """Get pooled client used for object transfers."""
+        if self.transfer_client is None:
+            self._check_and_connect()
+            session = boto3.session.Session(
+                aws_access_key_id=AWS_SETTINGS.s3_access_key_id,
+                aws_secret_access_key=AWS_SETTINGS.s3_secret_access_key,
+                region_name=AWS_SETTINGS.s3_region)
+            self.transfer_client = session.client(
+                's3', endpoint_url=AWS_SETTINGS.s3_endpoint_url or None,
+                config=Config(signature_version='s3v4',
+                              max_pool_connections=AWS_SETTINGS.s3_max_pool_connections))
+        return self.transfer_client
+
+    @staticmethod
+    def _log_throughput(action, key, filename, start):
+        elapsed = time.monotonic() - start
+        size = os.path.getsize(filename) / (1024 * 1024)
+        logger.info('%s %s: %0.2f MB in %0.2f seconds, %0.2f MB/s',
+                    action, key, size, elapsed, size / elapsed if elapsed else 0)
+
+    def update(self, data, filename='collated.json', additive=False):
+        """Upload s3 bucket.
+
+        data maps every ecosystem to its (text, count) pairs sorted by dependency set text,
+        they are read only once. Existing file is merged with data as a stream, counts of an
+        ecosystem are written sorted by text. With additive set counts of existing file are
+        added to the new counts, this is used when data holds only the manifests that are new
+        since the last run. Otherwise new counts replace existing counts of the same
+        dependency set.
+        """
         # connect after creating or with existing s3 client
         self._check_and_connect()
 
+        ecosystems = data.items()
+        existing = None
         if self.s3_client.object_exists(filename):
             logger.info('%s exists, updating it.', filename)
-            json_data = self.s3_client.read_json_file(filename)
-            if not json_data:
-                raise Exception('Unable to get the json data path: '
-                                '{}/{}'.format(AWS_SETTINGS.s3_bucket_name, filename))
-
-            for key in data.keys():
-                data[key].update(json_data.get(key, {}))
+            existing = self.open_object(filename)
+            ecosystems = self._merge_collated(existing, data, additive)
 
-        self.s3_client.write_json_file(filename, data)
+        writer = self.open_multipart_upload(filename)
+        try:
+            write_collated(writer, ecosystems)
+        except ValueError as exc:
+            writer.abort()
+            raise Exception('Unable to get the json data path: '
+                            '{}/{}'.format(AWS_SETTINGS.s3_bucket_name, filename)) from exc
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            if existing is not None:
+                existing.close()
+        writer.close()
         logger.info('Updated file Succefully!')
 
+    @staticmethod
+    def _merge_collated(existing, data, additive):
+        """Get (ecosystem, counts) of data merged with existing collated file.
+
+        Ecosystems missing in data are dropped, as data always holds all of them.
+        """
+        merged = set()
+        for ecosystem, counts in iter_collated(existing):
+            if ecosystem not in data:
+                continue
+            merged.add(ecosystem)
+            counts = sort_counts(counts, SETTINGS.collated_merge_buffer,
+                                 SETTINGS.collector_spill_directory or None)
+            yield ecosystem, merge_counts(counts, data[ecosystem], additive)
+
+        for ecosystem, counts in data.items():
+            if ecosystem not in merged:
+                yield ecosystem, counts
+
     def upload_file(self, src, target):
-        """Upload given file to s3."""
-        self._check_and_connect()
-        self.s3_client.upload_file(src, target)
+        """Upload given file to s3, large files are sent as concurrent multipart upload."""
+        start = time.monotonic()
+        self._get_client().upload_file(src, AWS_SETTINGS.s3_bucket_name, target,
+                                       Config=self.transfer_config)
+        self._log_throughput('Uploaded', target, src, start)
 
     def download_file(self, src, target):
-        """Download file into S3 Bucket."""
-        self._check_and_connect()
+        """Download file into S3 Bucket, large files are fetched as concurrent ranged parts."""
         try:
-            return self.s3_client._s3.Bucket(AWS_SETTINGS.s3_bucket_name).download_file(
-                src, target)
+            start = time.monotonic()
+            self._get_client().download_file(AWS_SETTINGS.s3_bucket_name, src, target,
+                                             Config=self.transfer_config)
+            self._log_throughput('Downloaded', src, target, start)
         except Exception as exc:
             logger.error('An Exception occurred while downloading a file\n'
                          '{}'.format(str(exc)))
 
+    def read_object(self, key):
+        """Read content of given object, None if the object does not exist."""
+        self._check_and_connect()
+        if not self.s3_client.object_exists(key):
+            return None
+        return self._get_client().get_object(Bucket=AWS_SETTINGS.s3_bucket_name,
+                                             Key=key)['Body'].read()
+
+    def write_object(self, key, data):
+        """Write given bytes as content of the object."""
+        self._get_client().put_object(Bucket=AWS_SETTINGS.s3_bucket_name, Key=key, Body=data)
+
+    def delete_object(self, key):
+        """Delete the object, deleting a missing object is not an error."""
+        self._get_client().delete_object(Bucket=AWS_SETTINGS.s3_bucket_name, Key=key)
+
+    def open_object(self, key, seekable=False):
+        """Get file object to stream content of given object without downloading it.
+
+        Seekable file object is backed by ranged requests, needed for formats like zip.
+        """
+        client = self._get_client()
+        if seekable:
+            return io.BufferedReader(S3ObjectReader(client, AWS_SETTINGS.s3_bucket_name, key),
+                                     buffer_size=AWS_SETTINGS.s3_read_buffer_size)
+        return client.get_object(Bucket=AWS_SETTINGS.s3_bucket_name, Key=key)['Body']
+
+    def open_multipart_upload(self, key):
+        """Get file object that streams written content to given object."""
+        return S3MultipartWriter(self._get_client(), AWS_SETTINGS.s3_bucket_name, key,
+                                 AWS_SETTINGS.s3_multipart_part_size)
+
     def list_bucket_objects(self, prefix=None):
         """List all the objects in bucket."""
         self._check_and_connect()
         return self.s3_client.list_bucket_objects(prefix)
 
     def s3_delete_folder(self, folder_path=None):
-        """Delete all objects in the folder."""
-        self._check_and_connect()
+        """Delete all objects in the folder, one listed page of objects at a time.
+
+        Get the number of deleted objects.
+        """
+        client = self._get_client()
+        request = {'Bucket': AWS_SETTINGS.s3_bucket_name, 'Prefix': folder_path or ''}
+        deleted = 0
         try:
-            return self.s3_client._s3.Bucket(AWS_SETTINGS.s3_bucket_name).objects.filter(
-                Prefix=folder_path).delete()
+            while True:
+                page = client.list_objects_v2(**request)
+                objects = [{'Key': entry['Key']} for entry in page.get('Contents', [])]
+                if objects:
+                    client.delete_objects(Bucket=AWS_SETTINGS.s3_bucket_name,
+                                          Delete={'Objects': objects, 'Quiet': True})
+                    deleted += len(objects)
+                if not page.get('IsTruncated'):
+                    return deleted
+                request['ContinuationToken'] = page['NextContinuationToken']
         except Exception as exc:
             logger.error('An Exception occurred while deleting a folder {}\n'
                          '{}'.format(folder_path, str(exc)))
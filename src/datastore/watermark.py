@@ -0,0 +1,81 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Watermark of GitHub blobs processed by earlier incremental runs."""
+import io
+import gzip
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+S3_WATERMARK_FILENAME = 'big-query-data/incremental/seen_blob_ids.csv.gz'
+
+
+class BlobWatermark:
+    """Set of blob ids already processed, stored in the persistence store.
+
+    The ids are kept as a gzipped, sorted, one id per line file. It is handed to BigQuery as is
+    so only the ids seen in the current run are held in memory, save() merges them into the
+    stored file.
+    """
+
+    def __init__(self, data_store, filename=S3_WATERMARK_FILENAME):
+        """Initialize the watermark object."""
+        self.data_store = data_store
+        self.filename = filename
+        self.new_ids = set()
+
+    def get_seen_ids(self):
+        """Get gzipped csv content of all the blob ids seen before, None on first run."""
+        return self.data_store.read_object(self.filename)
+
+    def add(self, blob_id):
+        """Mark blob as processed in current run."""
+        if blob_id:
+            self.new_ids.add(blob_id)
+
+    def update(self, blob_ids):
+        """Mark all given blobs as processed in current run."""
+        self.new_ids.update(filter(None, blob_ids))
+
+    def save(self):
+        """Merge ids seen in current run into the stored watermark."""
+        data, count = merge_ids(read_ids(self.get_seen_ids()), sorted(self.new_ids))
+        self.data_store.write_object(self.filename, data)
+        logger.info('Saved watermark of %d blobs, %d new in this run', count, len(self.new_ids))
+        self.new_ids.clear()
+
+
+def read_ids(data):
+    """Get blob ids of gzipped csv content in stored order, nothing when data is None."""
+    if not data:
+        return iter(())
+    return (line.decode('utf-8').strip() for line in gzip.GzipFile(fileobj=io.BytesIO(data)))
+
+
+def merge_ids(*sorted_ids):
+    """Merge sorted iterables of blob ids into gzipped csv content, get it with id count."""
+    count = 0
+    last_id = None
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as fp:
+        for blob_id in heapq.merge(*sorted_ids):
+            if blob_id and blob_id != last_id:
+                fp.write(blob_id.encode('utf-8') + b'\n')
+                last_id = blob_id
+                count += 1
+    return output.getvalue(), count
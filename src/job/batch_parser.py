@@ -0,0 +1,112 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Reading and parsing of manifest batches staged on S3."""
+import io
+import os
+import logging
+from zipfile import ZipFile
+from contextlib import closing
+from src.config.settings import SETTINGS
+from src.datastore.persistence_store import PersistenceStore
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP, get_collector
+from src.job.staging import read_packed_batch, PACKED_BATCH_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+
+def get_staged_blob_id(manifest_file):
+    """Get blob id out of staged manifest file name '<count>_<blob id>_<name>'."""
+    parts = os.path.basename(manifest_file).split('_', 2)
+    return parts[1] if len(parts) == 3 else None
+
+
+def _parse_manifest(collector, index, ecosystem, name, content, blob_id, entries):
+    """Parse one staged manifest, record blob id and dependencies in entries."""
+    if name.endswith(ECOSYSTEM_MANIFEST_MAP[ecosystem]):
+        logger.info('%d. Parsing file: %s', index, name)
+        packages = collector.parse_and_collect(content, True)
+        if blob_id:
+            entries.append((blob_id, packages))
+    else:
+        logger.warning('Skipping non-manifest file %s', name)
+
+
+def read_zip_records(fileobj):
+    """Stream name, content and blob id of the manifests in a zip batch."""
+    with ZipFile(fileobj) as archive:
+        for member in archive.infolist():
+            if member.filename.endswith('/'):
+                continue
+
+            content = None
+            if member.filename.endswith(tuple(ECOSYSTEM_MANIFEST_MAP.values())):
+                with archive.open(member) as fp:
+                    content = io.TextIOWrapper(fp).read()
+            yield member.filename, content, get_staged_blob_id(member.filename)
+
+
+def _read_packed_records(fileobj):
+    """Stream path, content and blob id of the manifests in a packed batch."""
+    for record in read_packed_batch(fileobj):
+        yield record['path'], record['content'], record['id']
+
+
+def download_batch(data_store, index, ecosystem, object_key):
+    """Download one staged batch into local working directory and return its path."""
+    download_path = '{}/{}_{}'.format(SETTINGS.local_working_directory, index,
+                                      os.path.basename(object_key))
+    data_store.download_file(object_key, download_path)
+    return download_path
+
+
+def parse_batch(data_store, collector, index, ecosystem, object_key, download_path=None):
+    """Read and parse one staged batch into the given collector.
+
+    Batch members are read in-stream, nothing is extracted to disk. Returns blob id and
+    dependencies of every parsed manifest. download_path is set when batch was prefetched.
+    """
+    logger.info('Parsing S3 object %s', object_key)
+    entries = []
+    packed = object_key.endswith(PACKED_BATCH_EXTENSION)
+    read_records = _read_packed_records if packed else read_zip_records
+
+    if SETTINGS.staging_stream_read:
+        # Zip needs random access to reach its central directory, packed batch is read in order.
+        with closing(data_store.open_object(object_key, seekable=not packed)) as fileobj:
+            for name, content, blob_id in read_records(fileobj):
+                _parse_manifest(collector, index, ecosystem, name, content, blob_id, entries)
+    else:
+        if download_path is None:
+            download_path = download_batch(data_store, index, ecosystem, object_key)
+        for name, content, blob_id in read_records(download_path):
+            _parse_manifest(collector, index, ecosystem, name, content, blob_id, entries)
+        os.remove(download_path)
+        logger.debug(f'Removed downloaded batch {download_path}')
+
+    return entries
+
+
+def parse_batch_worker(index, ecosystem, object_key):
+    """Parse one staged batch in a worker process and return its counter.
+
+    The counter holds exact counts of the batch, also in top K mode where the worker's own
+    counts are only approximate, so merging batches loses no dependency set.
+    """
+    collector = get_collector(ecosystem)
+    collector.start_delta()
+    entries = parse_batch(PersistenceStore(), collector, index, ecosystem, object_key)
+    return collector.pop_delta(), collector.get_cache_stats(), entries
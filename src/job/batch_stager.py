@@ -0,0 +1,237 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Staging of manifest batches on S3, for parsing them apart from the query."""
+import os
+import logging
+from zipfile import ZipFile, ZIP_DEFLATED
+from shutil import rmtree
+from src.config.settings import SETTINGS
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP
+from src.job.staging import PackedBatchWriter, PACKED_BATCH_EXTENSION
+from src.job.uploader import BatchUploader
+
+logger = logging.getLogger(__name__)
+
+S3_TEMP_FOLDER = 'big-query-data/manifest-data-zip'
+CONTENT_BATCH_SIZE = 200 * 1024 * 1024   # 200 MB
+
+
+class BatchStager:
+    """Writes manifests into batches and uploads them to the persistence store.
+
+    Progress taken from resume when a batch is full is saved once its upload is done, so a
+    restarted run stages only the rows after it.
+    """
+
+    def __init__(self, data_store, resume):
+        """Initialize the stager object."""
+        if SETTINGS.staging_stream_upload and SETTINGS.staging_format != 'packed':
+            # Zip batches are compressed from their local directory, they can not be streamed
+            raise Exception('STAGING_STREAM_UPLOAD requires packed STAGING_FORMAT')
+        self.data_store = data_store
+        self.resume = resume
+        self.batch_data = {}
+        self.staged_files = {}
+        for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+            self.batch_data[ecosystem] = {
+                'batch_index': 1,
+                'size': 0
+            }
+            self.staged_files[ecosystem] = 0
+        self.packed_writers = {}
+        self.batch_sizes = {}
+        self.uploader = None
+
+    def start(self, resumed=False):
+        """Create local batch directories and start background uploads, if enabled."""
+        if SETTINGS.max_inflight_batches > 0:
+            self.uploader = BatchUploader(SETTINGS.max_inflight_batches)
+
+        for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+            dir = '{}/{}/'.format(SETTINGS.local_working_directory, ecosystem)
+            if resumed and os.path.exists(dir):
+                # Content of the interrupted batch is read again from the query result
+                rmtree(dir)
+            if not os.path.exists(dir):
+                os.makedirs(dir)
+                print(f'Created dir {dir}')
+
+    def stage(self, ecosystem, path, content, blob_id=None):
+        """Write manifest content into current batch and upload the batch once it is full."""
+        self.staged_files[ecosystem] += 1
+        if SETTINGS.staging_format == 'packed':
+            self._get_packed_writer(ecosystem).write(path, content, blob_id)
+        else:
+            name = path.split('/')[-1]
+            if blob_id:
+                name = '{}_{}'.format(blob_id, name)
+            filename = '{}/{}/{}_{}'.format(SETTINGS.local_working_directory,
+                                            ecosystem,
+                                            self.staged_files[ecosystem],
+                                            name)
+            with open(filename, 'w') as fp:
+                fp.write(content)
+        self.batch_data[ecosystem]['size'] += len(content)
+
+        if self.batch_data[ecosystem]['size'] > CONTENT_BATCH_SIZE:
+            self.upload_batch(ecosystem)
+
+    def finish(self):
+        """Upload incomplete batches and wait for all uploads to be done."""
+        for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+            if self.batch_data[ecosystem]['size'] > 0:
+                self.upload_batch(ecosystem)
+
+        if self.uploader:
+            self.uploader.join()
+
+    def abort(self):
+        """Drop batches being written, their streamed uploads are aborted."""
+        for writer in self.packed_writers.values():
+            if SETTINGS.staging_stream_upload:
+                writer.fileobj.abort()
+        self.packed_writers = {}
+
+    def _get_packed_writer(self, ecosystem):
+        """Get writer of current packed batch, start a new batch file when needed."""
+        if ecosystem not in self.packed_writers:
+            batchName = self._get_packed_batch_name(ecosystem)
+            if SETTINGS.staging_stream_upload:
+                # Compressed records go straight to S3, one part at a time.
+                fileobj = self.data_store.open_multipart_upload(
+                    '{}/{}'.format(S3_TEMP_FOLDER, batchName))
+            else:
+                fileobj = '{}/{}'.format(SETTINGS.local_working_directory, batchName)
+            self.packed_writers[ecosystem] = PackedBatchWriter(fileobj)
+        return self.packed_writers[ecosystem]
+
+    def _get_packed_batch_name(self, ecosystem):
+        return '{}/{}_{}{}'.format(ecosystem,
+                                   self.batch_data[ecosystem]['batch_index'],
+                                   ecosystem,
+                                   PACKED_BATCH_EXTENSION)
+
+    def upload_batch(self, ecosystem):
+        """Hand the finished batch over for upload and start a new batch."""
+        batch_index = self.batch_data[ecosystem]['batch_index']
+        # Progress is taken now, when upload is done later it holds for this batch only
+        progress = self.resume.get_progress(ecosystem, batch_index + 1)
+        if ecosystem in self.packed_writers:
+            # Packed batch is compressed while it is written, upload it as is.
+            writer = self.packed_writers.pop(ecosystem)
+            writer.close()
+            if SETTINGS.staging_stream_upload:
+                # Parts are uploaded already, only completion of the upload is left.
+                self._submit_upload(writer.fileobj.close, progress=progress)
+            else:
+                filename = '{}/{}'.format(S3_TEMP_FOLDER, self._get_packed_batch_name(ecosystem))
+                self._submit_upload(_upload_packed_batch, self.data_store, writer.fileobj,
+                                    filename, progress=progress)
+        else:
+            # Move the batch aside, new content goes into a fresh directory meanwhile.
+            dir = '{}/{}'.format(SETTINGS.local_working_directory, ecosystem)
+            batch_dir = '{}/{}_{}_batch'.format(SETTINGS.local_working_directory, batch_index,
+                                                ecosystem)
+            if os.path.exists(batch_dir):
+                rmtree(batch_dir)
+            os.rename(dir, batch_dir)
+            os.makedirs(dir)
+
+            filename = '{}/{}/{}_{}.zip'.format(S3_TEMP_FOLDER, ecosystem, batch_index, ecosystem)
+            self._submit_upload(_upload_zip_batch, self.data_store, batch_dir, filename,
+                                progress=progress)
+
+        self.batch_data[ecosystem]['batch_index'] += 1
+        self.batch_data[ecosystem]['size'] = 0
+
+        logger.debug('Processed batch %d, starting new batch %d',
+                     self.batch_data[ecosystem]["batch_index"] - 1,
+                     self.batch_data[ecosystem]["batch_index"])
+
+    def _submit_upload(self, task, *args, progress=None):
+        """Run upload task in background when enabled, otherwise right away.
+
+        Checkpoint is moved to the given progress once the upload is done.
+        """
+        def upload():
+            task(*args)
+            self.resume.save_progress(progress)
+
+        if self.uploader:
+            self.uploader.submit(upload)
+        else:
+            upload()
+
+    def cleanup(self):
+        """Remove all staged batches."""
+        try:
+            self.data_store.s3_delete_folder(S3_TEMP_FOLDER)
+        except Exception as e:
+            logger.warning('Exception :: Cleaning s3 %s throws %s',
+                           S3_TEMP_FOLDER, str(e))
+
+    def get_staged_batches(self):
+        """Get index, ecosystem and object key of every batch staged on S3."""
+        batches = []
+        self.batch_sizes = {}
+        s3_objects = self.data_store.list_bucket_objects(prefix=S3_TEMP_FOLDER)
+        index = 0
+        for s3_object in s3_objects:
+            object_key = s3_object.key
+            logger.info('Found S3 object %s', object_key)
+
+            # Skip folder objects and other files that are not staged batches
+            if not object_key.endswith(('.zip', PACKED_BATCH_EXTENSION)):
+                continue
+
+            # Extract ecosystem
+            ecosystem = None
+            if object_key.startswith('{}/npm'.format(S3_TEMP_FOLDER)):
+                ecosystem = 'npm'
+            elif object_key.startswith('{}/maven'.format(S3_TEMP_FOLDER)):
+                ecosystem = 'maven'
+            elif object_key.startswith('{}/pypi'.format(S3_TEMP_FOLDER)):
+                ecosystem = 'pypi'
+
+            if not ecosystem:
+                logger.warning('Could not find ecosystem for given object_key %s', object_key)
+                continue
+
+            index += 1
+            batch = (index, ecosystem, object_key)
+            batches.append(batch)
+            self.batch_sizes[batch] = getattr(s3_object, 'size', 0)
+
+        return batches
+
+
+def _upload_zip_batch(data_store, batch_dir, object_key):
+    """Compress batch directory, upload the archive and delete both."""
+    archive = '{}.zip'.format(batch_dir)
+    with ZipFile(archive, 'w', ZIP_DEFLATED) as fp:
+        for name in os.listdir(batch_dir):
+            fp.write(os.path.join(batch_dir, name), name)
+
+    data_store.upload_file(archive, object_key)
+    rmtree(batch_dir)
+    os.remove(archive)
+
+
+def _upload_packed_batch(data_store, filename, object_key):
+    """Upload packed batch file and delete it."""
+    data_store.upload_file(filename, object_key)
+    os.remove(filename)
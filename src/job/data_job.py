@@ -15,268 +15,268 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Main job that queries, collected and update manifest files from big query."""
-import os
 import time
 import logging
-from shutil import make_archive, unpack_archive, rmtree
+from concurrent.futures import ProcessPoolExecutor
 from src.config.settings import SETTINGS, AWS_SETTINGS
 from src.datastore.persistence_store import PersistenceStore
-from src.bigquery.bigquery import Bigquery
-from src.collector.base_collector import BaseCollector
-from src.collector.maven_collector import MavenCollector
-from src.collector.npm_collector import NpmCollector
-from src.collector.pypi_collector import PypiCollector
+from src.datastore.parse_cache import ParseCache
+from src.datastore.watermark import BlobWatermark
+from src.datastore.checkpoint import JobCheckpoint
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP, get_collector
+from src.job.batch_parser import download_batch, parse_batch, parse_batch_worker
+from src.job.batch_stager import BatchStager
+from src.job.query_runner import QueryRunner
+from src.job.row_processor import RowProcessor
+from src.job.resume import JobResume
+from src.job.shard import ShardSnapshots
+from src.job.prefetcher import BatchPrefetcher
 
 logger = logging.getLogger(__name__)
 
-S3_TEMP_FOLDER = 'big-query-data/manifest-data-zip'
-CONTENT_BATCH_SIZE = 200 * 1024 * 1024   # 200 MB
-
-ECOSYSTEM_MANIFEST_MAP = {
-    'maven': 'pom.xml',
-    'npm': 'package.json',
-    'pypi': 'requirements.txt',
-}
-
 
 class DataJob():
     """Big query data fetching and processing class."""
 
-    def __init__(self):
-        """Initialize the BigQueryDataProcessing object."""
-        self.ecosystemBatchData = {}
+    def __init__(self, direct=False, stage=False, shard_index=0, shard_count=1):
+        """Initialize the BigQueryDataProcessing object.
+
+        In direct mode manifests are parsed straight from the BigQuery result iterator and
+        staging to S3 happens only when stage is set, as a side output of the run.
+
+        With shard_count above one only the shard_index slice of the query result is read and
+        the partial counts are saved for merging instead of updating the collated file.
+        """
+        self.direct = direct
+        self.stage = not direct or stage
+        self.shard_index = shard_index
+        self.shard_count = shard_count
         self.ecosystemContentData = {}
         self.collectors = {}
         for ecosystem in ECOSYSTEM_MANIFEST_MAP.keys():
-            self.collectors[ecosystem] = self._get_collector(ecosystem)
+            self.collectors[ecosystem] = get_collector(ecosystem)
             self.ecosystemContentData[ecosystem] = {
                 'size': 0,
                 'count': 0
             }
-            self.ecosystemBatchData[ecosystem] = {
-                'batch_index': 1,
-                'size': 0
-            }
 
         self.data_store = PersistenceStore()
+        self.parse_cache = None
+        if SETTINGS.blob_cache_enabled:
+            versions = {ecosystem: collector.parser_version
+                        for ecosystem, collector in self.collectors.items()}
+            self.parse_cache = ParseCache(self.data_store, versions,
+                                          SETTINGS.blob_cache_max_shards)
+        self.watermark = None
+        if SETTINGS.incremental_extraction:
+            if not SETTINGS.bigquery_dataset:
+                raise Exception('BIGQUERY_DATASET is required for incremental extraction')
+            self.watermark = BlobWatermark(self.data_store)
+        if self.parse_cache and not SETTINGS.bigquery_dataset:
+            raise Exception('BIGQUERY_DATASET is required for blob cache')
+        if SETTINGS.bigquery_result_table and not SETTINGS.bigquery_dataset:
+            raise Exception('BIGQUERY_DATASET is required for materialized query results')
+        if self.shard_count > 1:
+            self._check_shard()
+
+        # Direct mode keeps its counts in memory only, there is nothing to resume from.
+        self.checkpoint = None
+        self.resumed = False
+        if SETTINGS.checkpoint_enabled and not self.direct:
+            self.checkpoint = JobCheckpoint(self.data_store)
+        self.resume = JobResume(self.checkpoint, self.collectors, self.ecosystemContentData)
+        self.stager = BatchStager(self.data_store, self.resume) if self.stage else None
+        self.rows = RowProcessor(self.collectors, self.ecosystemContentData, self.resume,
+                                 stager=self.stager, direct=self.direct,
+                                 parse_cache=self.parse_cache, watermark=self.watermark)
+        self.queries = QueryRunner(self.rows.process, self.resume, checkpoint=self.checkpoint,
+                                   watermark=self.watermark, parse_cache=self.parse_cache,
+                                   shard_index=shard_index, shard_count=shard_count)
+
+    def _check_shard(self):
+        """Check the job can read one shard, shards share no staged batches nor watermark."""
+        if not 0 <= self.shard_index < self.shard_count:
+            raise Exception('Shard index {} out of range of {} shards'.format(
+                self.shard_index, self.shard_count))
+        if not self.direct or self.stage:
+            raise Exception('Sharded run requires direct mode without staging')
+        if self.watermark:
+            raise Exception('Sharded run does not support incremental extraction')
+        if self.parse_cache:
+            # Every shard would overwrite the cache objects saved by the others
+            raise Exception('Sharded run does not support blob cache')
+        if not SETTINGS.bigquery_result_table:
+            raise Exception('Sharded run requires BIGQUERY_RESULT_TABLE materialized beforehand')
+
+    def dry_run(self):
+        """Estimate bytes the job queries would process, nothing is run or billed."""
+        return self.queries.dry_run()
+
+    def materialize(self):
+        """Run the job queries into their result tables for sharded runs to read."""
+        self.queries.materialize()
 
     def run(self):
         """Get big query data and update manifest data."""
+        self.resumed = self.resume.restore(self.stager.batch_data if self.stager else None)
+        if self.resumed:
+            self.queries.incremental = self.checkpoint.state['incremental']
+            if self.checkpoint.state['collated']:
+                # Counts are in the collated file already, merging them again would double them
+                logger.info('Collated file was updated before restart, finishing the run')
+                self.queries.add_resumed_seen_ids()
+                self._finish()
+                return
+
         # Cleanup s3 before start, in case last run was not completed due to error.
-        self._cleanup_s3()
+        if self.stager and not self.resumed:
+            self.stager.cleanup()
 
         bq_start = time.monotonic()
-        self._get_big_query_data()
+        if self.resumed and self.checkpoint.state['download_complete']:
+            logger.info('All manifests were staged before restart, skipping download')
+            self.queries.add_resumed_seen_ids()
+        else:
+            self._get_big_query_data()
         bq_end = time.monotonic()
 
         parse_start = time.monotonic()
-        self._parse()
+        if self.direct:
+            # Manifests are already collected, staged batches (if any) are kept as side output.
+            if self.shard_count > 1:
+                ShardSnapshots(self.data_store, self.shard_count).save(self.shard_index,
+                                                                       self.collectors)
+            else:
+                self._update_s3()
+        else:
+            self._parse()
         parse_end = time.monotonic()
 
-        self._cleanup_s3()
+        self._finish()
 
         logger.info('Ecosystem wise content data: %s', self.ecosystemContentData)
-        logger.info('Ecosystem wise batch information: %s', self.ecosystemBatchData)
+        logger.info('Ecosystem wise parse cache stats: %s',
+                    {e: c.get_cache_stats() for e, c in self.collectors.items()})
+        if self.parse_cache:
+            logger.info('Blob parse cache stats: %s', self.parse_cache.get_stats())
+        if self.stager:
+            logger.info('Ecosystem wise batch information: %s', self.stager.batch_data)
+        logger.info('Query job stats: %s', self.queries.query_stats)
         logger.info('Big query data download took %0.2f seconds', bq_end - bq_start)
         logger.info('Data parsing took %0.2f seconds', parse_end - parse_start)
 
+    def _get_big_query_data(self):
+        """Process Bigquery response data."""
+        if self.stager:
+            self.stager.start(self.resumed)
+
+        try:
+            index = self.queries.run(self.resumed)
+            if self.stager:
+                # Finally upload incomplete batches
+                self.stager.finish()
+        except Exception:
+            if self.stager:
+                self.stager.abort()
+            raise
+
+        if self.checkpoint:
+            for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+                self.resume.save_progress(self.resume.get_progress(
+                    ecosystem, self.stager.batch_data[ecosystem]['batch_index']))
+            self.checkpoint.set_download_complete()
+
+        logger.info('Processed %d manifests, ecosystem data: %s',
+                    index, self.ecosystemContentData)
+
+    def _finish(self):
+        """Remove staged data, save parse cache and watermark once counts are saved.
+
+        Checkpoint is removed last, every step before it is safe to repeat after a restart.
+        """
+        if not self.direct:
+            self.stager.cleanup()
+
+        if self.parse_cache:
+            self.parse_cache.save()
+
+        # Watermark is moved only after the counts of new blobs are saved.
+        if self.watermark:
+            self.watermark.save()
+
+        if self.checkpoint:
+            self.checkpoint.clear()
+
     def _parse(self):
         """Parse all ecosystem data."""
-        s3_objects = self.data_store.list_bucket_objects(prefix=S3_TEMP_FOLDER)
-        index = 0
-        for s3_object in s3_objects:
-            object_key = s3_object.key
-            logger.info('Parsing S3 object %s', object_key)
-
-            # Skip folder objects and other files that are not .zip
-            if not object_key.endswith('.zip'):
-                continue
-
-            # Extract ecosystem
-            ecosystem = None
-            if object_key.startswith('{}/npm'.format(S3_TEMP_FOLDER)):
-                ecosystem = 'npm'
-            elif object_key.startswith('{}/maven'.format(S3_TEMP_FOLDER)):
-                ecosystem = 'maven'
-            elif object_key.startswith('{}/pypi'.format(S3_TEMP_FOLDER)):
-                ecosystem = 'pypi'
-
-            if not ecosystem:
-                logger.warning('Could not find ecosystem for given object_key %s', object_key)
-                continue
-
-            index += 1
-
-            # Create unzip directory
-            unzip_dir = '{}/{}_unzip_dir/'.format(SETTINGS.local_working_directory, index)
-            if not os.path.exists(unzip_dir):
-                os.makedirs(unzip_dir)
-
-            # Download zip content
-            download_zip_path = '{}{}_downloaded.zip'.format(unzip_dir, index)
-            self.data_store.download_file(object_key, download_zip_path)
-
-            # Extract zip content
-            unpack_archive(download_zip_path, unzip_dir, 'zip')
-
-            # Loop through extract manifest files
-            manifest_dir_path = '{}{}/'.format(unzip_dir, ecosystem)
-            manifest_files = [manifest_dir_path + f for f in os.listdir(manifest_dir_path)]
-
-            for manifest_file in manifest_files:
-                if manifest_file.endswith(ECOSYSTEM_MANIFEST_MAP[ecosystem]):
-                    with open(manifest_file, 'r') as fp:
-                        content = fp.read()
-                        logger.info('%d. Parsing file: %s', index, manifest_file)
-                        self.collectors[ecosystem].parse_and_collect(content, True)
-                else:
-                    logger.warning('Skipping non-manifest file %s', manifest_file)
-
-            rmtree(unzip_dir)
-            logger.debug(f'Removed local unzip dir {unzip_dir}')
+        batches = self.stager.get_staged_batches()
+        if self.checkpoint:
+            parsed = [batch for batch in batches if self.checkpoint.is_parsed(batch[2])]
+            if parsed:
+                logger.info('Skipping %d batches merged before restart', len(parsed))
+                batches = [batch for batch in batches if batch not in parsed]
+
+        if SETTINGS.parse_workers > 1:
+            logger.info('Parsing %d batches with %d workers', len(batches), SETTINGS.parse_workers)
+            with ProcessPoolExecutor(max_workers=SETTINGS.parse_workers) as executor:
+                futures = {executor.submit(parse_batch_worker, *batch): batch for batch in batches}
+                for future, (index, ecosystem, object_key) in futures.items():
+                    counter, cache_stats, entries = future.result()
+                    collector = self.collectors[ecosystem]
+                    collector.add_counts(counter)
+                    collector.cache_hits += cache_stats['hits']
+                    collector.cache_misses += cache_stats['misses']
+                    self._update_parse_cache(ecosystem, entries)
+                    # Counter of the worker holds counts of this batch only
+                    self.resume.set_parsed(ecosystem, object_key, counter)
+                    logger.info('%d. Merged parsed batch %s', index, object_key)
+        elif SETTINGS.parse_prefetch_depth > 0 and not SETTINGS.staging_stream_read:
+            logger.info('Parsing %d batches, prefetching %d ahead', len(batches),
+                        SETTINGS.parse_prefetch_depth)
+            prefetcher = BatchPrefetcher(lambda batch: download_batch(self.data_store, *batch),
+                                         batches, self.stager.batch_sizes,
+                                         SETTINGS.parse_prefetch_depth,
+                                         SETTINGS.local_working_directory)
+            for (index, ecosystem, object_key), download_path in prefetcher:
+                entries = parse_batch(self.data_store, self.collectors[ecosystem], index,
+                                      ecosystem, object_key, download_path)
+                self._update_parse_cache(ecosystem, entries)
+                self.resume.set_parsed(ecosystem, object_key)
+        else:
+            for index, ecosystem, object_key in batches:
+                entries = parse_batch(self.data_store, self.collectors[ecosystem], index,
+                                      ecosystem, object_key)
+                self._update_parse_cache(ecosystem, entries)
+                self.resume.set_parsed(ecosystem, object_key)
 
         self._update_s3()
 
-    def _get_big_query_data(self):
-        """Process Bigquery response data."""
-        big_query = Bigquery()
-
-        start = time.monotonic()
-        index = 0
-
-        # Create local structure to store content
-        for _ecosystem, _ in ECOSYSTEM_MANIFEST_MAP.items():
-            dir = '{}/{}/'.format(SETTINGS.local_working_directory, _ecosystem)
-            if not os.path.exists(dir):
-                os.makedirs(dir)
-                print(f'Created dir {dir}')
-
-        big_query.run(self._get_big_query())
-        for object in big_query.get_result():
-            index += 1
-
-            path = object.get('path', None)
-            content = object.get('content', None)
-
-            if not path or not content:
-                logger.warning('Either path %s or content %s is null', path, content)
-                continue
-
-            ecosystem = None
-            for _ecosystem, manifest in ECOSYSTEM_MANIFEST_MAP.items():
-                if path.endswith(manifest):
-                    ecosystem = _ecosystem
-
-            if not ecosystem:
-                logger.warning('Could not find ecosystem for given path %s', path)
-                continue
-
-            if index % 1000 == 0:
-                logger.info('[%d] Time lapsed: %f Processing path: %s',
-                            index, time.monotonic() - start, path)
-
-            contentSize = len(content)
-            self.ecosystemContentData[ecosystem]['size'] += contentSize
-            self.ecosystemContentData[ecosystem]['count'] += 1
-
-            filename = '{}/{}/{}_{}'.format(SETTINGS.local_working_directory,
-                                            ecosystem,
-                                            self.ecosystemContentData[ecosystem]['count'],
-                                            path.split('/')[-1])
-            with open(filename, 'w') as fp:
-                fp.write(content)
-            self.ecosystemBatchData[ecosystem]['size'] += contentSize
-
-            if self.ecosystemBatchData[ecosystem]['size'] > CONTENT_BATCH_SIZE:
-                self._upload_batch_data(ecosystem)
-
-        # Finally upload incomplete batches
-        for ecosystem, _ in ECOSYSTEM_MANIFEST_MAP.items():
-            if self.ecosystemBatchData[ecosystem]['size'] > 0:
-                self._upload_batch_data(ecosystem)
+    def _update_parse_cache(self, ecosystem, entries):
+        """Remember dependencies of freshly parsed blobs for the next runs."""
+        if self.parse_cache:
+            self.parse_cache.update(ecosystem, entries)
+            # Shards touched by the batch are written back, they are not held for the whole run
+            self.parse_cache.flush()
 
-        logger.info('Processed %d manifests, ecosystem data: %s',
-                    index, self.ecosystemContentData)
+    def reduce(self, shard_count):
+        """Merge partial counts saved by shard_count sharded runs and update manifest data.
 
-    def _upload_batch_data(self, ecosystem):
-        # Compress the current content, delete the content and reset batch size.
-        compressFileName = '{}/{}/{}_{}'.format(SETTINGS.local_working_directory,
-                                                ecosystem,
-                                                self.ecosystemBatchData[ecosystem]['batch_index'],
-                                                ecosystem)
-        make_archive(compressFileName, 'zip', root_dir=SETTINGS.local_working_directory,
-                     base_dir=ecosystem)
-
-        compressFileName = compressFileName + '.zip'
-        filename = '{}/{}/{}_{}.zip'.format(S3_TEMP_FOLDER, ecosystem,
-                                            self.ecosystemBatchData[ecosystem]['batch_index'],
-                                            ecosystem)
-        self.data_store.upload_file(compressFileName, filename)
-
-        dir = '{}/{}/'.format(SETTINGS.local_working_directory, ecosystem)
-        rmtree(dir)
-        os.makedirs(dir)
-
-        self.ecosystemBatchData[ecosystem]['batch_index'] += 1
-        self.ecosystemBatchData[ecosystem]['size'] = 0
-
-        logger.debug('Processed batch %d, starting new batch %d',
-                     self.ecosystemBatchData[ecosystem]["batch_index"] - 1,
-                     self.ecosystemBatchData[ecosystem]["batch_index"])
-
-    def _cleanup_s3(self):
-        try:
-            self.data_store.s3_delete_folder(S3_TEMP_FOLDER)
-        except Exception as e:
-            logger.warning('Exception :: Cleaning s3 %s throws %s',
-                           S3_TEMP_FOLDER, str(e))
-
-    def _get_big_query(self) -> str:
-        return """
-            SELECT con.content AS content, L.path AS path
-            FROM `bigquery-public-data.github_repos.contents` AS con
-            INNER JOIN (
-                SELECT files.id AS id, files.path as path
-                FROM `bigquery-public-data.github_repos.languages` AS langs
-                INNER JOIN `bigquery-public-data.github_repos.files` AS files
-                ON files.repo_name = langs.repo_name
-                    WHERE (
-                        (
-                            REGEXP_CONTAINS(TO_JSON_STRING(language), r'(?i)java') AND
-                            files.path LIKE '%/{m}'
-                        ) OR
-                        (
-                            REGEXP_CONTAINS(TO_JSON_STRING(language), r'(?i)python') AND
-                            files.path LIKE '%/{p}'
-                        ) OR
-                        (
-                            files.path LIKE '%/{n}'
-                        )
-                    )
-            ) AS L
-            ON con.id = L.id;
-        """.format(m=ECOSYSTEM_MANIFEST_MAP['maven'],
-                   p=ECOSYSTEM_MANIFEST_MAP['pypi'],
-                   n=ECOSYSTEM_MANIFEST_MAP['npm'])
-
-    def _get_collector(self, ecosystem) -> BaseCollector:
-        if ecosystem == 'maven':
-            return MavenCollector()
-
-        if ecosystem == 'npm':
-            return NpmCollector()
-
-        if ecosystem == 'pypi':
-            return PypiCollector()
+        Snapshots are removed once the collated file is updated.
+        """
+        snapshots = ShardSnapshots(self.data_store, shard_count)
+        snapshots.merge(self.collectors)
+        self._update_s3()
+        snapshots.delete()
 
     def _update_s3(self):
         logger.info('Updating file content to S3')
-        data = {}
-        for ecosystem, object in self.collectors.items():
-            data[ecosystem] = dict(object.counter.most_common())
+        # Counts are streamed in text order straight into the collated file merge
+        data = {ecosystem: object.iter_sorted() for ecosystem, object in self.collectors.items()}
 
         filename = 'big-query-data/{}'.format(AWS_SETTINGS.s3_collated_filename)
 
-        self.data_store.update(data=data, filename=filename)
+        self.data_store.update(data=data, filename=filename, additive=self.queries.incremental)
+        if self.checkpoint:
+            self.checkpoint.set_collated()
 
         logger.info('Succefully saved BigQuery data to persistance store')
@@ -0,0 +1,65 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Background download of staged batches ahead of parsing."""
+import logging
+from collections import deque
+from shutil import disk_usage
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPrefetcher:
+    """Download up to depth batches in background threads while the current one is parsed.
+
+    A batch is prefetched only when the free space of directory covers its size on top of
+    the downloads still running, the batch to be parsed next is always fetched.
+    """
+
+    def __init__(self, download, batches, sizes, depth, directory):
+        """Set download task, batches to fetch in order and their object sizes."""
+        self.download = download
+        self.batches = batches
+        self.sizes = sizes
+        self.depth = depth
+        self.directory = directory
+
+    def _has_space(self, batch, pending):
+        """Check if disk can hold batch besides the downloads in flight."""
+        reserved = sum(self.sizes.get(fetching, 0) for fetching, future in pending
+                       if not future.done())
+        return disk_usage(self.directory).free - reserved >= self.sizes.get(batch, 0)
+
+    def __iter__(self):
+        """Yield every batch with the local path it was downloaded to."""
+        pending = deque()
+        remaining = deque(self.batches)
+        executor = ThreadPoolExecutor(max_workers=self.depth)
+        try:
+            while remaining or pending:
+                # Current batch plus depth batches ahead of it
+                while remaining and len(pending) <= self.depth:
+                    if pending and not self._has_space(remaining[0], pending):
+                        logger.debug('Low disk space, prefetching %d batches', len(pending))
+                        break
+                    batch = remaining.popleft()
+                    pending.append((batch, executor.submit(self.download, batch)))
+
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        finally:
+            executor.shutdown(wait=True)
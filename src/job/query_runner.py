@@ -0,0 +1,320 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""BigQuery queries of the job and loading of the blob id tables they join."""
+import io
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from src.config.settings import SETTINGS
+from src.bigquery.bigquery import Bigquery
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRunner:
+    """Runs the job queries, or reuses their materialized results, and reads their rows.
+
+    Every result row is handed over to process_row. Query jobs are recorded in checkpoint,
+    a restarted run reads the same result again from the first row resume has not staged.
+    """
+
+    def __init__(self, process_row, resume, checkpoint=None, watermark=None, parse_cache=None,
+                 shard_index=0, shard_count=1):
+        """Initialize the query runner object.
+
+        With shard_count above one only the shard_index slice of the materialized result is
+        read. Blobs in watermark are left out of the query, content of blobs in parse_cache
+        is not queried.
+        """
+        self.process_row = process_row
+        self.resume = resume
+        self.checkpoint = checkpoint
+        self.watermark = watermark
+        self.parse_cache = parse_cache
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.incremental = False
+        self.query_stats = []
+
+    def dry_run(self):
+        """Estimate bytes the job queries would process, nothing is run or billed."""
+        big_query = Bigquery()
+        estimates = {'all': big_query.dry_run(self.get_query())}
+        for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+            estimates[ecosystem] = big_query.dry_run(self.get_query(ecosystem=ecosystem))
+
+        for name, total_bytes in estimates.items():
+            logger.info('Query for %s manifests would process %d bytes (%0.2f GiB)',
+                        name, total_bytes, total_bytes / 1024 ** 3)
+        return estimates
+
+    def materialize(self):
+        """Run the job queries into their result tables for sharded runs to read.
+
+        Tables still holding a fresh result of the same query are kept, so every shard reads
+        one and the same result and their row ranges are disjoint.
+        """
+        if not SETTINGS.bigquery_result_table:
+            raise Exception('BIGQUERY_RESULT_TABLE is required to materialize query results')
+
+        names = ['all']
+        if SETTINGS.bigquery_concurrent_ecosystems:
+            names = list(ECOSYSTEM_MANIFEST_MAP)
+        for name in names:
+            big_query = Bigquery()
+            query = self.get_query(ecosystem=None if name == 'all' else name)
+            result_table = self.get_result_table(name)
+            if big_query.read_table(result_table, query):
+                logger.info('Result of %s query is already materialized in %s',
+                            name, result_table)
+                continue
+
+            job_id = big_query.run(query, destination=result_table,
+                                   expiration_hours=SETTINGS.bigquery_result_ttl_hours)
+            self.query_stats.append(dict(big_query.get_job_stats(), ecosystem=name))
+            logger.info('Materialized %s query job %s into %s', name, job_id, result_table)
+
+    def run(self, resumed=False):
+        """Run the job queries and process rows of their results, get processed row count."""
+        big_query = Bigquery()
+
+        start = time.monotonic()
+        index = 0
+
+        if not resumed:
+            seen_ids_table = self._load_watermark(big_query)
+        elif self.incremental:
+            # Seen ids loaded before restart are still in place, watermark moves at the end
+            seen_ids_table = self.get_seen_ids_table()
+        else:
+            seen_ids_table = None
+        cached_ids_table = self._load_cached_ids(big_query)
+
+        if SETTINGS.bigquery_concurrent_ecosystems:
+            # One query per ecosystem, each result stream is consumed by its own worker.
+            with ThreadPoolExecutor(max_workers=len(ECOSYSTEM_MANIFEST_MAP)) as executor:
+                futures = [executor.submit(self._get_ecosystem_data, ecosystem, seen_ids_table,
+                                           cached_ids_table, start)
+                           for ecosystem in ECOSYSTEM_MANIFEST_MAP]
+                for future in futures:
+                    index += future.result()
+        else:
+            index = self._run_query(big_query, 'all',
+                                    self.get_query(seen_ids_table,
+                                                   cached_ids_table=cached_ids_table),
+                                    start)
+            self.query_stats.append(big_query.get_job_stats())
+        return index
+
+    def _get_ecosystem_data(self, ecosystem, seen_ids_table, cached_ids_table, start):
+        """Run query of a single ecosystem and process its result, get processed row count."""
+        big_query = Bigquery()
+        index = self._run_query(big_query, ecosystem,
+                                self.get_query(seen_ids_table, ecosystem, cached_ids_table),
+                                start)
+        logger.info('[%s] Processed %d rows in %f seconds', ecosystem, index,
+                    time.monotonic() - start)
+        self.query_stats.append(dict(big_query.get_job_stats(), ecosystem=ecosystem))
+        return index
+
+    def _run_query(self, big_query, name, query, start):
+        """Run query, or attach to its job when resuming, and process rows not staged yet."""
+        job_id = self.checkpoint.get_query(name) if self.checkpoint else None
+        if not job_id:
+            # Incremental query text does not change with the seen ids, its result is not reused
+            result_table = None if self.incremental else self.get_result_table(name)
+            if result_table and big_query.read_table(result_table, query):
+                job_id = result_table
+                logger.info('Reading %s query result materialized in %s', name, result_table)
+            elif self.shard_count > 1:
+                # Every shard running the query would slice a result of its own row order
+                raise Exception('Result of {} query is not materialized in {}, run with '
+                                '--materialize first'.format(name, result_table))
+            else:
+                job_id = big_query.run(query, destination=result_table,
+                                       expiration_hours=SETTINGS.bigquery_result_ttl_hours)
+                logger.info('Started %s query job %s', name, job_id)
+            if self.checkpoint:
+                self.checkpoint.set_query(name, job_id, self.incremental)
+            return self._process_result(big_query, start)
+
+        self._attach_query(big_query, name, job_id)
+        ecosystems = ECOSYSTEM_MANIFEST_MAP.keys() if name == 'all' else [name]
+        start_index = self.resume.get_start_row(ecosystems)
+        logger.info('Resuming %s query job %s from row %d', name, job_id, start_index)
+        if self.watermark and start_index:
+            self._add_seen_ids(big_query, start_index)
+        return self._process_result(big_query, start, start_index)
+
+    def _process_result(self, big_query, start, start_index=0):
+        """Process all rows of the query result, get processed row count.
+
+        With start_index set the rows before it are skipped, row numbers stay the same as
+        in a full read so they can be compared with the checkpoint.
+        """
+        max_results = None
+        if self.shard_count > 1:
+            start_index, max_results = big_query.get_shard_range(self.shard_index,
+                                                                 self.shard_count)
+            logger.info('Reading %d rows from row %d, shard %d of %d', max_results,
+                        start_index, self.shard_index, self.shard_count)
+
+        index = start_index
+        for object in big_query.get_result(start_index=start_index, max_results=max_results):
+            index += 1
+            self.process_row(object, index, start)
+        return index - start_index
+
+    def _attach_query(self, big_query, name, job_id):
+        """Attach to result of the query recorded in the checkpoint, a job or a table."""
+        if job_id != self.get_result_table(name):
+            big_query.resume(job_id)
+        elif not big_query.read_table(job_id):
+            raise Exception('Materialized result {} of {} query is gone'.format(job_id, name))
+
+    @staticmethod
+    def get_result_table(name):
+        """Get table the result of the named query is materialized in, None when disabled."""
+        if not SETTINGS.bigquery_result_table:
+            return None
+        table_id = '{}.{}'.format(SETTINGS.bigquery_dataset, SETTINGS.bigquery_result_table)
+        return table_id if name == 'all' else '{}_{}'.format(table_id, name)
+
+    def _add_seen_ids(self, big_query, max_results=None):
+        """Add ids of result rows that are not read again after restart to the watermark."""
+        self.watermark.update(row.get('id') for row in
+                              big_query.get_result(max_results=max_results, fields=['id']))
+
+    def add_resumed_seen_ids(self):
+        """Add ids of all result rows of the resumed run to the watermark."""
+        if not self.watermark:
+            return
+
+        for name, job_id in self.checkpoint.state['queries'].items():
+            big_query = Bigquery()
+            self._attach_query(big_query, name, job_id)
+            self._add_seen_ids(big_query)
+            logger.info('Added seen ids of %s query job %s', name, job_id)
+
+    def _load_watermark(self, big_query):
+        """Load ids of blobs seen in earlier runs into BigQuery, get the table name."""
+        if not self.watermark:
+            return None
+
+        seen_ids = self.watermark.get_seen_ids()
+        if not seen_ids:
+            logger.info('No watermark found, running full extraction')
+            return None
+
+        table_id = self.get_seen_ids_table()
+        big_query.load_ids(table_id, io.BytesIO(seen_ids))
+        self.incremental = True
+        return table_id
+
+    @staticmethod
+    def get_seen_ids_table():
+        """Get table the ids of blobs seen in earlier runs are loaded into."""
+        return '{}.seen_blob_ids'.format(SETTINGS.bigquery_dataset)
+
+    def _load_cached_ids(self, big_query):
+        """Load ids of blobs in parse cache into BigQuery, get the table name."""
+        if not self.parse_cache:
+            return None
+
+        cached_ids = self.parse_cache.get_cached_ids()
+        if not cached_ids:
+            logger.info('Parse cache is empty, content of all blobs is queried')
+            return None
+
+        # Table name tells the parser versions the blobs were cached by
+        table_id = '{}.cached_blob_ids_{}'.format(SETTINGS.bigquery_dataset,
+                                                  self.parse_cache.get_version())
+        big_query.load_ids(table_id, io.BytesIO(cached_ids))
+        return table_id
+
+    def get_query(self, seen_ids_table=None, ecosystem=None, cached_ids_table=None) -> str:
+        """Get query for manifests of all ecosystems or only of the given one.
+
+        Content of blobs listed in cached_ids_table is left out, such rows are flagged cached
+        and their packages are read from parse cache.
+        """
+        joins = ''
+        if cached_ids_table:
+            joins += """
+            LEFT JOIN `{}` AS cached
+            ON con.id = cached.id""".format(cached_ids_table)
+        if seen_ids_table:
+            joins += """
+            LEFT JOIN `{}` AS seen
+            ON con.id = seen.id
+            WHERE seen.id IS NULL""".format(seen_ids_table)
+
+        path_filters = {
+            'maven': """
+                        (
+                            REGEXP_CONTAINS(TO_JSON_STRING(language), r'(?i)java') AND
+                            files.path LIKE '%/{}'
+                        )""".format(ECOSYSTEM_MANIFEST_MAP['maven']),
+            'pypi': """
+                        (
+                            REGEXP_CONTAINS(TO_JSON_STRING(language), r'(?i)python') AND
+                            files.path LIKE '%/{}'
+                        )""".format(ECOSYSTEM_MANIFEST_MAP['pypi']),
+            'npm': """
+                        (
+                            files.path LIKE '%/{}'
+                        )""".format(ECOSYSTEM_MANIFEST_MAP['npm']),
+        }
+        ecosystems = [ecosystem] if ecosystem else ['maven', 'pypi', 'npm']
+
+        no_content = []
+        columns = ''
+        if cached_ids_table:
+            no_content.append('cached.id IS NOT NULL')
+            columns += """,
+                cached.id IS NOT NULL AS cached"""
+        if SETTINGS.npm_sql_extraction and 'npm' in ecosystems:
+            # Valid package.json comes back as its dependencies object only, invalid one as is.
+            extracted = "(L.path LIKE '%/{}' AND JSON_QUERY(con.content, '$') IS NOT NULL)".format(
+                ECOSYSTEM_MANIFEST_MAP['npm'])
+            if cached_ids_table:
+                extracted = '(cached.id IS NULL AND {})'.format(extracted)
+            no_content.append(extracted)
+            columns += """,
+                IF({e}, JSON_QUERY(con.content, '$.dependencies'), NULL) AS dependencies,
+                {e} AS extracted""".format(e=extracted)
+        content = 'con.content'
+        if no_content:
+            content = 'IF({}, NULL, con.content)'.format(' OR '.join(no_content))
+        columns = '{} AS content{}'.format(content, columns)
+
+        return """
+            SELECT con.id AS id, {c}, L.path AS path
+            FROM `bigquery-public-data.github_repos.contents` AS con
+            INNER JOIN (
+                SELECT files.id AS id, files.path as path
+                FROM `bigquery-public-data.github_repos.languages` AS langs
+                INNER JOIN `bigquery-public-data.github_repos.files` AS files
+                ON files.repo_name = langs.repo_name
+                    WHERE ({f}
+                    )
+            ) AS L
+            ON con.id = L.id{j};
+        """.format(c=columns,
+                   f=' OR'.join(path_filters[e] for e in ecosystems),
+                   j=joins)
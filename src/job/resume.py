@@ -0,0 +1,117 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Progress of a staged run, lets an interrupted job continue where it stopped."""
+import logging
+from src.config.settings import SETTINGS
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP
+
+logger = logging.getLogger(__name__)
+
+
+class JobResume:
+    """Saves progress of a staged run in its checkpoint and picks it up after a restart.
+
+    Tracks per ecosystem the last result row handed over to the current batch, and the rows
+    staged before a restart, those rows are not staged again. Without checkpoint nothing is
+    saved and every row is new.
+    """
+
+    def __init__(self, checkpoint, collectors, content_data):
+        """Initialize the resume object.
+
+        collectors and content_data are the counters and content totals of the job, progress
+        saved for an ecosystem holds both.
+        """
+        self.checkpoint = checkpoint
+        self.collectors = collectors
+        self.content_data = content_data
+        self.rows = {ecosystem: 0 for ecosystem in ECOSYSTEM_MANIFEST_MAP}
+        self.resume_rows = {ecosystem: 0 for ecosystem in ECOSYSTEM_MANIFEST_MAP}
+        if self.checkpoint:
+            for collector in self.collectors.values():
+                collector.start_delta()
+
+    def restore(self, batch_data):
+        """Pick up progress of an interrupted run, False when the run starts from scratch.
+
+        Next batch index of every ecosystem is set in batch_data.
+        """
+        if not self.checkpoint or not self.checkpoint.load():
+            return False
+
+        state = self.checkpoint.state
+        if not state['download_complete']:
+            names = set(ECOSYSTEM_MANIFEST_MAP) if SETTINGS.bigquery_concurrent_ecosystems \
+                else {'all'}
+            if not state['queries'] or not set(state['queries']) <= names:
+                logger.info('Checkpoint can not be resumed in current mode, starting over')
+                self.checkpoint.clear()
+                return False
+
+        if state['collated']:
+            # Counts of the checkpoint are merged into the collated file already
+            return True
+
+        for counters in self.checkpoint.iter_deltas():
+            for ecosystem, counter in counters.items():
+                self.collectors[ecosystem].add_counts(counter)
+        for ecosystem in ECOSYSTEM_MANIFEST_MAP:
+            progress = self.checkpoint.get_ecosystem(ecosystem) or {}
+            self.content_data[ecosystem].update(progress.get('content_data', {}))
+            batch_data[ecosystem]['batch_index'] = progress.get('batch_index', 1)
+            self.resume_rows[ecosystem] = progress.get('rows_done', 0)
+
+        logger.info('Resuming interrupted run, ecosystem data: %s', self.content_data)
+        return True
+
+    def is_new_row(self, ecosystem, index):
+        """Check that row is not in a batch uploaded before restart, remember it as last row."""
+        if index <= self.resume_rows[ecosystem]:
+            return False
+        self.rows[ecosystem] = index
+        return True
+
+    def get_start_row(self, ecosystems):
+        """Get number of result rows all given ecosystems staged before restart."""
+        return min(self.resume_rows[ecosystem] for ecosystem in ecosystems)
+
+    def get_progress(self, ecosystem, batch_index):
+        """Get progress of ecosystem, batch_index is the next batch to stage.
+
+        Counts collected since the previous progress are handed over along with it. None
+        without checkpoint.
+        """
+        if not self.checkpoint:
+            return None
+
+        return (ecosystem,
+                batch_index,
+                self.rows[ecosystem],
+                dict(self.content_data[ecosystem]),
+                self.collectors[ecosystem].pop_delta())
+
+    def save_progress(self, progress):
+        """Move the checkpoint to progress taken by get_progress()."""
+        if progress:
+            self.checkpoint.set_ecosystem(*progress)
+
+    def set_parsed(self, ecosystem, object_key, delta=None):
+        """Record merged batch in checkpoint, delta defaults to counts collected since last."""
+        if self.checkpoint:
+            if delta is None:
+                delta = self.collectors[ecosystem].pop_delta()
+            self.checkpoint.set_parsed(object_key, ecosystem, delta)
@@ -0,0 +1,130 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Classification of query result rows into ecosystem manifests."""
+import time
+import logging
+from src.collector.ecosystem import ECOSYSTEM_MANIFEST_MAP
+
+logger = logging.getLogger(__name__)
+
+
+class RowProcessor:
+    """Classifies query result rows by ecosystem and collects, parses or stages manifests.
+
+    In direct mode manifests are parsed right away, with stager given they are staged as
+    well. Rows staged before a restart are told apart by resume.
+    """
+
+    def __init__(self, collectors, content_data, resume, stager=None, direct=False,
+                 parse_cache=None, watermark=None):
+        """Initialize the row processor object.
+
+        collectors and content_data are the counters and content totals of the job, rows
+        add to both.
+        """
+        self.collectors = collectors
+        self.content_data = content_data
+        self.resume = resume
+        self.stager = stager
+        self.direct = direct
+        self.parse_cache = parse_cache
+        self.watermark = watermark
+
+    def process(self, object, index, start):
+        """Classify one result row and hand its manifest over for parsing or staging."""
+        path = object.get('path', None)
+        content = object.get('content', None)
+        blob_id = object.get('id', None)
+
+        if self.watermark:
+            self.watermark.add(blob_id)
+
+        if object.get('cached', None):
+            ecosystem = self.get_ecosystem(path)
+            if ecosystem and self.resume.is_new_row(ecosystem, index):
+                self._collect_cached(ecosystem, path, blob_id)
+            return
+
+        if object.get('extracted', None):
+            if self.resume.is_new_row('npm', index):
+                self._collect_extracted(blob_id, object.get('dependencies', None))
+            return
+
+        if not path or not content:
+            logger.warning('Either path %s or content %s is null', path, content)
+            return
+
+        ecosystem = self.get_ecosystem(path)
+        if not ecosystem:
+            logger.warning('Could not find ecosystem for given path %s', path)
+            return
+
+        if not self.resume.is_new_row(ecosystem, index):
+            return
+
+        if index % 1000 == 0:
+            logger.info('[%d] Time lapsed: %f Processing path: %s',
+                        index, time.monotonic() - start, path)
+
+        contentSize = len(content)
+        self.content_data[ecosystem]['size'] += contentSize
+        self.content_data[ecosystem]['count'] += 1
+        self._process_manifest(ecosystem, path, content, blob_id)
+
+    @staticmethod
+    def get_ecosystem(path):
+        """Get ecosystem of the manifest path, None for any other file."""
+        ecosystem = None
+        for _ecosystem, manifest in ECOSYSTEM_MANIFEST_MAP.items():
+            if path and path.endswith(manifest):
+                ecosystem = _ecosystem
+        return ecosystem
+
+    def _collect_cached(self, ecosystem, path, blob_id):
+        """Collect packages of a blob the query left content of out, it is in parse cache."""
+        packages = self.parse_cache.get(ecosystem, blob_id)
+        if packages is None:
+            logger.warning('Cached blob %s of %s is missing in parse cache', blob_id, path)
+            return
+
+        self.content_data[ecosystem]['count'] += 1
+        self.collectors[ecosystem].collect(packages)
+
+    def _collect_extracted(self, blob_id, dependencies):
+        """Collect npm dependency object extracted by the query, nothing is left to parse."""
+        self.content_data['npm']['size'] += len(dependencies or '')
+        self.content_data['npm']['count'] += 1
+        packages = self.collectors['npm'].collect_extracted(dependencies)
+        if self.parse_cache:
+            self.parse_cache.update('npm', [(blob_id, packages)])
+
+    def _process_manifest(self, ecosystem, path, content, blob_id):
+        """Collect packages of a cached blob, parse and stage manifest as per job mode."""
+        if self.parse_cache:
+            packages = self.parse_cache.get(ecosystem, blob_id)
+            if packages is not None:
+                # Blob was parsed in an earlier run, no need to stage or parse it again.
+                self.collectors[ecosystem].collect(packages)
+                return
+
+        if self.direct:
+            packages = self.collectors[ecosystem].parse_and_collect(content, True)
+            if self.parse_cache:
+                self.parse_cache.update(ecosystem, [(blob_id, packages)])
+
+        if self.stager:
+            self.stager.stage(ecosystem, path, content, blob_id)
@@ -0,0 +1,67 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Partial counts of sharded runs, merged by a reduce step."""
+import logging
+from src.collector.snapshot import dump_snapshot, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+S3_SHARD_FILENAME = 'big-query-data/shards/{}_of_{}.snapshot'
+
+
+class ShardSnapshots:
+    """Snapshots of the counts of shard_count sharded runs, stored in the persistence store.
+
+    Every shard saves its own snapshot, they are merged once all of them are there so no
+    shard is counted twice or left out.
+    """
+
+    def __init__(self, data_store, shard_count):
+        """Initialize the shard snapshots object."""
+        self.data_store = data_store
+        self.shard_count = shard_count
+
+    def _get_filename(self, shard_index):
+        return S3_SHARD_FILENAME.format(shard_index, self.shard_count)
+
+    def save(self, shard_index, collectors):
+        """Save snapshot of partial counts of one shard."""
+        summary = {}
+        for collector in collectors.values():
+            summary.update(collector.get_summary())
+        data = dump_snapshot(summary)
+        filename = self._get_filename(shard_index)
+        self.data_store.write_object(filename, data)
+        logger.info('Saved partial data of shard %d of %d to %s',
+                    shard_index, self.shard_count, filename)
+
+    def merge(self, collectors):
+        """Add partial counts of all shards to the collectors."""
+        for shard_index in range(self.shard_count):
+            filename = self._get_filename(shard_index)
+            data = self.data_store.read_object(filename)
+            if not data:
+                raise Exception('Missing partial data {}'.format(filename))
+            summary = load_snapshot(data)
+            for collector in collectors.values():
+                collector.merge_summary(summary)
+            logger.info('Merged partial data %s', filename)
+
+    def delete(self):
+        """Remove snapshots of all shards."""
+        for shard_index in range(self.shard_count):
+            self.data_store.delete_object(self._get_filename(shard_index))
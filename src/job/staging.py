@@ -0,0 +1,52 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Packed staging format for manifest batches."""
+import gzip
+import json
+
+PACKED_BATCH_EXTENSION = '.jsonl.gz'
+
+
+class PackedBatchWriter:
+    """Append manifest records to one gzipped json lines file per batch.
+
+    Replaces the one file per manifest staging, a batch is a single file that is only ever
+    appended to, so there is no per manifest file creation, open or delete.
+    """
+
+    def __init__(self, fileobj):
+        """Initialize writer on a binary file object or file name."""
+        self.fileobj = fileobj
+        self.fp = gzip.open(fileobj, 'wt', encoding='utf-8')
+        self.count = 0
+
+    def write(self, path, content, blob_id=None):
+        """Append one manifest record to the batch."""
+        self.fp.write(json.dumps({'id': blob_id, 'path': path, 'content': content}))
+        self.fp.write('\n')
+        self.count += 1
+
+    def close(self):
+        """Flush and close the batch."""
+        self.fp.close()
+
+
+def read_packed_batch(fileobj):
+    """Stream manifest records of a packed batch from binary file object or file name."""
+    with gzip.open(fileobj, 'rt', encoding='utf-8') as fp:
+        for line in fp:
+            yield json.loads(line)
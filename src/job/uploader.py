@@ -0,0 +1,69 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Background upload of finished manifest batches."""
+import logging
+from threading import BoundedSemaphore, Lock
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchUploader:
+    """Run batch compression and upload tasks in a background thread.
+
+    At most max_inflight batches can be pending or running, submit() blocks until a slot is
+    free, that caps the memory held by finished batches while ingestion goes on.
+    """
+
+    def __init__(self, max_inflight):
+        """Start the background worker."""
+        self.slots = BoundedSemaphore(max_inflight)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        # Batches of different ecosystems can be submitted from concurrent query workers
+        self.lock = Lock()
+
+    def submit(self, task, *args):
+        """Queue task, wait when too many batches are in flight."""
+        self.slots.acquire()
+        with self.lock:
+            try:
+                self._raise_error()
+            except Exception:
+                self.slots.release()
+                raise
+            future = self.executor.submit(task, *args)
+            # Slot is freed only once the result is set, so a failure is seen by the next submit.
+            future.add_done_callback(lambda _: self.slots.release())
+            self.futures.append(future)
+
+    def _raise_error(self):
+        """Raise error of the first failed upload, drop completed uploads."""
+        pending = []
+        for future in self.futures:
+            if not future.done():
+                pending.append(future)
+            elif future.exception():
+                raise future.exception()
+        self.futures = pending
+
+    def join(self):
+        """Wait for all queued uploads to finish."""
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            self._raise_error()
+        logger.info('All batch uploads finished')
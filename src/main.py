@@ -16,15 +16,61 @@
 #
 """The main script for the Big Query manifests retrieval."""
 
+import sys
 import time
+import argparse
 from rudra import logger
+from src.config.settings import SETTINGS
 from src.job.data_job import DataJob
 
 
-def main():
-    """Retrieve, process and store the manifest files from Big Query."""
+def _parse_args(argv):
+    """Parse command line options of the job."""
+    parser = argparse.ArgumentParser(description='Retrieve manifests from GitHub using BigQuery.')
+    parser.add_argument('--direct', action='store_true',
+                        help='parse manifests straight from the BigQuery result iterator')
+    parser.add_argument('--stage', action='store_true',
+                        help='with --direct, also stage manifest batches in S3 as side output')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report bytes the BigQuery queries would process')
+    parser.add_argument('--shard-index', type=int, default=SETTINGS.shard_index,
+                        help='with --direct, slice of the query result this run reads, from 0 '
+                             '(default: SHARD_INDEX or JOB_COMPLETION_INDEX of Indexed Job)')
+    parser.add_argument('--shard-count', type=int, default=SETTINGS.shard_count,
+                        help='number of runs the query result is split between '
+                             '(default: SHARD_COUNT)')
+    parser.add_argument('--materialize', action='store_true',
+                        help='run the query into BIGQUERY_RESULT_TABLE for sharded runs to read')
+    parser.add_argument('--reduce', action='store_true',
+                        help='merge partial data saved by --shard-count runs into collated file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Retrieve, process and store the manifest files from Big Query.
+
+    Options are read from argv, from the command line when it is None.
+    """
+    args = _parse_args(argv)
+
     logger.info('Initializing Big query object')
-    dataJob = DataJob()
+    if args.materialize:
+        logger.info('Materializing big query result for sharded runs')
+        DataJob().materialize()
+        return
+
+    if args.reduce:
+        logger.info('Merging partial data of %d shards', args.shard_count)
+        DataJob().reduce(args.shard_count)
+        return
+
+    dataJob = DataJob(direct=args.direct, stage=args.stage,
+                      shard_index=args.shard_index, shard_count=args.shard_count)
+
+    if args.dry_run:
+        logger.info('Estimating big query job cost')
+        dataJob.dry_run()
+        return
 
     logger.info('Starting big query job')
     start = time.monotonic()
@@ -33,4 +79,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1:])
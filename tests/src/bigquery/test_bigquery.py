@@ -15,11 +15,15 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Test big query."""
+import io
 import pytest
+from datetime import datetime, timedelta, timezone
 import unittest
 from unittest import mock
 from unittest.mock import patch
 from src.bigquery.bigquery import Bigquery
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery.table import TableReference
 
 
 class DummyBigquery():
@@ -29,6 +33,11 @@ class DummyBigquery():
         """Set default counter and dummy job id."""
         self.counter = 0
         self.job_id = 12345
+        self.destination = mock.Mock(project='project', dataset_id='_anon', table_id='result')
+        self.total_bytes_processed = 1024
+        self.total_bytes_billed = 10485760
+        self.slot_millis = 250
+        self.cache_hit = False
 
     def done(self):
         """Run the bigquery synchronously."""
@@ -79,14 +88,40 @@ class MockQueryJobConfig(mock.Mock):
 class MockClient(mock.Mock):
     """Client mock class."""
 
+    project = 'project'
+
     def query(self, query, job_config=None, job_id=None, job_id_prefix=None,
               location=None, project=None, retry=3):
         """Query function for big queries."""
+        self.job_config = job_config
         return DummyBigquery()
 
+    def load_table_from_file(self, file_obj, destination, job_config=None):
+        """Load file into table."""
+        load_job = mock.Mock(job_id=54321, output_rows=2)
+        self.loaded = (file_obj.read(), destination, job_config)
+        return load_job
+
     def get_job(self, job_id, project=None, location=None, retry=3):
         """Get last executed job data."""
-        return {'state': 'COMPLETED'}
+        job = DummyBigquery()
+        job.job_id = job_id
+        return job
+
+    def get_table(self, table):
+        """Get destination table of the job."""
+        return mock.Mock(schema=[mock.Mock(), mock.Mock()], reference=table)
+
+    def update_table(self, table, fields):
+        """Update given fields of the table."""
+        self.updated = (table, fields)
+        return table
+
+    def list_rows(self, table, selected_fields=None, start_index=0, max_results=None):
+        """List rows of the table."""
+        self.listed = (selected_fields, start_index, max_results)
+        rows = DummyBigquery().result()[start_index:]
+        return rows[:max_results] if max_results is not None else rows
 
 
 class TestBigQuery(unittest.TestCase):
@@ -145,3 +180,137 @@ class TestBigQuery(unittest.TestCase):
             total_count += 1
 
         assert total_count == 5
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_resume(self, _c):
+        """Test result of an earlier job is read again from a given row."""
+        bq = Bigquery(MockQueryJobConfig())
+        assert bq.resume('job_1') == 'job_1'
+
+        paths = [row['path'] for row in bq.get_result(start_index=3)]
+        assert paths == ['tests/data/invalid.file', 'tests/data/invalid.file']
+        assert bq.client.listed == (None, 3, None)
+
+        with pytest.raises(Exception) as e:
+            bq.resume(None)
+
+        assert str(e.value) == 'Client or job id missing'
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_run_with_destination(self, _c):
+        """Test result is written to a table that expires and is labelled with the query."""
+        bq = Bigquery(MockQueryJobConfig())
+        assert bq.run('Query string goes here', destination='dataset.manifests',
+                      expiration_hours=72) == 12345
+
+        assert bq.client.job_config.destination == TableReference.from_string(
+            'project.dataset.manifests')
+        assert bq.client.job_config.write_disposition == 'WRITE_TRUNCATE'
+        table, fields = bq.client.updated
+        assert fields == ['expires', 'labels']
+        assert table.expires > datetime.now(timezone.utc) + timedelta(hours=71)
+        assert table.labels == {'query_hash': Bigquery._get_query_hash('Query string goes here')}
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_read_table(self, _c):
+        """Test materialized result is read only while it is fresh and of the same query."""
+        bq = Bigquery(MockQueryJobConfig())
+        table = bq.client.get_table('project.dataset.manifests')
+        table.expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        table.labels = {'query_hash': Bigquery._get_query_hash('Query string goes here')}
+
+        with patch.object(bq.client, 'get_table', return_value=table):
+            assert bq.read_table('project.dataset.manifests', 'Other query') is False
+            assert bq.read_table('project.dataset.manifests', 'Query string goes here') is True
+
+            assert len(list(bq.get_result())) == 5
+            assert bq.client.listed == (None, 0, None)
+            assert bq.get_job_stats()['job_id'] is None
+            assert bq.get_job_stats()['rows_returned'] == 5
+
+            table.expires = datetime.now(timezone.utc) - timedelta(hours=1)
+            assert bq.read_table('project.dataset.manifests') is False
+
+        with patch.object(bq.client, 'get_table', side_effect=NotFound('gone')):
+            assert bq.read_table('project.dataset.manifests') is False
+
+        with pytest.raises(Exception) as e:
+            bq.read_table(None)
+
+        assert str(e.value) == 'Client or table missing'
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_get_shard_range(self, _c):
+        """Test shards split the result into disjoint row ranges covering all rows."""
+        bq = Bigquery(MockQueryJobConfig())
+        bq.run('Query string goes here')
+        table = bq.client.get_table(None)
+        table.num_rows = 5
+
+        with patch.object(bq.client, 'get_table', return_value=table):
+            ranges = [bq.get_shard_range(i, 3) for i in range(3)]
+            assert ranges == [(0, 1), (1, 2), (3, 2)]
+
+            paths = [row['path'] for start_index, max_results in ranges
+                     for row in bq.get_result(start_index, max_results)]
+            assert paths == [row['path'] for row in DummyBigquery().result()]
+
+        with pytest.raises(Exception) as e:
+            bq.get_shard_range(3, 3)
+
+        assert str(e.value) == 'Shard index 3 out of range of 3 shards'
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_get_result_fields(self, _c):
+        """Test only asked fields of first rows are read."""
+        bq = Bigquery(MockQueryJobConfig())
+        bq.run('Query string goes here')
+        table = bq.client.get_table(None)
+        table.schema[0].name = 'id'
+        table.schema[1].name = 'content'
+
+        with patch.object(bq.client, 'get_table', return_value=table):
+            assert len(list(bq.get_result(max_results=2, fields=['id']))) == 2
+
+        assert bq.client.listed == ([table.schema[0]], 0, 2)
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_dry_run(self, _c):
+        """Test dry run reports estimated bytes."""
+        bq = Bigquery(MockQueryJobConfig())
+        assert bq.dry_run('Query string goes here') == 1024
+        assert bq.client.job_config.dry_run is True
+        assert bq.job_query_obj is None
+
+        with pytest.raises(Exception) as e:
+            bq.dry_run(None)
+
+        assert str(e.value) == 'Client or query missing'
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_get_job_stats(self, _c):
+        """Test job statistics include rows and bytes returned."""
+        bq = Bigquery(MockQueryJobConfig())
+        bq.run('Query string goes here')
+        rows = list(bq.get_result())
+
+        assert bq.get_job_stats() == {
+            'job_id': 12345,
+            'total_bytes_processed': 1024,
+            'total_bytes_billed': 10485760,
+            'slot_millis': 250,
+            'cache_hit': False,
+            'rows_returned': 5,
+            'bytes_returned': sum(len(row['path']) + len(row['content']) for row in rows),
+        }
+
+    @patch('src.bigquery.bigquery.Client', new_callable=MockClient)
+    def test_load_ids(self, _c):
+        """Test loading blob ids into a table."""
+        bq = Bigquery(MockQueryJobConfig())
+        assert bq.load_ids('project.dataset.seen_blob_ids', io.BytesIO(b'a1\nb2\n')) == 54321
+
+        content, destination, job_config = bq.client.loaded
+        assert content == b'a1\nb2\n'
+        assert destination == TableReference.from_string('project.dataset.seen_blob_ids')
+        assert job_config.write_disposition == 'WRITE_TRUNCATE'
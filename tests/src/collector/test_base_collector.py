@@ -16,6 +16,8 @@
 #
 """Test base collector class."""
 import pytest
+from unittest import mock
+from src.config.settings import SETTINGS
 from src.collector.base_collector import BaseCollector
 
 
@@ -28,4 +30,115 @@ class TestBaseCollector:
         with pytest.raises(Exception) as e:
             bc.parse_and_collect(None, True)
 
-        assert str(e.value) == 'Missing parse_and_collect() method implementation!!'
+        assert str(e.value) == 'Missing get_packages() method implementation!!'
+
+    def test_parse_cache(self):
+        """Test duplicate manifests are parsed only once."""
+        bc = BaseCollector("ecosystem")
+        with mock.patch.object(bc, 'get_packages', return_value=['pck1', 'pck2']) as parser:
+            assert bc.parse_and_collect('content', True) == ('pck1', 'pck2')
+            assert bc.parse_and_collect('content', True) == ('pck1', 'pck2')
+            assert bc.parse_and_collect(b'content', True) == ('pck1', 'pck2')
+            bc.parse_and_collect('content', False)
+
+        assert parser.call_count == 2
+        assert bc.get_cache_stats() == {'hits': 2, 'misses': 2}
+        assert dict(bc.counter) == {'pck1, pck2': 4}
+
+    def test_parse_cache_eviction(self):
+        """Test least recently used manifest is evicted from a full cache."""
+        bc = BaseCollector("ecosystem")
+        bc.cache_size = 2
+        with mock.patch.object(bc, 'get_packages', side_effect=lambda c, _: [c]) as parser:
+            bc.parse_and_collect('a', True)
+            bc.parse_and_collect('b', True)
+            bc.parse_and_collect('a', True)
+            bc.parse_and_collect('c', True)
+            bc.parse_and_collect('a', True)
+            bc.parse_and_collect('b', True)
+
+        assert parser.call_count == 4
+        assert len(bc.cache) == 2
+        assert dict(bc.counter) == {'a': 3, 'b': 2, 'c': 1}
+
+    def test_parse_cache_empty_content(self):
+        """Test empty content is never cached."""
+        bc = BaseCollector("ecosystem")
+        with mock.patch.object(bc, 'get_packages', return_value=None) as parser:
+            assert bc.parse_and_collect(None, True) == ()
+            assert bc.parse_and_collect(None, True) == ()
+
+        assert parser.call_count == 2
+        assert len(bc.cache) == 0
+        assert dict(bc.counter) == {}
+
+    def test_interned_counts(self):
+        """Test package names are stored once and counts keep the text form of manifests."""
+        bc = BaseCollector("ecosystem")
+        bc.collect(['pck1', 'pck2'])
+        bc.collect(['pck2', 'pck1'])
+        bc.collect(['pck1', 'pck2'])
+        bc.collect([])
+
+        assert bc.package_names == ['pck1', 'pck2']
+        assert len(bc.counts) == 2
+        assert bc.counter.most_common() == [('pck1, pck2', 2), ('pck2, pck1', 1)]
+
+        bc.add_counts({'pck2, pck3': 2, 'pck1, pck2': 1})
+        assert bc.package_names == ['pck1', 'pck2', 'pck3']
+        assert dict(bc.counter) == {'pck1, pck2': 3, 'pck2, pck1': 1, 'pck2, pck3': 2}
+
+    def test_spilled_counts(self):
+        """Test counts spilled over the memory budget come out same as kept in memory."""
+        manifests = [['pck{}'.format(i % 7), 'pck{}'.format(i % 5)] for i in range(100)]
+        manifests += [['pck1'], ['pck0', 'pck0'], ['pck3', 'pck1']]
+        in_memory = BaseCollector("ecosystem")
+        spilled = BaseCollector("ecosystem")
+        spilled.memory_budget = 500
+        for packages in manifests:
+            in_memory.collect(packages)
+            spilled.collect(packages)
+        spilled.add_counts({'pck3, pck1': 2, 'pck9': 1})
+        in_memory.add_counts({'pck3, pck1': 2, 'pck9': 1})
+
+        assert len(spilled.segments) > 1
+        assert spilled.counts_size <= 500
+        assert dict(spilled.counter) == dict(in_memory.counter)
+        assert list(spilled.iter_sorted()) == sorted(in_memory.counter.items())
+
+    def test_top_k_counts(self):
+        """Test top K mode keeps only the most frequent dependency sets."""
+        with mock.patch.object(SETTINGS, 'collector_top_k', 2):
+            bc = BaseCollector("ecosystem")
+
+        for packages in [['a'], ['b', 'c'], ['a'], ['d'], ['b', 'c'], ['a']]:
+            bc.collect(packages)
+        bc.add_counts({'d': 1})
+
+        assert bc.counter.most_common() == [('a', 3), ('b, c', 2)]
+        assert list(bc.iter_sorted()) == [('a', 3), ('b, c', 2)]
+        assert bc.package_names == []
+
+    def test_snapshot(self):
+        """Test counts of a collector are merged into another through a snapshot."""
+        bc = BaseCollector("ecosystem")
+        bc.collect(['pck1', 'pck2'])
+        bc.collect(['pck3'])
+        other = BaseCollector("ecosystem")
+        other.collect(['pck3'])
+
+        other.merge_snapshot(bc.snapshot())
+        other.merge_snapshot(BaseCollector("other").snapshot())
+        assert dict(other.counter) == {'pck3': 2, 'pck1, pck2': 1}
+
+    def test_top_k_snapshot(self):
+        """Test set ranked K+1 in every part is the top set once the parts are merged."""
+        with mock.patch.object(SETTINGS, 'collector_top_k', 1):
+            merged = BaseCollector("ecosystem")
+            for part in range(3):
+                bc = BaseCollector("ecosystem")
+                bc.add_counts({'part{}'.format(part): 5, 'a, b': 4})
+                assert bc.counter.most_common() == [('part{}'.format(part), 5)]
+                merged.merge_snapshot(bc.snapshot())
+
+        assert merged.counter.most_common() == [('a, b', 12)]
@@ -0,0 +1,91 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test Space-Saving heavy hitter counts."""
+import random
+from collections import Counter
+from src.collector.heavy_hitters import SpaceSaving
+
+
+class TestSpaceSaving:
+    """Space-Saving test cases."""
+
+    def test_exact_under_capacity(self):
+        """Test counts are exact while there are no more items than capacity."""
+        ss = SpaceSaving(3)
+        for item in 'abacab':
+            ss.add(item)
+        ss.add('c', 4)
+
+        assert ss.most_common(2) == [('c', 5), ('a', 3)]
+        assert ss.get_error('a') == 0
+
+    def test_eviction(self):
+        """Test new item replaces the lowest count and inherits it as error."""
+        ss = SpaceSaving(2)
+        ss.add('a', 5)
+        ss.add('b', 2)
+        ss.add('b')
+        ss.add('c')
+
+        assert ss.counts == {'a': 5, 'c': 4}
+        assert ss.get_error('c') == 3
+        assert ss.get_error('b') == 0
+
+    def test_error_bounds(self):
+        """Test counts stay within documented bounds and frequent items are kept."""
+        rng = random.Random(7)
+        items = [str(int(rng.paretovariate(1.2))) for _ in range(5000)]
+        ss = SpaceSaving(20)
+        for item in items:
+            ss.add(item)
+
+        true_counts = Counter(items)
+        bound = len(items) / ss.capacity
+        assert len(ss.counts) == 20
+        assert len(ss.heap) <= 4 * ss.capacity
+        for item, count in ss.counts.items():
+            assert true_counts[item] <= count <= true_counts[item] + ss.get_error(item)
+            assert ss.get_error(item) <= bound
+        for item, count in true_counts.items():
+            if count > bound:
+                assert item in ss.counts
+        assert [i for i, _ in ss.most_common(3)] == [i for i, _ in true_counts.most_common(3)]
+
+    def test_merge(self):
+        """Test merged summaries keep an item ranked below the top in every part."""
+        rng = random.Random(11)
+        parts = []
+        for part in range(3):
+            items = ['top'] * 50 + ['x{}'.format(part)] * 70
+            items += [str(rng.randrange(50)) for _ in range(100)]
+            rng.shuffle(items)
+            parts.append(items)
+
+        merged = SpaceSaving(10)
+        for items in parts:
+            ss = SpaceSaving(10)
+            for item in items:
+                ss.add(item)
+            assert ss.most_common(2)[1][0] == 'top'
+            merged.merge(ss.counts, ss.errors)
+
+        true_counts = Counter(item for items in parts for item in items)
+        assert merged.total == sum(true_counts.values())
+        assert merged.most_common(1)[0][0] == 'top'
+        for item, count in merged.counts.items():
+            assert true_counts[item] <= count <= true_counts[item] + merged.get_error(item)
+            assert merged.get_error(item) <= merged.total / merged.capacity
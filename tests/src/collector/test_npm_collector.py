@@ -155,3 +155,15 @@ class TestNpmCollector:
         assert packages == {
             'body-parser': 1
         }
+
+    def test_collect_extracted(self):
+        """Test dependencies object extracted by the query is collected in its key order."""
+        collector = NpmCollector()
+        assert collector.collect_extracted('{"ejs":"1.0.0","body-parser":"1.9.0"}') == \
+            ('ejs', 'body-parser')
+        assert collector.collect_extracted(None) == ()
+        assert collector.collect_extracted('["ejs"]') == ()
+        packages = dict(collector.counter.most_common())
+        assert packages == {
+            'ejs, body-parser': 1
+        }
@@ -0,0 +1,67 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test binary snapshot of collector counts."""
+import struct
+import pytest
+from collections import Counter
+from src.collector.snapshot import dump_snapshot, load_snapshot, merge_snapshots
+
+
+class TestSnapshot:
+    """Snapshot test cases."""
+
+    def test_round_trip(self):
+        """Test counts are the same after dump and load."""
+        counters = {
+            'npm': Counter({'request, winston, xml2object': 3, 'ejs': 1, 'zoé': 2}),
+            'pypi': Counter({'flask, daiquiri': 1}),
+            'maven': Counter(),
+        }
+        data = dump_snapshot(counters)
+
+        assert data[:4] == b'BQCS'
+        assert load_snapshot(data) == counters
+        assert len(data) < len(str(counters))
+
+    def test_merge(self):
+        """Test merge adds counts and neither order nor grouping changes the result."""
+        a = dump_snapshot({'npm': {'ejs': 1, 'a, b': 2}})
+        b = dump_snapshot({'npm': {'a, b': 3}, 'pypi': {'flask': 1}})
+        c = dump_snapshot({'pypi': {'flask': 2, 'six': 1}})
+
+        merged = merge_snapshots(a, b, c)
+        assert merged == merge_snapshots(c, a, b)
+        assert merged == merge_snapshots(merge_snapshots(a, b), c)
+        assert merged == merge_snapshots(a, merge_snapshots(b, c))
+        assert load_snapshot(merged) == {
+            'npm': {'ejs': 1, 'a, b': 5},
+            'pypi': {'flask': 3, 'six': 1},
+        }
+
+    def test_invalid(self):
+        """Test unknown data and versions are rejected."""
+        with pytest.raises(Exception) as e:
+            load_snapshot(b'{"npm": {}}')
+
+        assert str(e.value) == 'Not a collector snapshot'
+
+        data = bytearray(dump_snapshot({}))
+        struct.pack_into('>H', data, 4, 99)
+        with pytest.raises(Exception) as e:
+            load_snapshot(bytes(data))
+
+        assert str(e.value) == 'Unsupported collector snapshot version 99'
@@ -0,0 +1,44 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Shared fixtures of the data store tests."""
+import pytest
+
+
+class MemoryStore():
+    """In memory persistence store."""
+
+    def __init__(self):
+        """Set empty object map."""
+        self.objects = {}
+
+    def read_object(self, key):
+        """Read object content, None if the object does not exist."""
+        return self.objects.get(key)
+
+    def write_object(self, key, data):
+        """Write object content."""
+        self.objects[key] = data
+
+    def delete_object(self, key):
+        """Delete object, deleting a missing object is not an error."""
+        self.objects.pop(key, None)
+
+
+@pytest.fixture
+def store():
+    """Get empty in memory persistence store."""
+    return MemoryStore()
@@ -0,0 +1,84 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test job checkpoint class."""
+import pytest
+from collections import Counter
+from src.datastore.checkpoint import JobCheckpoint, S3_CHECKPOINT_FILENAME, S3_DELTA_FILENAME
+
+
+class TestJobCheckpoint:
+    """Job checkpoint test cases."""
+
+    def test_no_checkpoint(self, store):
+        """Test fresh run has nothing to resume."""
+        checkpoint = JobCheckpoint(store)
+        assert checkpoint.load() is False
+        assert checkpoint.get_query('all') is None
+        assert checkpoint.get_ecosystem('npm') is None
+
+    def test_save_and_load(self, store):
+        """Test progress saved by one run is loaded by the next one."""
+        checkpoint = JobCheckpoint(store)
+        checkpoint.set_query('all', 'job_1', incremental=True)
+        checkpoint.set_ecosystem('npm', 3, 120, {'size': 10, 'count': 2}, Counter({'ejs': 2}))
+        checkpoint.set_download_complete()
+        checkpoint.set_parsed('npm/1_npm.zip', 'npm', Counter({'ejs': 1, 'request': 1}))
+        checkpoint.set_parsed('pypi/1_pypi.zip', 'pypi', Counter())
+        checkpoint.set_collated()
+
+        checkpoint = JobCheckpoint(store)
+        assert checkpoint.load() is True
+        assert checkpoint.get_query('all') == 'job_1'
+        assert checkpoint.state['incremental'] is True
+        assert checkpoint.state['download_complete'] is True
+        assert checkpoint.state['collated'] is True
+        assert checkpoint.get_ecosystem('npm') == {
+            'batch_index': 3,
+            'rows_done': 120,
+            'content_data': {'size': 10, 'count': 2},
+        }
+        assert checkpoint.is_parsed('npm/1_npm.zip')
+        assert checkpoint.is_parsed('pypi/1_pypi.zip')
+        assert not checkpoint.is_parsed('npm/2_npm.zip')
+        # Empty delta of the pypi batch is not written
+        assert list(checkpoint.iter_deltas()) == [
+            {'npm': {'ejs': 2}},
+            {'npm': {'ejs': 1, 'request': 1}},
+        ]
+
+    def test_missing_delta(self, store):
+        """Test resume fails when a listed delta is gone."""
+        checkpoint = JobCheckpoint(store)
+        checkpoint.set_ecosystem('npm', 2, 10, {'size': 10, 'count': 2}, Counter({'ejs': 2}))
+        del store.objects[S3_DELTA_FILENAME.format(1)]
+
+        with pytest.raises(Exception) as e:
+            list(checkpoint.iter_deltas())
+
+        assert str(e.value) == 'Missing checkpoint delta {}'.format(S3_DELTA_FILENAME.format(1))
+
+    def test_clear(self, store):
+        """Test checkpoint is removed once run is finished."""
+        checkpoint = JobCheckpoint(store)
+        checkpoint.set_query('all', 'job_1')
+        checkpoint.set_parsed('npm/1_npm.zip', 'npm', Counter({'ejs': 1}))
+        assert sorted(store.objects) == [S3_DELTA_FILENAME.format(1), S3_CHECKPOINT_FILENAME]
+
+        checkpoint.clear()
+        assert store.objects == {}
+        assert checkpoint.get_query('all') is None
+        assert JobCheckpoint(store).load() is False
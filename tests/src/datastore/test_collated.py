@@ -0,0 +1,75 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test streaming collated file read, sort, merge and write."""
+import io
+import json
+import pytest
+from src.datastore.collated import iter_collated, sort_counts, merge_counts, write_collated
+
+
+class TestCollated:
+    """Collated file test cases."""
+
+    def test_iter_collated(self):
+        """Test values split over chunks are read, unread counts are skipped."""
+        data = {
+            'maven': {'org.a:b, org.c:d': 12345, 'x': 1},
+            'npm': {'@scope/pkg, "quoted\\\\"': 7, 'zoé, 日本': 100000000000},
+            'pypi': {},
+        }
+        content = json.dumps(data, indent=2).encode('utf-8')
+
+        result = {}
+        for ecosystem, counts in iter_collated(io.BytesIO(content), chunk_size=3):
+            if ecosystem != 'maven':
+                result[ecosystem] = dict(counts)
+        assert result == {'npm': data['npm'], 'pypi': {}}
+
+        assert list(iter_collated(io.BytesIO(b' {} '))) == []
+
+    def test_iter_collated_invalid(self):
+        """Test invalid content raises value error."""
+        for content in [b'', b'[]', b'{"npm": {"a": 1', b'{"npm": {"a" 1}}']:
+            with pytest.raises(ValueError):
+                for _, counts in iter_collated(io.BytesIO(content), chunk_size=4):
+                    list(counts)
+
+    def test_sort_counts(self):
+        """Test counts over the buffer size are sorted through run files."""
+        counts = [('c', 1), ('a', 2), ('e', 3), ('b', 4), ('d', 5)]
+        assert list(sort_counts(iter(counts), 2)) == sorted(counts)
+        assert list(sort_counts(iter(counts), 10)) == sorted(counts)
+
+    def test_merge_counts(self):
+        """Test sorted counts are summed or replaced."""
+        existing = [('a', 1), ('b', 2), ('d', 4)]
+        new = [('b', 5), ('c', 3)]
+
+        assert list(merge_counts(existing, new, True)) == [('a', 1), ('b', 7), ('c', 3),
+                                                           ('d', 4)]
+        assert list(merge_counts(existing, new, False)) == [('a', 1), ('b', 5), ('c', 3),
+                                                            ('d', 4)]
+
+    def test_write_collated(self):
+        """Test written file is the JSON of the counts."""
+        fp = io.BytesIO()
+        write_collated(fp, [('npm', [('a, "b"', 1), ('zoé', 2)]), ('pypi', iter([]))])
+
+        assert fp.getvalue().decode('utf-8') == json.dumps({
+            'npm': {'a, "b"': 1, 'zoé': 2},
+            'pypi': {},
+        })
@@ -0,0 +1,145 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test persistent parse cache class."""
+import gzip
+import json
+from unittest.mock import patch
+from src.datastore.parse_cache import ParseCache
+
+BLOB_1 = 'a1' + '0' * 38
+BLOB_2 = 'a1' + 'f' * 38
+BLOB_3 = '5e' + '1' * 38
+VERSIONS = {'maven': 1, 'npm': 1, 'pypi': 2}
+
+
+class TestParseCache:
+    """Parse cache test cases."""
+
+    def test_get_missing(self, store):
+        """Test lookup of a blob that was never parsed."""
+        cache = ParseCache(store, VERSIONS)
+        assert cache.get('npm', BLOB_1) is None
+        assert cache.get('npm', None) is None
+        assert cache.get_stats() == {'hits': 0, 'misses': 1}
+
+    def test_put_and_get(self, store):
+        """Test lookup of a parsed blob."""
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_1, ['pck1', 'pck2'])
+        cache.put('npm', BLOB_2, ('pck1', 'pck2'))
+        cache.put('npm', None, ['pck3'])
+
+        assert cache.get('npm', BLOB_1) == ('pck1', 'pck2')
+        assert cache.get('npm', BLOB_2) is cache.get('npm', BLOB_1)
+        assert cache.get('maven', BLOB_1) is None
+        assert cache.get_stats() == {'hits': 3, 'misses': 1}
+
+    def test_save_and_load(self, store):
+        """Test cache is persisted across runs in sorted shards."""
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_2, ['pck2'])
+        cache.put('npm', BLOB_1, ['pck1'])
+        cache.put('pypi', BLOB_3, [])
+        cache.save()
+
+        assert sorted(store.objects.keys()) == [
+            'big-query-data/parse-cache/npm/v1/a1.jsonl.gz',
+            'big-query-data/parse-cache/npm/v1/cached_blob_ids.csv.gz',
+            'big-query-data/parse-cache/pypi/v2/5e.jsonl.gz',
+            'big-query-data/parse-cache/pypi/v2/cached_blob_ids.csv.gz',
+        ]
+        lines = gzip.decompress(
+            store.objects['big-query-data/parse-cache/npm/v1/a1.jsonl.gz']).splitlines()
+        assert [json.loads(line) for line in lines] == [[BLOB_1, ['pck1']], [BLOB_2, ['pck2']]]
+
+        cache = ParseCache(store, VERSIONS)
+        assert cache.get('npm', BLOB_1) == ('pck1',)
+        assert cache.get('npm', BLOB_2) == ('pck2',)
+        assert cache.get('pypi', BLOB_3) == ()
+
+    def test_save_keeps_existing_entries(self, store):
+        """Test updating a shard keeps entries of earlier runs."""
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_1, ['pck1'])
+        cache.save()
+
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_2, ['pck2'])
+        cache.save()
+
+        cache = ParseCache(store, VERSIONS)
+        assert cache.get('npm', BLOB_1) == ('pck1',)
+        assert cache.get('npm', BLOB_2) == ('pck2',)
+
+    def test_cached_ids(self, store):
+        """Test ids of all cached blobs are listed for the query once saved."""
+        cache = ParseCache(store, VERSIONS)
+        assert cache.get_cached_ids() is None
+
+        cache.put('npm', BLOB_2, ['pck2'])
+        cache.put('pypi', BLOB_3, [])
+        cache.save()
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_1, ['pck1'])
+        cache.save()
+
+        ids = gzip.decompress(cache.get_cached_ids()).decode('utf-8').splitlines()
+        assert ids == [BLOB_3, BLOB_1, BLOB_2]
+
+        # Nothing new to list, file is not written again
+        filename = 'big-query-data/parse-cache/npm/v1/cached_blob_ids.csv.gz'
+        del store.objects[filename]
+        cache.save()
+        assert filename not in store.objects
+
+    def test_parser_version(self, store):
+        """Test blobs cached by another parser version are neither used nor listed."""
+        cache = ParseCache(store, VERSIONS)
+        cache.put('npm', BLOB_1, ['pck1'])
+        cache.put('pypi', BLOB_3, ['pck3'])
+        cache.save()
+
+        cache = ParseCache(store, dict(VERSIONS, npm=2))
+        assert cache.get('npm', BLOB_1) is None
+        assert cache.get('pypi', BLOB_3) == ('pck3',)
+        assert cache.get_version() == 'maven_v1_npm_v2_pypi_v2'
+        ids = gzip.decompress(cache.get_cached_ids()).decode('utf-8').splitlines()
+        assert ids == [BLOB_3]
+
+    def test_loaded_shards(self, store):
+        """Test least recently used shard is written back and dropped once over the limit."""
+        cache = ParseCache(store, VERSIONS, max_shards=1)
+        cache.put('npm', BLOB_1, ['pck1'])
+        cache.put('npm', BLOB_3, ['pck3'])
+        assert list(cache.shards) == [('npm', '5e')]
+        assert 'big-query-data/parse-cache/npm/v1/a1.jsonl.gz' in store.objects
+        assert cache.get('npm', BLOB_1) == ('pck1',)
+
+        # Ids are listed once all shards holding them are saved
+        assert cache.get_cached_ids() is None
+        cache.flush()
+        assert cache.shards == {}
+        assert sorted(store.objects) == [
+            'big-query-data/parse-cache/npm/v1/5e.jsonl.gz',
+            'big-query-data/parse-cache/npm/v1/a1.jsonl.gz',
+        ]
+        assert cache.get('npm', BLOB_3) == ('pck3',)
+
+        with patch('src.datastore.parse_cache.CACHED_IDS_SAVE_COUNT', 2):
+            cache.flush()
+        ids = gzip.decompress(cache.get_cached_ids()).decode('utf-8').splitlines()
+        assert ids == [BLOB_3, BLOB_1]
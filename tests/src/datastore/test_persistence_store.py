@@ -15,11 +15,15 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Test persistence store class."""
+import io
+import json
+import zipfile
+import tempfile
 import pytest
 import unittest
 from unittest import mock
 from unittest.mock import patch
-from src.datastore.persistence_store import PersistenceStore
+from src.datastore.persistence_store import PersistenceStore, S3MultipartWriter, S3ObjectReader
 
 
 class S3NotConnected(mock.Mock):
@@ -49,47 +53,181 @@ class S3NewUpload(S3NotConnected):
         """Mock function to check if object exists."""
         return False
 
-    def write_json_file(self, fname, content):
-        """Mock to write json file."""
-        pass
 
-
-class S3ExistingEmptyUpload(S3NewUpload):
-    """S3 class with existing file containing no content."""
+class S3ExistingUpload(S3NewUpload):
+    """S3 class with existing file."""
 
     def object_exists(self, fname):
         """Mock function to check if object exists."""
         return True
 
-    def read_json_file(self, fname):
-        """Read json file mock function."""
-        return {}
-
-
-class S3ExistingUpload(S3ExistingEmptyUpload):
-    """S3 class with existing file containing some content."""
-
-    def read_json_file(self, fname):
-        """Read json file mock function."""
-        return {
-            'maven': {
-                'pck1, pck2, pck3': 5,
-                'pck3, pck56': 20,
-                'pck2, pck4, pck7': 10
-            },
-            'npm': {
-                'pck1, pck2, pck3': 22,
-                'pck2, pck4, pck7': 89
-            },
-            'pypi': {
-                'pck3, pck56': 65,
-                'pck2, pck4, pck7': 110
-            }
-        }
 
-    def write_json_file(self, fname, content):
-        """Mock to write json file."""
-        pass
+EXISTING_DATA = {
+    'maven': {
+        'pck1, pck2, pck3': 5,
+        'pck3, pck56': 20,
+        'pck2, pck4, pck7': 10
+    },
+    'npm': {
+        'pck1, pck2, pck3': 22,
+        'pck2, pck4, pck7': 89
+    },
+    'pypi': {
+        'pck3, pck56': 65,
+        'pck2, pck4, pck7': 110
+    }
+}
+
+
+class MultipartClient():
+    """Mock boto client for multipart uploads."""
+
+    def __init__(self):
+        """Set empty upload state."""
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+
+    def create_multipart_upload(self, Bucket, Key):
+        """Start upload."""
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        """Upload part."""
+        self.parts[PartNumber] = Body
+        return {'ETag': 'etag-{}'.format(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        """Complete upload."""
+        self.completed = MultipartUpload
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        """Abort upload."""
+        self.aborted = True
+
+
+class CollatedClient(MultipartClient):
+    """Mock boto client streaming existing object and uploading new one in parts."""
+
+    def __init__(self, content=b''):
+        """Set existing object content."""
+        super().__init__()
+        self.content = content
+
+    def get_object(self, Bucket, Key):
+        """Get object content stream."""
+        return {'Body': io.BytesIO(self.content)}
+
+    def get_written(self):
+        """Get content of completed upload."""
+        return b''.join(self.parts[part['PartNumber']]
+                        for part in self.completed['Parts'])
+
+
+class RangeClient():
+    """Mock boto client for ranged reads."""
+
+    def __init__(self, content):
+        """Set object content."""
+        self.content = content
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        """Get object metadata."""
+        return {'ContentLength': len(self.content)}
+
+    def get_object(self, Bucket, Key, Range):
+        """Get object content range."""
+        self.ranges.append(Range)
+        start, end = Range[len('bytes='):].split('-')
+        return {'Body': io.BytesIO(self.content[int(start):int(end) + 1])}
+
+
+class TestS3ObjectReader(unittest.TestCase):
+    """Unit test cases for ranged object reader."""
+
+    def test_read(self):
+        """Read object in ranges."""
+        client = RangeClient(b'0123456789')
+        reader = S3ObjectReader(client, 'bucket', 'key')
+
+        assert reader.read(4) == b'0123'
+        assert reader.seek(-3, io.SEEK_END) == 7
+        assert reader.read(10) == b'789'
+        assert reader.read(10) == b''
+        reader.seek(2)
+        reader.seek(1, io.SEEK_CUR)
+        assert reader.tell() == 3
+        assert reader.read(2) == b'34'
+        assert client.ranges == ['bytes=0-3', 'bytes=7-9', 'bytes=3-4']
+
+    def test_zip_member(self):
+        """Read zip member through buffered reader."""
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            archive.writestr('npm/1_package.json', '{}')
+
+        reader = io.BufferedReader(S3ObjectReader(RangeClient(content.getvalue()), 'b', 'k'))
+        with zipfile.ZipFile(reader) as archive:
+            assert archive.read('npm/1_package.json') == b'{}'
+
+
+class TestS3MultipartWriter(unittest.TestCase):
+    """Unit test cases for multipart writer."""
+
+    def test_write_parts(self):
+        """Full parts are uploaded while writing, rest on close."""
+        client = MultipartClient()
+        writer = S3MultipartWriter(client, 'bucket', 'key', 4)
+        writer.write(b'abc')
+        assert client.parts == {}
+        writer.write(b'defghij')
+        assert client.parts == {1: b'abcd', 2: b'efgh'}
+        writer.close()
+
+        assert client.parts[3] == b'ij'
+        assert client.completed == {'Parts': [
+            {'ETag': 'etag-1', 'PartNumber': 1},
+            {'ETag': 'etag-2', 'PartNumber': 2},
+            {'ETag': 'etag-3', 'PartNumber': 3},
+        ]}
+        assert writer.size == 10
+
+    def test_write_empty(self):
+        """Empty object is uploaded as single empty part."""
+        client = MultipartClient()
+        writer = S3MultipartWriter(client, 'bucket', 'key', 4)
+        writer.close()
+        writer.close()
+
+        assert client.parts == {1: b''}
+        assert len(client.completed['Parts']) == 1
+
+    def test_abort(self):
+        """Failed completion aborts the upload."""
+        client = MultipartClient()
+        client.complete_multipart_upload = mock.Mock(side_effect=Exception('failed'))
+        writer = S3MultipartWriter(client, 'bucket', 'key', 4)
+        writer.write(b'abc')
+
+        with pytest.raises(Exception) as e:
+            writer.close()
+
+        assert str(e.value) == 'failed'
+        assert client.aborted is True
+
+    def test_abort_failed_part(self):
+        """Failed part upload aborts the upload."""
+        client = MultipartClient()
+        client.upload_part = mock.Mock(side_effect=Exception('failed'))
+        writer = S3MultipartWriter(client, 'bucket', 'key', 4)
+
+        with pytest.raises(Exception) as e:
+            writer.write(b'abcdef')
+
+        assert str(e.value) == 'failed'
+        assert client.aborted is True
+        assert writer.upload_id is None
 
 
 class TestPersistenceStore(unittest.TestCase):
@@ -117,44 +255,192 @@ class TestPersistenceStore(unittest.TestCase):
 
     def test_upload_new_file(self):
         """Update data to a new file."""
-        ps = PersistenceStore(s3_client=S3NewUpload())
+        client = CollatedClient()
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=client)
 
-        try:
-            ps.update({}, 'filename.json')
-        except Exception:
-            assert False, 'Exception raised'
+        ps.update({'npm': [('a', 2), ('b', 1)], 'pypi': []}, 'filename.json')
+        assert client.get_written() == b'{"npm": {"a": 2, "b": 1}, "pypi": {}}'
 
     def test_upload_existing_empty_file(self):
         """Upload new data with empty data in existing file."""
-        ps = PersistenceStore(s3_client=S3ExistingEmptyUpload())
+        client = CollatedClient()
+        ps = PersistenceStore(s3_client=S3ExistingUpload(), transfer_client=client)
 
         with pytest.raises(Exception) as e:
             ps.update({}, 'filename.json')
 
         assert str(e.value) == 'Unable to get the json data path: ' \
                                'developer-analytics-audit-report/filename.json'
+        assert client.aborted is True
 
     def test_upload_existing_file(self):
-        """Upload data in S3 with existing data."""
-        ps = PersistenceStore(s3_client=S3ExistingUpload())
-
-        try:
-            new_data = {
-                'maven': {
-                    'pck1, pck2, pck3': 7,
-                    'pck30, pck6': 20,
-                    'pck2, pck4, pck7': 12
-                },
-                'npm': {
-                    'pck1, pck2, pck3': 45,
-                    'pck77': 23,
-                    'pck2, pck4, pck7': 99
-                },
-                'pypi': {
-                    'pck3, pck56': 65,
-                    'pck2, pck4, pck7': 110
-                }
+        """Upload data in S3 with existing data, new counts replace existing ones."""
+        client = CollatedClient(json.dumps(EXISTING_DATA).encode('utf-8'))
+        ps = PersistenceStore(s3_client=S3ExistingUpload(), transfer_client=client)
+
+        new_data = {
+                'maven': [
+                    ('pck1, pck2, pck3', 7),
+                    ('pck2, pck4, pck7', 12),
+                    ('pck30, pck6', 20)
+                ],
+                'npm': [
+                    ('pck1, pck2, pck3', 45),
+                    ('pck2, pck4, pck7', 99),
+                    ('pck77', 23)
+                ],
+                'pypi': [
+                    ('pck2, pck4, pck7', 110),
+                    ('pck3, pck56', 65)
+                ]
             }
-            ps.update(new_data, 'filename.json')
-        except Exception:
-            assert False, 'Exception raised'
+        ps.update(new_data, 'filename.json')
+
+        data = json.loads(client.get_written())
+        assert data['maven'] == {
+            'pck1, pck2, pck3': 7,
+            'pck2, pck4, pck7': 12,
+            'pck30, pck6': 20,
+            'pck3, pck56': 20
+        }
+        assert list(data['npm'].items()) == [
+            ('pck1, pck2, pck3', 45),
+            ('pck2, pck4, pck7', 99),
+            ('pck77', 23)
+        ]
+        assert data['pypi'] == EXISTING_DATA['pypi']
+
+    def test_read_missing_object(self):
+        """Read object that does not exist."""
+        ps = PersistenceStore(s3_client=S3NewUpload())
+        assert ps.read_object('missing.bin') is None
+
+    def test_read_and_write_object(self):
+        """Read and write object content."""
+        transfer_client = mock.Mock()
+        transfer_client.get_object.return_value = {'Body': io.BytesIO(b'data')}
+        ps = PersistenceStore(s3_client=S3ExistingUpload(), transfer_client=transfer_client)
+
+        assert ps.read_object('existing.bin') == b'data'
+        ps.write_object('new.bin', b'new data')
+        transfer_client.put_object.assert_called_once_with(
+            Bucket='developer-analytics-audit-report', Key='new.bin', Body=b'new data')
+
+    def test_delete_object(self):
+        """Delete object."""
+        transfer_client = mock.Mock()
+        ps = PersistenceStore(s3_client=S3ExistingUpload(), transfer_client=transfer_client)
+        ps.delete_object('old.bin')
+        transfer_client.delete_object.assert_called_once_with(
+            Bucket='developer-analytics-audit-report', Key='old.bin')
+
+    def test_upload_existing_file_additive(self):
+        """Add counts of existing data to new data."""
+        client = CollatedClient(json.dumps(EXISTING_DATA).encode('utf-8'))
+        ps = PersistenceStore(s3_client=S3ExistingUpload(), transfer_client=client)
+        new_data = {
+            'maven': [('pck1, pck2, pck3', 7)],
+            'npm': [('pck77', 23)],
+            'pypi': []
+        }
+        ps.update(new_data, 'filename.json', additive=True)
+
+        data = json.loads(client.get_written())
+        assert data['maven'] == {
+            'pck1, pck2, pck3': 12,
+            'pck3, pck56': 20,
+            'pck2, pck4, pck7': 10
+        }
+        assert data['npm'] == {
+            'pck77': 23,
+            'pck1, pck2, pck3': 22,
+            'pck2, pck4, pck7': 89
+        }
+        assert data['pypi'] == {
+            'pck3, pck56': 65,
+            'pck2, pck4, pck7': 110
+        }
+
+    def test_open_multipart_upload(self):
+        """Open multipart upload on S3 client."""
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=MultipartClient())
+
+        writer = ps.open_multipart_upload('key')
+        assert writer.upload_id == 'upload-1'
+        assert writer.bucket_name == 'developer-analytics-audit-report'
+
+    def test_open_object(self):
+        """Open object for streamed read."""
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=RangeClient(b'data'))
+
+        reader = ps.open_object('key', seekable=True)
+        assert reader.seekable() is True
+        assert reader.read() == b'data'
+
+    @patch('src.datastore.persistence_store.boto3')
+    def test_pooled_transfer_client(self, _boto3):
+        """Transfer client is created once and reused."""
+        ps = PersistenceStore(s3_client=S3NewUpload())
+        client = ps._get_client()
+
+        assert ps._get_client() is client
+        _boto3.session.Session.return_value.client.assert_called_once()
+        config = _boto3.session.Session.return_value.client.call_args[1]['config']
+        assert config.max_pool_connections == 20
+        assert _boto3.session.Session.return_value.client.call_args[1]['endpoint_url'] is None
+
+    def test_s3_delete_folder(self):
+        """Delete objects of a folder page by page with the transfer client."""
+        transfer_client = mock.Mock()
+        transfer_client.list_objects_v2.side_effect = [
+            {'Contents': [{'Key': 'folder/a'}, {'Key': 'folder/b'}], 'IsTruncated': True,
+             'NextContinuationToken': 'token'},
+            {'Contents': [{'Key': 'folder/c'}], 'IsTruncated': False},
+        ]
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=transfer_client)
+
+        assert ps.s3_delete_folder('folder/') == 3
+        assert transfer_client.list_objects_v2.call_args_list == [
+            mock.call(Bucket='developer-analytics-audit-report', Prefix='folder/'),
+            mock.call(Bucket='developer-analytics-audit-report', Prefix='folder/',
+                      ContinuationToken='token'),
+        ]
+        assert transfer_client.delete_objects.call_args_list[1] == mock.call(
+            Bucket='developer-analytics-audit-report',
+            Delete={'Objects': [{'Key': 'folder/c'}], 'Quiet': True})
+
+    def test_s3_delete_empty_folder(self):
+        """Delete folder without objects."""
+        transfer_client = mock.Mock()
+        transfer_client.list_objects_v2.return_value = {'KeyCount': 0, 'IsTruncated': False}
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=transfer_client)
+
+        assert ps.s3_delete_folder('folder/') == 0
+        transfer_client.delete_objects.assert_not_called()
+
+    def test_upload_and_download_file(self):
+        """Upload and download file with concurrent transfer config."""
+        transfer_client = mock.Mock()
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=transfer_client)
+        assert ps.transfer_config.max_concurrency == 10
+
+        with tempfile.NamedTemporaryFile() as fp:
+            fp.write(b'data')
+            fp.flush()
+            ps.upload_file(fp.name, 'target.zip')
+            ps.download_file('target.zip', fp.name)
+
+        transfer_client.upload_file.assert_called_once_with(
+            fp.name, 'developer-analytics-audit-report', 'target.zip',
+            Config=ps.transfer_config)
+        transfer_client.download_file.assert_called_once_with(
+            'developer-analytics-audit-report', 'target.zip', fp.name,
+            Config=ps.transfer_config)
+
+    def test_download_file_error(self):
+        """Download errors are logged, not raised."""
+        transfer_client = mock.Mock()
+        transfer_client.download_file.side_effect = Exception('missing')
+        ps = PersistenceStore(s3_client=S3NewUpload(), transfer_client=transfer_client)
+
+        assert ps.download_file('missing.zip', '/tmp/missing.zip') is None
@@ -0,0 +1,68 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test blob watermark class."""
+import io
+import gzip
+from src.datastore.watermark import BlobWatermark, S3_WATERMARK_FILENAME
+
+
+def _read_ids(data):
+    """Read ids from gzipped csv content."""
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read().decode('utf-8').splitlines()
+
+
+class TestBlobWatermark:
+    """Blob watermark test cases."""
+
+    def test_first_run(self, store):
+        """Test watermark of first run is empty."""
+        watermark = BlobWatermark(store)
+        assert watermark.get_seen_ids() is None
+
+    def test_save(self, store):
+        """Test ids are saved sorted and without duplicates."""
+        watermark = BlobWatermark(store)
+        for blob_id in ['c3', 'a1', None, 'b2', 'a1']:
+            watermark.add(blob_id)
+        watermark.save()
+
+        assert _read_ids(store.objects[S3_WATERMARK_FILENAME]) == ['a1', 'b2', 'c3']
+        assert watermark.get_seen_ids() == store.objects[S3_WATERMARK_FILENAME]
+        assert len(watermark.new_ids) == 0
+
+    def test_update(self, store):
+        """Test ids of a whole batch are added at once."""
+        watermark = BlobWatermark(store)
+        watermark.update(['b2', None, 'a1', ''])
+        watermark.save()
+
+        assert _read_ids(store.objects[S3_WATERMARK_FILENAME]) == ['a1', 'b2']
+
+    def test_save_merges_earlier_runs(self, store):
+        """Test ids of current run are merged into the stored ones."""
+        watermark = BlobWatermark(store)
+        watermark.add('b2')
+        watermark.add('d4')
+        watermark.save()
+
+        watermark = BlobWatermark(store)
+        watermark.add('a1')
+        watermark.add('d4')
+        watermark.add('c3')
+        watermark.save()
+
+        assert _read_ids(store.objects[S3_WATERMARK_FILENAME]) == ['a1', 'b2', 'c3', 'd4']
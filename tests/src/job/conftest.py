@@ -0,0 +1,173 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Shared mocks and fixtures of the data job tests."""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from unittest import mock
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+
+
+@contextmanager
+def work_directory(**settings):
+    """Point local working directory at a temporary directory while settings are patched."""
+    work_dir = tempfile.mkdtemp()
+    patches = [patch.object(SETTINGS, 'local_working_directory', work_dir)]
+    patches += [patch.object(SETTINGS, name, value) for name, value in settings.items()]
+    try:
+        for settings_patch in patches:
+            settings_patch.start()
+        yield work_dir
+    finally:
+        for settings_patch in reversed(patches):
+            settings_patch.stop()
+        shutil.rmtree(work_dir)
+
+
+class S3Object():
+    """S3 object."""
+
+    def __init__(self, key):
+        """Set object key."""
+        self.key = key
+
+
+class MockPersistenceStore(mock.Mock):
+    """Mocks persistence storage."""
+
+    def update(self, data, filename='collated.json', additive=False):
+        """Upload s3 bucket."""
+        return True
+
+    def list_bucket_objects(self, prefix=None):
+        """List all the objects in bucket."""
+        return [
+            S3Object('big-query-data/manifest-data-zip/maven/1_maven.zip'),
+            S3Object('big-query-data/manifest-data-zip/npm/1_npm.zip'),
+            S3Object('big-query-data/manifest-data-zip/pypi/1_pypi.zip'),
+            S3Object('big-query-data/manifest-data-zip/pypi/1_pypi.txt'),
+            S3Object('big-query-data/manifest-data-zip/noeco/1_noco.zip'),
+        ]
+
+
+class MockBigquery(mock.Mock):
+    """Mocks Google's Big Query Runner."""
+
+    def run(self, query, destination=None, expiration_hours=None):
+        """Run the bigquery synchronously."""
+        return 1234
+
+    def get_result(self, start_index=0, max_results=None, fields=None):
+        """Get last query results."""
+        bigquery_data = []
+
+        with open('tests/data/pom.xml', 'r') as f:
+            bigquery_data.append({
+                'path': 'tests/data/pom.xml',
+                'content': f.read(),
+            })
+
+        with open('tests/data/package.json', 'r') as f:
+            bigquery_data.append({
+                'path': 'tests/data/package.json',
+                'content': f.read(),
+            })
+
+        with open('tests/data/requirements.txt', 'r') as f:
+            bigquery_data.append({
+                'path': 'tests/data/requirements.txt',
+                'content': f.read(),
+            })
+
+        bigquery_data.append({
+            'path': 'tests/data/invalid.file',
+            'content': '',
+        })
+
+        bigquery_data.append({
+            'path': 'tests/data/invalid.file',
+            'content': 'dummy_content',
+        })
+
+        return bigquery_data
+
+    def get_job_stats(self):
+        """Get statistics of the last query job."""
+        return {'job_id': 1234, 'total_bytes_processed': 1024}
+
+    def dry_run(self, query):
+        """Get estimated bytes of the query."""
+        return 2048 if 'package.json' in query else 1024
+
+
+class EcosystemBigquery(MockBigquery):
+    """Mocks Big Query Runner returning only rows matched by the query of an ecosystem."""
+
+    queries = []
+
+    def __init__(self, *args, **kwargs):
+        """Create a separate runner per query."""
+        super().__init__(*args, **kwargs)
+        self.query = None
+
+    def run(self, query, destination=None, expiration_hours=None):
+        """Remember the query."""
+        self.query = query
+        EcosystemBigquery.queries.append(query)
+        return 1234
+
+    def get_result(self, start_index=0, max_results=None, fields=None):
+        """Get rows of manifests the query asks for."""
+        return [row for row in super().get_result()
+                if "LIKE '%/{}'".format(os.path.basename(row['path'])) in self.query]
+
+
+@pytest.fixture
+def bigquery():
+    """Replace Big Query runner of the job by a mock, yield the mock class."""
+    with patch('src.job.query_runner.Bigquery', new=MockBigquery):
+        yield MockBigquery
+
+
+@pytest.fixture
+def ecosystem_bigquery():
+    """Replace Big Query runner by a mock matching rows to the ecosystem query."""
+    EcosystemBigquery.queries = []
+    with patch('src.job.query_runner.Bigquery', new=EcosystemBigquery):
+        yield EcosystemBigquery
+
+
+@pytest.fixture
+def persistence_store():
+    """Replace persistence store of the job by a mock."""
+    with patch('src.job.data_job.PersistenceStore', new_callable=MockPersistenceStore) as store:
+        yield store
+
+
+@pytest.fixture(name='work_directory')
+def work_directory_fixture():
+    """Get context manager patching settings with a temporary working directory."""
+    return work_directory
+
+
+@pytest.fixture(name='s3_object')
+def s3_object_fixture():
+    """Get S3 object factory."""
+    return S3Object
@@ -0,0 +1,89 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test parsing of staged manifest batches."""
+import io
+import zipfile
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+from src.job.data_job import DataJob
+from src.job.batch_parser import get_staged_blob_id, read_zip_records, parse_batch_worker
+from src.collector.ecosystem import get_collector
+
+
+class TestBatchParser:
+    """Unit test cases for parsing of staged batches."""
+
+    def test_get_staged_blob_id(self):
+        """Test blob id is read out of staged file names."""
+        assert get_staged_blob_id('/tmp/1_unzip_dir/npm/7_abc123_package.json') == 'abc123'
+        assert get_staged_blob_id('/tmp/1_unzip_dir/npm/7_package.json') is None
+
+    def test_read_zip_records(self):
+        """Test zip batch members are read without extracting them."""
+        fileobj = io.BytesIO()
+        with zipfile.ZipFile(fileobj, 'w') as archive:
+            archive.writestr('npm/', '')
+            archive.writestr('npm/1_a1b2_package.json', '{"name": "pkg"}\r\n')
+            archive.writestr('npm/2_package.json', '{}')
+            archive.writestr('npm/3_notes.txt', 'notes')
+
+        assert list(read_zip_records(io.BytesIO(fileobj.getvalue()))) == [
+            ('npm/1_a1b2_package.json', '{"name": "pkg"}\n', 'a1b2'),
+            ('npm/2_package.json', '{}', None),
+            ('npm/3_notes.txt', None, None),
+        ]
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_parse_stream_read(self, s3_object):
+        """Test staged zip batches are read straight from S3."""
+        fileobj = io.BytesIO()
+        with zipfile.ZipFile(fileobj, 'w') as archive:
+            with open('tests/data/package.json', 'r') as fp:
+                archive.writestr('npm/1_package.json', fp.read())
+
+        dj = DataJob()
+        dj.data_store.open_object.side_effect = lambda key, seekable: io.BytesIO(
+            fileobj.getvalue())
+        with patch.object(SETTINGS, 'staging_stream_read', True), \
+                patch.object(dj.data_store, 'list_bucket_objects', return_value=[
+                    s3_object('big-query-data/manifest-data-zip/npm/1_npm.zip')]):
+            dj._parse()
+
+        dj.data_store.download_file.assert_not_called()
+        dj.data_store.open_object.assert_called_once_with(
+            'big-query-data/manifest-data-zip/npm/1_npm.zip', seekable=True)
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
+
+    @patch('src.job.batch_parser.PersistenceStore')
+    def test_parse_batch_worker_top_k(self, _ps):
+        """Test set ranked K+1 in every batch is the top set once worker counts are merged."""
+        def parse_batch(_data_store, collector, index, _ecosystem, _object_key):
+            for packages in [['ejs{}'.format(index)]] * 5 + [['a']] * 4:
+                collector.collect(packages)
+            return []
+
+        with patch.object(SETTINGS, 'collector_top_k', 1), \
+                patch('src.job.batch_parser.parse_batch', side_effect=parse_batch):
+            collector = get_collector('npm')
+            for index in range(1, 4):
+                counter, _, _ = parse_batch_worker(index, 'npm', 'npm/{}_npm.zip'.format(index))
+                assert counter == {'ejs{}'.format(index): 5, 'a': 4}
+                collector.add_counts(counter)
+
+        assert collector.counter.most_common() == [('a', 12)]
@@ -0,0 +1,160 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test staging of manifest batches."""
+import io
+import os
+import zipfile
+from unittest.mock import patch
+import pytest
+from src.job.data_job import DataJob
+from src.job.staging import read_packed_batch
+
+
+class TestBatchStager:
+    """Unit test cases for staging of manifest batches."""
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_big_query_direct_processing_with_staging(self, work_directory):
+        """Test data job run in direct mode with staging as side output."""
+        dj = DataJob(direct=True, stage=True)
+        assert dj.stage is True
+
+        with work_directory(), \
+                patch.object(dj.stager, 'stage') as stage_content, \
+                patch.object(dj, '_parse') as parse:
+            dj.run()
+            assert stage_content.call_count == 3
+            parse.assert_not_called()
+
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_packed_staging(self, s3_object, work_directory):
+        """Test manifests staged in packed batches are parsed back."""
+        uploads = {}
+
+        def upload_file(src, target):
+            with open(src, 'rb') as fp:
+                uploads[target] = fp.read()
+
+        def download_file(src, target):
+            with open(target, 'wb') as fp:
+                fp.write(uploads[src])
+
+        with work_directory(staging_format='packed') as work_dir:
+            dj = DataJob()
+            dj.data_store.upload_file.side_effect = upload_file
+            dj.data_store.download_file.side_effect = download_file
+            dj._get_big_query_data()
+
+            assert sorted(uploads.keys()) == [
+                'big-query-data/manifest-data-zip/maven/1_maven.jsonl.gz',
+                'big-query-data/manifest-data-zip/npm/1_npm.jsonl.gz',
+                'big-query-data/manifest-data-zip/pypi/1_pypi.jsonl.gz',
+            ]
+            assert not os.listdir(os.path.join(work_dir, 'npm'))
+
+            with patch.object(dj.data_store, 'list_bucket_objects',
+                              return_value=[s3_object(key) for key in uploads]):
+                dj._parse()
+
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
+        assert dj.stager.batch_data['npm']['batch_index'] == 2
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_packed_staging_stream_upload(self, work_directory):
+        """Test packed batches are streamed to S3 without local files."""
+        uploads = {}
+
+        class Upload(io.BytesIO):
+            """Multipart upload stand-in."""
+
+            def __init__(self, key):
+                """Set object key."""
+                super().__init__()
+                self.key = key
+
+            def close(self):
+                """Complete upload."""
+                uploads[self.key] = self.getvalue()
+                super().close()
+
+        with work_directory(staging_format='packed', staging_stream_upload=True) as work_dir:
+            dj = DataJob()
+            dj.data_store.open_multipart_upload.side_effect = Upload
+            dj._get_big_query_data()
+
+            assert not os.listdir(os.path.join(work_dir, 'npm'))
+
+        dj.data_store.upload_file.assert_not_called()
+        records = list(read_packed_batch(io.BytesIO(
+            uploads['big-query-data/manifest-data-zip/npm/1_npm.jsonl.gz'])))
+        assert [r['path'] for r in records] == ['tests/data/package.json']
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_stream_upload_of_zip_batches(self, work_directory):
+        """Test zip batches can not be streamed to S3."""
+        with work_directory(staging_stream_upload=True), pytest.raises(Exception) as e:
+            DataJob()
+
+        assert str(e.value) == 'STAGING_STREAM_UPLOAD requires packed STAGING_FORMAT'
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_failed_stream_upload(self, bigquery, work_directory):
+        """Test streamed uploads of batches being written are aborted when the run fails."""
+        def get_result(start_index=0, max_results=None, fields=None):
+            yield {'id': 'a1', 'path': 'a/package.json', 'content': '{}'}
+            raise Exception('Connection reset')
+
+        with work_directory(staging_format='packed', staging_stream_upload=True), \
+                patch.object(bigquery, 'get_result', side_effect=get_result), \
+                pytest.raises(Exception) as e:
+            dj = DataJob()
+            dj._get_big_query_data()
+
+        assert str(e.value) == 'Connection reset'
+
+        upload = dj.data_store.open_multipart_upload.return_value
+        upload.abort.assert_called_once_with()
+        upload.close.assert_not_called()
+        assert dj.stager.packed_writers == {}
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    @patch('src.job.batch_stager.CONTENT_BATCH_SIZE', 1)
+    def test_background_upload(self, work_directory):
+        """Test zip batches are compressed and uploaded in background."""
+        uploads = {}
+
+        def upload_file(src, target):
+            with zipfile.ZipFile(src) as archive:
+                uploads[target] = archive.namelist()
+
+        with work_directory(max_inflight_batches=1) as work_dir:
+            dj = DataJob()
+            dj.data_store.upload_file.side_effect = upload_file
+            dj._get_big_query_data()
+
+            assert sorted(os.listdir(work_dir)) == ['maven', 'npm', 'pypi']
+
+        assert uploads == {
+            'big-query-data/manifest-data-zip/maven/1_maven.zip': ['1_pom.xml'],
+            'big-query-data/manifest-data-zip/npm/1_npm.zip': ['1_package.json'],
+            'big-query-data/manifest-data-zip/pypi/1_pypi.zip': ['1_requirements.txt'],
+        }
+        assert dj.stager.batch_data['npm'] == {'batch_index': 2, 'size': 0}
@@ -15,112 +15,112 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Test data job class."""
-import unittest
-from unittest import mock
+import os
 from unittest.mock import patch
+import pytest
+from concurrent.futures import ThreadPoolExecutor
 from src.job.data_job import DataJob
 
 
-class S3Object():
-    """S3 object."""
-
-    def __init__(self, key):
-        """Set object key."""
-        self.key = key
-
-
-class MockPersistenceStore(mock.Mock):
-    """Mocks persistence storage."""
-
-    def update(self, data, filename='collated.json'):
-        """Upload s3 bucket."""
-        return True
-
-    def list_bucket_objects(self, prefix=None):
-        """List all the objects in bucket."""
-        return [
-            S3Object('big-query-data/manifest-data-zip/maven/1_maven.zip'),
-            S3Object('big-query-data/manifest-data-zip/npm/1_npm.zip'),
-            S3Object('big-query-data/manifest-data-zip/pypi/1_pypi.zip'),
-            S3Object('big-query-data/manifest-data-zip/pypi/1_pypi.txt'),
-            S3Object('big-query-data/manifest-data-zip/noeco/1_noco.zip'),
-        ]
-
-
-class MockBigquery(mock.Mock):
-    """Mocks Google's Big Query Runner."""
-
-    def run(self, query):
-        """Run the bigquery synchronously."""
-        return 1234
-
-    def get_result(self):
-        """Get last query results."""
-        bigquery_data = []
-
-        with open('tests/data/pom.xml', 'r') as f:
-            bigquery_data.append({
-                'path': 'tests/data/pom.xml',
-                'content': f.read(),
-            })
-
-        with open('tests/data/package.json', 'r') as f:
-            bigquery_data.append({
-                'path': 'tests/data/package.json',
-                'content': f.read(),
-            })
-
-        with open('tests/data/requirements.txt', 'r') as f:
-            bigquery_data.append({
-                'path': 'tests/data/requirements.txt',
-                'content': f.read(),
-            })
-
-        bigquery_data.append({
-            'path': 'tests/data/invalid.file',
-            'content': '',
-        })
-
-        bigquery_data.append({
-            'path': 'tests/data/invalid.file',
-            'content': 'dummy_content',
-        })
-
-        return bigquery_data
-
-
-class TestDataJob(unittest.TestCase):
+class TestDataJob:
     """Unite test cases for big query class."""
 
-    @patch('src.job.data_job.Bigquery', new_callable=MockBigquery)
-    @patch('src.job.data_job.PersistenceStore', new_callable=MockPersistenceStore)
-    def test_big_query(self, _bq, _ps):
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_big_query(self):
         """Test data job init."""
         dj = DataJob()
         assert dj.collectors is not None
         assert len(dj.collectors) == 3
         assert dj.data_store is not None
 
-    @patch('src.job.data_job.Bigquery', new_callable=MockBigquery)
-    @patch('src.job.data_job.PersistenceStore', new_callable=MockPersistenceStore)
-    @patch('src.job.data_job.unpack_archive', return_value=None)
-    @patch('src.job.data_job.os.listdir', return_value=[])
-    @patch('src.job.data_job.os.makedirs', return_value=None)
-    @patch('src.job.data_job.rmtree', return_value=None)
-    def test_big_query_data_processing(self, _bq, _ps, _ua, _ld, _mk, _rt):
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_big_query_data_processing(self, s3_object, work_directory):
         """Test data job run."""
-        dj = DataJob()
-        dj.run()
+        uploads = {}
+
+        def upload_file(src, target):
+            with open(src, 'rb') as fp:
+                uploads[target] = fp.read()
+
+        def download_file(src, target):
+            with open(target, 'wb') as fp:
+                fp.write(uploads[src])
+
+        with work_directory() as work_dir:
+            dj = DataJob()
+            dj.data_store.upload_file.side_effect = upload_file
+            dj.data_store.download_file.side_effect = download_file
+            dj.data_store.list_bucket_objects = lambda prefix=None: [
+                s3_object(key) for key in sorted(uploads)]
+            dj.run()
+
+            assert sorted(os.listdir(work_dir)) == ['maven', 'npm', 'pypi']
+            assert not os.listdir(os.path.join(work_dir, 'npm'))
+
+        assert sorted(uploads) == [
+            'big-query-data/manifest-data-zip/maven/1_maven.zip',
+            'big-query-data/manifest-data-zip/npm/1_npm.zip',
+            'big-query-data/manifest-data-zip/pypi/1_pypi.zip',
+        ]
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
 
-        for ecosystem, object in dj.collectors.items():
-            if ecosystem == 'maven':
-                maven_data = dict(object.counter.most_common())
-                assert maven_data == {}
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_big_query_direct_processing(self):
+        """Test data job run in direct mode without staging."""
+        dj = DataJob(direct=True)
+        assert dj.stage is False
+        assert dj.stager is None
 
-            elif ecosystem == 'pypi':
-                pypi_data = dict(object.counter.most_common())
-                assert pypi_data == {}
+        dj.run()
 
-            elif ecosystem == 'npm':
-                npm_data = dict(object.counter.most_common())
-                assert npm_data == {}
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
+        assert dj.ecosystemContentData['npm']['count'] == 1
+        assert dj.queries.query_stats == [{'job_id': 1234, 'total_bytes_processed': 1024}]
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    @patch('src.job.data_job.ProcessPoolExecutor', new=ThreadPoolExecutor)
+    def test_parallel_parse(self, work_directory):
+        """Test parsing staged batches with a worker pool."""
+        with work_directory(parse_workers=2), \
+                patch('src.job.data_job.parse_batch_worker') as worker:
+            dj = DataJob()
+            worker.side_effect = lambda index, ecosystem, object_key: (
+                {'pck-{}'.format(ecosystem): index}, {'hits': index, 'misses': 1}, [])
+            dj._parse()
+
+        assert worker.call_count == 3
+        assert dict(dj.collectors['maven'].counter) == {'pck-maven': 1}
+        assert dict(dj.collectors['npm'].counter) == {'pck-npm': 2}
+        assert dict(dj.collectors['pypi'].counter) == {'pck-pypi': 3}
+        assert dj.collectors['pypi'].get_cache_stats() == {'hits': 3, 'misses': 1}
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_parse_prefetch(self, s3_object, work_directory):
+        """Test staged batches are downloaded ahead and parsed in order."""
+        uploads = {}
+
+        def upload_file(src, target):
+            with open(src, 'rb') as fp:
+                uploads[target] = fp.read()
+
+        def download_file(src, target):
+            with open(target, 'wb') as fp:
+                fp.write(uploads[src])
+
+        with work_directory(parse_prefetch_depth=2) as work_dir:
+            dj = DataJob()
+            dj.data_store.upload_file.side_effect = upload_file
+            dj.data_store.download_file.side_effect = download_file
+            dj._get_big_query_data()
+
+            with patch.object(dj.data_store, 'list_bucket_objects',
+                              return_value=[s3_object(key) for key in sorted(uploads)]):
+                dj._parse()
+
+            assert sorted(os.listdir(work_dir)) == ['maven', 'npm', 'pypi']
+
+        assert dj.data_store.download_file.call_count == 3
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
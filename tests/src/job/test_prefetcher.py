@@ -0,0 +1,77 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test background batch prefetcher."""
+import time
+import threading
+import pytest
+from collections import namedtuple
+from unittest.mock import patch
+from src.job.prefetcher import BatchPrefetcher
+
+DiskUsage = namedtuple('DiskUsage', ['total', 'used', 'free'])
+
+
+class TestBatchPrefetcher:
+    """Batch prefetcher test cases."""
+
+    def test_prefetch(self):
+        """Test next batches are downloaded while current one is parsed."""
+        started = {1: threading.Event(), 2: threading.Event(), 3: threading.Event()}
+
+        def download(batch):
+            started[batch].set()
+            return 'path/{}'.format(batch)
+
+        prefetcher = BatchPrefetcher(download, [1, 2, 3], {}, 2, '.')
+        fetched = []
+        for batch, path in prefetcher:
+            if batch == 1:
+                # Both batches ahead are requested before first one is handed out
+                assert started[2].wait(5) and started[3].wait(5)
+            fetched.append((batch, path))
+
+        assert fetched == [(1, 'path/1'), (2, 'path/2'), (3, 'path/3')]
+
+    def test_prefetch_disk_space(self):
+        """Test nothing is fetched ahead when disk cannot hold the next batch."""
+        yielded = []
+        fetched_after = {}
+
+        def download(batch):
+            fetched_after[batch] = list(yielded)
+            if batch == 1:
+                time.sleep(0.2)
+            return batch
+
+        with patch('src.job.prefetcher.disk_usage', return_value=DiskUsage(100, 0, 100)):
+            prefetcher = BatchPrefetcher(download, [1, 2], {1: 60, 2: 60}, 2, '.')
+            for batch, _ in prefetcher:
+                yielded.append(batch)
+
+        # Batch 2 waits till batch 1 download no longer reserves the space
+        assert yielded == [1, 2]
+        assert fetched_after == {1: [], 2: [1]}
+
+    def test_prefetch_error(self):
+        """Test download error is raised for its batch."""
+        def download(batch):
+            raise Exception('download failed')
+
+        prefetcher = BatchPrefetcher(download, [1], {}, 1, '.')
+        with pytest.raises(Exception) as e:
+            list(prefetcher)
+        assert str(e.value) == 'download failed'
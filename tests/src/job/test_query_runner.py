@@ -0,0 +1,140 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test queries of data job."""
+from unittest import mock
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+from src.job.data_job import DataJob
+
+
+class TestQueryRunner:
+    """Unit test cases for queries run by data job."""
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_concurrent_ecosystem_queries(self, ecosystem_bigquery):
+        """Test every ecosystem is queried and processed by its own worker."""
+        dj = DataJob(direct=True)
+
+        with patch.object(SETTINGS, 'bigquery_concurrent_ecosystems', True):
+            dj.run()
+
+        assert len(ecosystem_bigquery.queries) == 3
+        ecosystems = sorted(stats['ecosystem'] for stats in dj.queries.query_stats)
+        assert ecosystems == ['maven', 'npm', 'pypi']
+        for manifest in ['pom.xml', 'package.json', 'requirements.txt']:
+            assert len([q for q in ecosystem_bigquery.queries if manifest in q]) == 1
+
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston, xml2object': 1}
+        assert dj.ecosystemContentData['npm']['count'] == 1
+        assert dj.ecosystemContentData['maven']['count'] == 1
+        assert dj.ecosystemContentData['pypi']['count'] == 1
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_npm_sql_extraction(self):
+        """Test npm dependencies extracted in SQL are collected without parsing."""
+        dj = DataJob()
+        rows = [
+            {'id': 'a1', 'path': 'a/package.json', 'content': None, 'extracted': True,
+             'dependencies': '{"request":"2.0.0","winston":"1.0.0"}'},
+            {'id': 'b2', 'path': 'b/package.json', 'content': '{"dependencies": {"ejs": "1",}}',
+             'extracted': False, 'dependencies': None},
+        ]
+
+        with patch.object(SETTINGS, 'npm_sql_extraction', True):
+            assert 'AS extracted' in dj.queries.get_query()
+            assert 'AS extracted' not in dj.queries.get_query(ecosystem='pypi')
+
+        with patch.object(dj.rows, '_process_manifest') as process_manifest:
+            for index, row in enumerate(rows, 1):
+                dj.rows.process(row, index, 0)
+
+        # Invalid json is left to the collector
+        process_manifest.assert_called_once_with('npm', 'b/package.json', rows[1]['content'],
+                                                 'b2')
+        npm_data = dict(dj.collectors['npm'].counter.most_common())
+        assert npm_data == {'request, winston': 1}
+        assert dj.ecosystemContentData['npm']['count'] == 2
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_dry_run(self):
+        """Test dry run estimates combined and per ecosystem queries."""
+        dj = DataJob()
+        with patch.object(dj, '_get_big_query_data') as get_data:
+            assert dj.dry_run() == {'all': 2048, 'maven': 1024, 'npm': 2048, 'pypi': 1024}
+            get_data.assert_not_called()
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_incremental_extraction(self):
+        """Test only unseen blobs are queried and counts are added to existing data."""
+        with patch.object(SETTINGS, 'incremental_extraction', True), \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch('src.job.data_job.BlobWatermark') as watermark_class:
+            watermark = watermark_class.return_value
+            watermark.get_seen_ids.return_value = b'ids'
+            dj = DataJob(direct=True)
+
+            with patch.object(dj.queries, 'get_query', wraps=dj.queries.get_query) as query, \
+                    patch.object(dj.data_store, 'update') as update:
+                dj.run()
+
+        query.assert_called_once_with('project.dataset.seen_blob_ids', cached_ids_table=None)
+        assert 'seen.id IS NULL' in dj.queries.get_query('project.dataset.seen_blob_ids')
+        assert 'seen.id IS NULL' not in dj.queries.get_query()
+        assert update.call_args[1]['additive'] is True
+        assert watermark.add.call_count == 5
+        watermark.save.assert_called_once_with()
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_incremental_extraction_without_dataset(self):
+        """Test incremental extraction needs a dataset for the watermark table."""
+        with patch.object(SETTINGS, 'incremental_extraction', True):
+            with pytest.raises(Exception) as e:
+                DataJob()
+
+        assert str(e.value) == 'BIGQUERY_DATASET is required for incremental extraction'
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_materialized_result(self, bigquery):
+        """Test query result is materialized into a table and reused while it is fresh."""
+        with patch.object(SETTINGS, 'bigquery_result_table', 'manifests'), \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch.object(bigquery, 'read_table', create=True,
+                             side_effect=[False, True]) as read_table, \
+                patch.object(bigquery, 'run', return_value=1234) as run:
+            for _ in range(2):
+                dj = DataJob(direct=True)
+                with patch.object(dj.data_store, 'update') as update:
+                    dj.run()
+                assert list(update.call_args[1]['data']['npm']) == [
+                    ('request, winston, xml2object', 1)]
+            assert dj.queries.get_result_table('npm') == 'project.dataset.manifests_npm'
+
+        query = dj.queries.get_query()
+        assert read_table.call_args_list == [mock.call('project.dataset.manifests', query)] * 2
+        run.assert_called_once_with(query, destination='project.dataset.manifests',
+                                    expiration_hours=72)
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_materialized_result_without_dataset(self):
+        """Test materialized query result needs a dataset for its table."""
+        with patch.object(SETTINGS, 'bigquery_result_table', 'manifests'):
+            with pytest.raises(Exception) as e:
+                DataJob()
+
+        assert str(e.value) == 'BIGQUERY_DATASET is required for materialized query results'
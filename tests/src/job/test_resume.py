@@ -0,0 +1,144 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test resume of data job from its checkpoint."""
+import gzip
+from unittest import mock
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+from src.job.data_job import DataJob
+from src.datastore.watermark import S3_WATERMARK_FILENAME as WATERMARK
+
+
+class TestResume:
+    """Unit test cases for checkpoint and resume of staged runs."""
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    @patch('src.job.batch_stager.CONTENT_BATCH_SIZE', 1)
+    def test_checkpoint_resume(self, s3_object, work_directory):
+        """Test restarted run skips batches uploaded and merged before it was interrupted."""
+        objects = {}
+        uploads = []
+
+        def upload_file(src, target):
+            if 'pypi' in target and not uploads.count('failed'):
+                uploads.append('failed')
+                raise Exception('Pod killed')
+            uploads.append(target)
+            with open(src, 'rb') as fp:
+                objects[target] = fp.read()
+
+        def download_file(src, target):
+            with open(target, 'wb') as fp:
+                fp.write(objects[src])
+
+        with work_directory(checkpoint_enabled=True):
+            dj = DataJob()
+            data_store = dj.data_store
+            data_store.upload_file.side_effect = upload_file
+            data_store.download_file.side_effect = download_file
+            data_store.read_object.side_effect = objects.get
+            data_store.write_object.side_effect = objects.__setitem__
+            data_store.delete_object.side_effect = objects.pop
+            data_store.list_bucket_objects = lambda prefix=None: [
+                s3_object(key) for key in sorted(objects) if key.startswith(prefix)]
+
+            with pytest.raises(Exception) as e:
+                dj.run()
+            assert str(e.value) == 'Pod killed'
+
+            dj = DataJob()
+            with patch.object(data_store, 'update') as update:
+                dj.run()
+            data = update.call_args[1]['data']
+            # Staged batches are kept on restart, removed only once run is done
+            assert data_store.s3_delete_folder.call_count == 2
+
+        assert uploads == [
+            'big-query-data/manifest-data-zip/maven/1_maven.zip',
+            'big-query-data/manifest-data-zip/npm/1_npm.zip',
+            'failed',
+            'big-query-data/manifest-data-zip/pypi/1_pypi.zip',
+        ]
+        assert list(data['npm']) == [('request, winston, xml2object', 1)]
+        with open('tests/data/package.json', 'r') as f:
+            assert dj.ecosystemContentData['npm'] == {'size': len(f.read()), 'count': 1}
+        assert not [key for key in objects if key.startswith('big-query-data/checkpoint/')]
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_checkpoint_resume_after_collated_update(self, s3_object, work_directory):
+        """Test run restarted after the collated update only finishes, counts are added once."""
+        objects = {WATERMARK: gzip.compress(b'a1\n')}
+
+        def download_file(src, target):
+            with open(target, 'wb') as fp:
+                fp.write(objects[src])
+
+        with work_directory(checkpoint_enabled=True, incremental_extraction=True,
+                            bigquery_dataset='project.dataset'):
+            dj = DataJob()
+            data_store = dj.data_store
+            data_store.upload_file.side_effect = lambda src, target: objects.__setitem__(
+                target, open(src, 'rb').read())
+            data_store.download_file.side_effect = download_file
+            data_store.read_object.side_effect = objects.get
+            data_store.write_object.side_effect = objects.__setitem__
+            data_store.delete_object.side_effect = objects.pop
+            data_store.list_bucket_objects = lambda prefix=None: [
+                s3_object(key) for key in sorted(objects) if key.startswith(prefix)]
+
+            with patch.object(data_store, 'update') as update, \
+                    patch.object(dj.watermark, 'save', side_effect=Exception('Pod killed')), \
+                    pytest.raises(Exception) as e:
+                dj.run()
+            assert str(e.value) == 'Pod killed'
+            update.assert_called_once_with(data=mock.ANY, filename=mock.ANY, additive=True)
+
+            dj = DataJob()
+            with patch.object(data_store, 'update') as update:
+                dj.run()
+
+        update.assert_not_called()
+        assert gzip.decompress(objects[WATERMARK]) == b'a1\n'
+        assert not [key for key in objects if key.startswith('big-query-data/checkpoint/')]
+        # Staged batches are removed at start, before the crash and again on restart
+        assert data_store.s3_delete_folder.call_count == 3
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_checkpoint_deltas(self):
+        """Test every checkpoint step saves only the counts added since the previous one."""
+        with patch.object(SETTINGS, 'checkpoint_enabled', True):
+            dj = DataJob()
+        resume = dj.resume
+        resume.checkpoint = mock.Mock()
+        collector = dj.collectors['npm']
+
+        collector.collect(('ejs',))
+        resume.save_progress(resume.get_progress('npm', 2))
+        collector.collect(('ejs',))
+        collector.collect(('request',))
+        resume.set_parsed('npm', 'npm/1_npm.zip')
+        collector.add_counts({'winston': 4})
+        resume.set_parsed('npm', 'npm/2_npm.zip', {'winston': 4})
+
+        resume.checkpoint.set_ecosystem.assert_called_once_with(
+            'npm', 2, 0, {'size': 0, 'count': 0}, {'ejs': 1})
+        assert resume.checkpoint.set_parsed.call_args_list == [
+            mock.call('npm/1_npm.zip', 'npm', {'ejs': 1, 'request': 1}),
+            mock.call('npm/2_npm.zip', 'npm', {'winston': 4}),
+        ]
+        assert dict(collector.counter) == {'ejs': 2, 'request': 1, 'winston': 4}
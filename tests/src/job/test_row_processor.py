@@ -0,0 +1,101 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test processing of query result rows."""
+from unittest import mock
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+from src.job.data_job import DataJob
+
+
+TABLE = 'project.dataset.cached_blob_ids_maven_v1_npm_v1_pypi_v1'
+
+
+class TestRowProcessor:
+    """Unit test cases for processing of query result rows."""
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_process_row(self):
+        """Test result rows are classified per ecosystem, rows without content are skipped."""
+        dj = DataJob(direct=True)
+        dj.rows.watermark = mock.Mock()
+        rows = [
+            {'id': 'a1', 'path': 'a/pom.xml', 'content': '<project/>'},
+            {'id': 'b2', 'path': None, 'content': '{}'},
+            {'id': 'c3', 'path': 'b/package.json', 'content': '{}'},
+            {'id': 'd4', 'path': 'c/setup.py', 'content': 'setup()'},
+            {'id': 'e5', 'path': 'd/requirements.txt', 'content': None},
+        ]
+
+        with patch.object(dj.rows, '_process_manifest') as process_manifest:
+            for index, row in enumerate(rows, 1):
+                dj.rows.process(row, index, 0)
+
+        assert process_manifest.call_args_list == [
+            mock.call('maven', 'a/pom.xml', '<project/>', 'a1'),
+            mock.call('npm', 'b/package.json', '{}', 'c3'),
+        ]
+        assert dj.rows.watermark.add.call_args_list == [mock.call(row['id']) for row in rows]
+        assert dj.ecosystemContentData['maven'] == {'size': 10, 'count': 1}
+        assert dj.ecosystemContentData['npm'] == {'size': 2, 'count': 1}
+        assert dj.ecosystemContentData['pypi'] == {'size': 0, 'count': 0}
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_big_query_direct_processing_with_blob_cache(self, bigquery):
+        """Test content of cached blobs is not queried and they are not parsed again."""
+        rows = bigquery().get_result()
+        rows[1] = {'id': 'c3', 'path': 'tests/data/package.json', 'content': None,
+                   'cached': True}
+        # Listed as cached but missing in the cache, row is skipped
+        rows.append({'id': 'f6', 'path': 'a/pom.xml', 'content': None, 'cached': True})
+
+        with patch.object(SETTINGS, 'blob_cache_enabled', True), \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch.object(bigquery, 'get_result', return_value=rows), \
+                patch.object(bigquery, 'load_ids', create=True) as load_ids, \
+                patch('src.job.data_job.ParseCache') as parse_cache_class:
+            parse_cache = parse_cache_class.return_value
+            parse_cache.get_cached_ids.return_value = b'ids'
+            parse_cache.get_version.return_value = 'maven_v1_npm_v1_pypi_v1'
+            parse_cache.get.side_effect = lambda ecosystem, blob_id: (
+                ('cached-pck',) if ecosystem == 'npm' else None)
+            dj = DataJob(direct=True)
+
+            with patch.object(dj.queries, 'get_query', wraps=dj.queries.get_query) as query, \
+                    patch.object(dj.collectors['npm'], 'get_packages') as npm_parser:
+                dj.run()
+                npm_parser.assert_not_called()
+
+        parse_cache_class.assert_called_once_with(mock.ANY, {'maven': 1, 'npm': 1, 'pypi': 1}, 16)
+        load_ids.assert_called_once_with(TABLE, mock.ANY)
+        query.assert_called_once_with(None, cached_ids_table=TABLE)
+        assert 'IF(cached.id IS NOT NULL, NULL, con.content) AS content' in dj.queries.get_query(
+            cached_ids_table=TABLE)
+        assert dict(dj.collectors['npm'].counter) == {'cached-pck': 1}
+        assert dj.ecosystemContentData['npm'] == {'size': 0, 'count': 1}
+        assert dj.ecosystemContentData['maven']['count'] == 1
+        assert parse_cache.update.call_count == 2
+        parse_cache.save.assert_called_once_with()
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_blob_cache_without_dataset(self):
+        """Test blob cache needs a dataset to load cached blob ids into."""
+        with patch.object(SETTINGS, 'blob_cache_enabled', True), \
+                pytest.raises(Exception) as e:
+            DataJob(direct=True)
+
+        assert str(e.value) == 'BIGQUERY_DATASET is required for blob cache'
@@ -0,0 +1,161 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test sharded runs of data job."""
+from unittest import mock
+from unittest.mock import patch
+import pytest
+from src.config.settings import SETTINGS
+from src.job.data_job import DataJob
+from src.job.shard import ShardSnapshots
+from src.collector.snapshot import dump_snapshot, load_snapshot
+
+
+class TestShard:
+    """Unit test cases for sharded runs and their reduce."""
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_sharded_run(self, bigquery):
+        """Test each shard reads its slice of the result and saves partial counts."""
+        rows = bigquery().get_result()
+        objects = {}
+
+        def get_result(start_index=0, max_results=None, fields=None):
+            return rows[start_index:start_index + max_results]
+
+        with patch.object(bigquery, 'get_result', side_effect=get_result), \
+                patch.object(bigquery, 'get_shard_range', create=True,
+                             side_effect=[(0, 2), (2, 3)]) as get_shard_range, \
+                patch.object(bigquery, 'run') as run, \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch.object(SETTINGS, 'bigquery_result_table', 'manifests'):
+            for shard_index in range(2):
+                dj = DataJob(direct=True, shard_index=shard_index, shard_count=2)
+                dj.data_store.write_object.side_effect = objects.__setitem__
+                with patch.object(dj.data_store, 'update') as update:
+                    dj.run()
+                update.assert_not_called()
+
+        run.assert_not_called()
+        assert get_shard_range.call_args_list == [mock.call(0, 2), mock.call(1, 2)]
+        first, second = [load_snapshot(objects['big-query-data/shards/{}_of_2.snapshot'.format(
+            i)]) for i in range(2)]
+        assert first == {'maven': {}, 'npm': {'request, winston, xml2object': 1}, 'pypi': {}}
+        assert second['npm'] == {}
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_sharded_run_without_materialized_result(self, bigquery):
+        """Test shards never run the query themselves."""
+        with patch.object(bigquery, 'read_table', create=True, return_value=False), \
+                patch.object(bigquery, 'run') as run, \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch.object(SETTINGS, 'bigquery_result_table', 'manifests'), \
+                pytest.raises(Exception) as e:
+            DataJob(direct=True, shard_index=0, shard_count=2).run()
+
+        run.assert_not_called()
+        assert str(e.value) == ('Result of all query is not materialized in '
+                                'project.dataset.manifests, run with --materialize first')
+
+    @pytest.mark.usefixtures('persistence_store')
+    def test_materialize(self, bigquery):
+        """Test queries are run into result tables unless a fresh result is there."""
+        with patch.object(bigquery, 'read_table', create=True,
+                          side_effect=[True, False, False]), \
+                patch.object(bigquery, 'run', return_value=1234) as run, \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                patch.object(SETTINGS, 'bigquery_result_table', 'manifests'), \
+                patch.object(SETTINGS, 'bigquery_concurrent_ecosystems', True):
+            dj = DataJob(direct=True)
+            dj.materialize()
+
+        assert [c[1]['destination'] for c in run.call_args_list] == [
+            'project.dataset.manifests_npm', 'project.dataset.manifests_pypi']
+        assert [stats['ecosystem'] for stats in dj.queries.query_stats] == ['npm', 'pypi']
+
+        with pytest.raises(Exception) as e:
+            dj.materialize()
+
+        assert str(e.value) == 'BIGQUERY_RESULT_TABLE is required to materialize query results'
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_reduce(self):
+        """Test partial data of all shards is merged into collated file and removed."""
+        objects = {
+            'big-query-data/shards/0_of_2.snapshot': dump_snapshot({'npm': {'ejs': 1, 'a': 2}}),
+            'big-query-data/shards/1_of_2.snapshot': dump_snapshot({'npm': {'a': 1},
+                                                                    'pypi': {'flask': 1}}),
+        }
+        dj = DataJob()
+        dj.data_store.read_object.side_effect = objects.get
+        dj.data_store.delete_object.side_effect = objects.pop
+        with patch.object(dj.data_store, 'update') as update:
+            dj.reduce(2)
+
+        data = update.call_args[1]['data']
+        assert list(data['npm']) == [('a', 3), ('ejs', 1)]
+        assert list(data['pypi']) == [('flask', 1)]
+        assert list(data['maven']) == []
+        assert objects == {}
+
+        with pytest.raises(Exception) as e:
+            dj.reduce(2)
+
+        assert str(e.value) == 'Missing partial data big-query-data/shards/0_of_2.snapshot'
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_reduce_top_k(self):
+        """Test set ranked K+1 in every shard is the top set of the merged counts."""
+        objects = {}
+        with patch.object(SETTINGS, 'collector_top_k', 1):
+            for shard_index in range(2):
+                dj = DataJob()
+                dj.data_store.write_object.side_effect = objects.__setitem__
+                dj.collectors['npm'].add_counts({'ejs{}'.format(shard_index): 5, 'a': 4})
+                ShardSnapshots(dj.data_store, 2).save(shard_index, dj.collectors)
+
+            dj = DataJob()
+            dj.data_store.read_object.side_effect = objects.get
+            with patch.object(dj.data_store, 'update') as update:
+                dj.reduce(2)
+
+        assert list(update.call_args[1]['data']['npm']) == [('a', 8)]
+
+    @pytest.mark.usefixtures('bigquery', 'persistence_store')
+    def test_sharded_run_with_staging(self):
+        """Test shards can not share staged batches."""
+        with pytest.raises(Exception) as e:
+            DataJob(shard_index=1, shard_count=2)
+
+        assert str(e.value) == 'Sharded run requires direct mode without staging'
+
+        with pytest.raises(Exception) as e:
+            DataJob(direct=True, shard_index=2, shard_count=2)
+
+        assert str(e.value) == 'Shard index 2 out of range of 2 shards'
+
+        with pytest.raises(Exception) as e:
+            DataJob(direct=True, shard_index=1, shard_count=2)
+
+        assert str(e.value) == \
+            'Sharded run requires BIGQUERY_RESULT_TABLE materialized beforehand'
+
+        with patch.object(SETTINGS, 'blob_cache_enabled', True), \
+                patch.object(SETTINGS, 'bigquery_dataset', 'project.dataset'), \
+                pytest.raises(Exception) as e:
+            DataJob(direct=True, shard_index=1, shard_count=2)
+
+        assert str(e.value) == 'Sharded run does not support blob cache'
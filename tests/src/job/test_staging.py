@@ -0,0 +1,46 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test packed staging format."""
+import io
+from src.job.staging import PackedBatchWriter, read_packed_batch
+
+
+class TestPackedBatch:
+    """Packed batch test cases."""
+
+    def test_write_and_read(self):
+        """Test records are read back in the order they were written."""
+        fileobj = io.BytesIO()
+        writer = PackedBatchWriter(fileobj)
+        writer.write('repo/package.json', '{\n  "name": "ü"\n}', 'a1b2')
+        writer.write('repo/sub/package.json', '')
+        writer.close()
+
+        assert writer.count == 2
+        assert list(read_packed_batch(io.BytesIO(fileobj.getvalue()))) == [
+            {'id': 'a1b2', 'path': 'repo/package.json', 'content': '{\n  "name": "ü"\n}'},
+            {'id': None, 'path': 'repo/sub/package.json', 'content': ''},
+        ]
+
+    def test_write_and_read_file(self, tmpdir):
+        """Test packed batch on local file."""
+        filename = str(tmpdir.join('1_npm.jsonl.gz'))
+        writer = PackedBatchWriter(filename)
+        writer.write('package.json', '{}')
+        writer.close()
+
+        assert [r['path'] for r in read_packed_batch(filename)] == ['package.json']
@@ -0,0 +1,77 @@
+# Copyright © 2020 Red Hat Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Dharmendra G Patel <dhpatel@redhat.com>
+#
+"""Test background batch uploader."""
+import time
+import threading
+import pytest
+from src.job.uploader import BatchUploader
+
+
+class TestBatchUploader:
+    """Batch uploader test cases."""
+
+    def test_upload(self):
+        """Test all submitted uploads run before join returns."""
+        uploaded = []
+        uploader = BatchUploader(2)
+        for index in range(5):
+            uploader.submit(uploaded.append, index)
+        uploader.join()
+
+        assert uploaded == [0, 1, 2, 3, 4]
+
+    def test_max_inflight(self):
+        """Test submit blocks while too many uploads are in flight."""
+        release = threading.Event()
+        uploader = BatchUploader(2)
+        uploader.submit(release.wait)
+        uploader.submit(time.sleep, 0)
+
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: (uploader.submit(time.sleep, 0),
+                                                  submitted.set()))
+        thread.start()
+        assert not submitted.wait(0.2)
+
+        release.set()
+        assert submitted.wait(5)
+        thread.join()
+        uploader.join()
+
+    def test_upload_error(self):
+        """Test failed upload is raised to the caller."""
+        def fail():
+            raise Exception('upload failed')
+
+        uploader = BatchUploader(1)
+        uploader.submit(fail)
+        with pytest.raises(Exception) as e:
+            uploader.join()
+
+        assert str(e.value) == 'upload failed'
+
+    def test_upload_error_on_submit(self):
+        """Test next submit raises error of a failed upload."""
+        def fail():
+            raise Exception('upload failed')
+
+        uploader = BatchUploader(1)
+        uploader.submit(fail)
+        with pytest.raises(Exception) as e:
+            uploader.submit(time.sleep, 0)
+
+        assert str(e.value) == 'upload failed'
@@ -15,10 +15,12 @@
 # Author: Dharmendra G Patel <dhpatel@redhat.com>
 #
 """Test main class."""
+import sys
 import time
 import unittest
 from unittest import mock
 from unittest.mock import patch
+from src.config.settings import SETTINGS
 from src.main import main
 
 
@@ -37,6 +39,54 @@ class TestMain(unittest.TestCase):
     def test_main(self, _mdp):
         """Execute main function to trigger big query data update."""
         try:
-            main()
+            main([])
         except Exception:
             assert False, 'Exception raised'
+
+    @patch('src.main.DataJob', new_callable=MockDataJob)
+    def test_main_direct(self, _mdp):
+        """Execute main function in direct pipeline mode."""
+        main(['--direct', '--stage'])
+        _mdp.assert_called_once_with(direct=True, stage=True, shard_index=0, shard_count=1)
+
+    @patch('src.main.DataJob')
+    def test_main_shard(self, _mdp):
+        """Execute main function to read one shard of the query result."""
+        main(['--direct', '--shard-index', '2', '--shard-count', '4'])
+        _mdp.assert_called_once_with(direct=True, stage=False, shard_index=2, shard_count=4)
+        _mdp.return_value.run.assert_called_once_with()
+
+    @patch('src.main.DataJob')
+    def test_main_shard_from_env(self, _mdp):
+        """Execute main function as a pod of an Indexed Job, shard is read from settings."""
+        with patch.object(SETTINGS, 'shard_index', 3), patch.object(SETTINGS, 'shard_count', 4):
+            main(['--direct'])
+        _mdp.assert_called_once_with(direct=True, stage=False, shard_index=3, shard_count=4)
+
+    @patch('src.main.DataJob')
+    def test_main_command_line(self, _mdp):
+        """Execute main function with options of the command line."""
+        with patch.object(sys, 'argv', ['main.py', '--direct']):
+            main()
+        _mdp.assert_called_once_with(direct=True, stage=False, shard_index=0, shard_count=1)
+
+    @patch('src.main.DataJob')
+    def test_main_materialize(self, _mdp):
+        """Execute main function to materialize query result for shards."""
+        main(['--materialize'])
+        _mdp.return_value.materialize.assert_called_once_with()
+        _mdp.return_value.run.assert_not_called()
+
+    @patch('src.main.DataJob')
+    def test_main_reduce(self, _mdp):
+        """Execute main function to merge partial data of shards."""
+        main(['--reduce', '--shard-count', '4'])
+        _mdp.return_value.reduce.assert_called_once_with(4)
+        _mdp.return_value.run.assert_not_called()
+
+    @patch('src.main.DataJob')
+    def test_main_dry_run(self, _mdp):
+        """Execute main function to only estimate query cost."""
+        main(['--dry-run'])
+        _mdp.return_value.dry_run.assert_called_once_with()
+        _mdp.return_value.run.assert_not_called()